@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTML渲染吞吐与峰值内存对比（逐元素 parse_* 递归实现 vs HtmlRenderer）
+
+合成约10万节点的文档，分别测量:
+  - body渲染耗时（取多次最优）
+  - tracemalloc统计的渲染峰值内存
+  - 图片URL收集耗时
+深度嵌套的文档用于验证显式栈遍历不受递归深度限制。
+
+用法:
+    python benchmarks/bench_html_renderer.py
+"""
+
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+REPEAT = 5
+
+
+# ---------- 旧实现（用于对比）----------
+def legacy_parse_span(span_elem: List[Any]) -> str:
+    if not isinstance(span_elem, list) or len(span_elem) < 2 or span_elem[0] != 'span':
+        return ''
+    attrs = span_elem[1] if len(span_elem) > 1 else {}
+    html_parts = []
+    for i in range(2, len(span_elem)):
+        child = span_elem[i]
+        if isinstance(child, str):
+            text = child.replace('\n', '<br>')
+            if text:
+                style = server.parse_text_style(attrs)
+                html_parts.append(f'<span style="{style}">{text}</span>' if style else text)
+        elif isinstance(child, list):
+            html_parts.append(legacy_parse_span(child))
+    return ''.join(html_parts)
+
+
+def legacy_parse_paragraph(para_elem: List[Any], image_url_map: Optional[Dict[str, str]] = None) -> str:
+    if not isinstance(para_elem, list) or len(para_elem) < 2:
+        return ''
+    
+    tag = para_elem[0]
+    
+    if tag == 'p':
+        content_parts = []
+        for i in range(2, len(para_elem)):
+            child = para_elem[i]
+            if isinstance(child, list) and len(child) > 0:
+                if child[0] == 'img':
+                    content_parts.append(server.parse_image(child, image_url_map))
+                else:
+                    content_parts.append(legacy_parse_span(child))
+            elif isinstance(child, str):
+                content_parts.append(child)
+        
+        paragraph_html = ''.join(content_parts)
+        if not paragraph_html.strip():
+            paragraph_html = '&nbsp;'
+        
+        return f'<p>{paragraph_html}</p>'
+    
+    if tag == 'img':
+        return server.parse_image(para_elem, image_url_map)
+    
+    return ''
+
+
+def legacy_parse_table(table_elem: List[Any]) -> str:
+    if not isinstance(table_elem, list) or len(table_elem) < 2 or table_elem[0] != 'table':
+        return ''
+    
+    rows_html = []
+    for i in range(2, len(table_elem)):
+        child = table_elem[i]
+        if isinstance(child, list) and len(child) > 0 and child[0] == 'tr':
+            row_html = legacy_parse_table_row(child)
+            if row_html:
+                rows_html.append(row_html)
+    
+    if not rows_html:
+        return ''
+    
+    return f'''<div class="table-container">
+    <table class="doc-table">
+        {''.join(rows_html)}
+    </table>
+</div>'''
+
+
+def legacy_parse_table_row(tr_elem: List[Any]) -> str:
+    if not isinstance(tr_elem, list) or len(tr_elem) < 2 or tr_elem[0] != 'tr':
+        return ''
+    
+    cells_html = []
+    for i in range(2, len(tr_elem)):
+        child = tr_elem[i]
+        if isinstance(child, list) and len(child) > 0 and child[0] == 'tc':
+            cell_html = legacy_parse_table_cell(child)
+            if cell_html:
+                cells_html.append(cell_html)
+    
+    if not cells_html:
+        return ''
+    
+    return f'<tr>{"".join(cells_html)}</tr>'
+
+
+def legacy_parse_table_cell(tc_elem: List[Any]) -> str:
+    if not isinstance(tc_elem, list) or len(tc_elem) < 2 or tc_elem[0] != 'tc':
+        return ''
+    
+    attrs = tc_elem[1] if len(tc_elem) > 1 else {}
+    row_span = attrs.get('rowSpan', 1)
+    col_span = attrs.get('colSpan', 1)
+    fill = attrs.get('fill', '')
+    v_align = attrs.get('vAlign', 'top')
+    
+    styles = []
+    if fill:
+        styles.append(f'background-color: {fill}')
+    if v_align:
+        styles.append(f'vertical-align: {v_align}')
+    
+    style_str = f' style="{"; ".join(styles)}"' if styles else ''
+    
+    content_parts = []
+    for i in range(2, len(tc_elem)):
+        child = tc_elem[i]
+        if isinstance(child, list) and len(child) > 0 and child[0] == 'p':
+            p_content = []
+            for j in range(2, len(child)):
+                p_child = child[j]
+                if isinstance(p_child, list):
+                    p_content.append(legacy_parse_span(p_child))
+                elif isinstance(p_child, str):
+                    p_content.append(p_child)
+            content_parts.append(''.join(p_content))
+    
+    cell_content = '<br>'.join(content_parts) if content_parts else '&nbsp;'
+    
+    rowspan_attr = f' rowspan="{row_span}"' if row_span > 1 else ''
+    colspan_attr = f' colspan="{col_span}"' if col_span > 1 else ''
+    
+    return f'<td{rowspan_attr}{colspan_attr}{style_str}>{cell_content}</td>'
+
+
+def legacy_render_body(body: List[Any], image_url_map: Optional[Dict[str, str]]) -> str:
+    html_parts = []
+    for item in body[2:]:
+        if not isinstance(item, list) or len(item) == 0:
+            continue
+        parser_map = {
+            'table': legacy_parse_table,
+            'code': server.parse_code_block,
+            'p': lambda x: legacy_parse_paragraph(x, image_url_map),
+            'img': lambda x: server.parse_image(x, image_url_map),
+        }
+        parser = parser_map.get(item[0], lambda x: legacy_parse_paragraph(x, image_url_map))
+        parsed_html = parser(item)
+        if parsed_html:
+            html_parts.append(parsed_html)
+    return '\n'.join(html_parts)
+
+
+def legacy_collect_image_urls(body: List[Any]) -> set:
+    image_urls = set()
+
+    def _traverse(elem):
+        if isinstance(elem, list) and len(elem) > 0:
+            if elem[0] == 'img' and len(elem) > 1:
+                attrs = elem[1] if isinstance(elem[1], dict) else {}
+                src = attrs.get('src', '')
+                if src:
+                    image_urls.add(src if src.startswith('http') else f'{server.BASE_URL}{src}')
+            else:
+                for item in elem:
+                    _traverse(item)
+        elif isinstance(elem, dict):
+            for value in elem.values():
+                _traverse(value)
+
+    _traverse(body)
+    return image_urls
+
+
+# ---------- 合成文档 ----------
+def build_flat_body(node_target: int) -> List[Any]:
+    """段落、表格、代码块和图片混合的扁平文档"""
+    body: List[Any] = ['root', {}]
+    nodes = 0
+    i = 0
+    while nodes < node_target:
+        if i % 20 == 0:
+            rows = [['tr', {}] + [['tc', {'rowSpan': 1}, ['p', {}, ['span', {}, f'单元格 {i}-{c}']]] for c in range(4)]
+                    for _ in range(3)]
+            body.append(['table', {}] + rows)
+            nodes += 1 + 3 * (1 + 4 * 3)
+        elif i % 13 == 0:
+            body.append(['code', {'syntax': 'text/x-python', 'code': f'print({i})\n' * 3}])
+            nodes += 1
+        elif i % 17 == 0:
+            body.append(['p', {}, ['img', {'src': f'/core/api/resources/img/{i}.png', 'name': 'img'}]])
+            nodes += 2
+        else:
+            body.append(['p', {}, ['span', {'bold': i % 2 == 0}, f'第{i}段 ', ['span', {'color': '#333'}, 'text\n']]])
+            nodes += 3
+        i += 1
+    return body
+
+
+def build_nested_body(depth: int) -> List[Any]:
+    """单个段落内span嵌套depth层"""
+    span: List[Any] = ['span', {}, 'leaf']
+    for level in range(depth):
+        span = ['span', {'bold': level % 2 == 0}, 'x', span]
+    return ['root', {}, ['p', {}, span]]
+
+
+def measure(func, *args) -> Dict[str, Any]:
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        try:
+            func(*args)
+        except RecursionError:
+            return {"time": None, "peak": None}
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"time": best, "peak": peak}
+
+
+def fmt(result: Dict[str, Any]) -> str:
+    if result["time"] is None:
+        return f"{'RecursionError':>24}"
+    return f"{result['time'] * 1000:>9.1f}ms {result['peak'] / 1024 / 1024:>8.1f}MB"
+
+
+def main() -> None:
+    image_url_map = {f'{server.BASE_URL}/core/api/resources/img/{i}.png': f'images/{i}.png' for i in range(0, 200000, 17)}
+    cases = [
+        ("flat 100k", build_flat_body(100_000)),
+        ("nested 5k", build_nested_body(5_000)),
+    ]
+
+    print(f"{'文档':<12} {'实现':<10} {'渲染耗时':>10} {'峰值内存':>9} {'URL收集':>10}")
+    for label, body in cases:
+        legacy = measure(legacy_render_body, body, image_url_map)
+        legacy_urls = measure(legacy_collect_image_urls, body)
+
+        renderer = measure(lambda b, m: server.HtmlRenderer(m).render_body(b), body, image_url_map)
+        content = {'main': 'm', 'parts': {'m': {'data': {'body': body}}}}
+        urls = measure(server.collect_image_urls, content)
+
+        def url_time(result: Dict[str, Any]) -> str:
+            return f"{'-':>10}" if result["time"] is None else f"{result['time'] * 1000:>8.1f}ms"
+
+        print(f"{label:<12} {'parse_*':<10} {fmt(legacy)} {url_time(legacy_urls)}")
+        print(f"{label:<12} {'renderer':<10} {fmt(renderer)} {url_time(urls)}")
+
+
+if __name__ == "__main__":
+    main()
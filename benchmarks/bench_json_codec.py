@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文档JSON编解码开销对比（标准库 json vs orjson）
+
+模拟单个文档在流水线中的全部JSON处理：
+  解码: /api/document/data 响应、checkpoint.content（二次编码的内容）、mainsite_server_content
+  编码: _save_json_file 写出的 _mainsite.json、_document.json、_content.json（indent=2）
+
+用法:
+    python benchmarks/bench_json_codec.py
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+BLOCK_COUNTS = [500, 5000, 20000]
+REPEAT = 5
+
+
+def build_document(block_count: int):
+    """构造文档数据：返回(接口响应字节, mainsite脚本文本)"""
+    body = ['root', {}]
+    for i in range(block_count):
+        if i % 10 == 0:
+            body.append(['table', {}, ['tr', {}, ['tc', {'rowSpan': 1}, ['p', {}, ['span', {}, f'单元格 {i}']]]]])
+        elif i % 7 == 0:
+            body.append(['code', {'syntax': 'text/x-python', 'code': f'print({i})\n' * 5}])
+        else:
+            body.append(['p', {}, ['span', {'bold': i % 2 == 0, 'color': '#333'}, f'第{i}段落 paragraph text ' * 3]])
+    content = {'main': 'm', 'parts': {'m': {'data': {'body': body}}}}
+    document_data = {
+        'data': {
+            'fileMetaInfo': {'name': '性能测试', 'type': 'adoc'},
+            'documentContent': {'checkpoint': {'content': json.dumps(content, ensure_ascii=False)}},
+        }
+    }
+    mainsite = {'dentryInfo': {'data': {'dentryKey': 'k', 'name': '性能测试'}}, 'data': {'x': list(range(1000))}}
+    return json.dumps(document_data, ensure_ascii=False).encode('utf-8'), json.dumps(mainsite, ensure_ascii=False)
+
+
+def run_pipeline(codec: server.JsonCodec, response_bytes: bytes, mainsite_text: str) -> None:
+    document_data = codec.loads(response_bytes)
+    content = codec.loads(document_data['data']['documentContent']['checkpoint']['content'])
+    mainsite = codec.loads(mainsite_text)
+    codec.dumps(mainsite, pretty=True)
+    codec.dumps(document_data, pretty=True)
+    codec.dumps(content, pretty=True)
+
+
+def timeit(codec: server.JsonCodec, response_bytes: bytes, mainsite_text: str) -> float:
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        run_pipeline(codec, response_bytes, mainsite_text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    codecs = [server.JsonCodec()]
+    if server.ORJSON_AVAILABLE:
+        codecs.append(server.OrjsonCodec())
+    else:
+        print("未安装orjson，仅测试标准库（pip install orjson 后可对比）")
+
+    header = f"{'块数':>8} {'响应大小':>10}" + ''.join(f" {codec.name:>10}" for codec in codecs)
+    print(header)
+    for block_count in BLOCK_COUNTS:
+        response_bytes, mainsite_text = build_document(block_count)
+        timings = [timeit(codec, response_bytes, mainsite_text) for codec in codecs]
+        row = f"{block_count:>8} {len(response_bytes) // 1024:>8}KB" + ''.join(f" {t * 1000:>8.1f}ms" for t in timings)
+        if len(timings) > 1:
+            row += f"  ({timings[0] / timings[1]:.1f}x)"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
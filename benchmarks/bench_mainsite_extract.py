@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+mainsite_server_content 提取性能对比
+
+对比原有的 BeautifulSoup 完整解析与流式正则扫描（MainsiteScriptScanner），
+页面为模拟的文档节点页：大量普通标签和脚本，mainsite_server_content 位于body中部。
+
+用法:
+    python benchmarks/bench_mainsite_extract.py
+"""
+
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import server  # noqa: E402
+
+PAGE_SIZES = [200 * 1024, 1024 * 1024, 4 * 1024 * 1024]
+CHUNK_SIZE = 16 * 1024
+REPEAT = 5
+
+
+def build_page(target_size: int) -> str:
+    """构造接近目标大小的节点页面"""
+    mainsite = {
+        "dentryInfo": {"data": {"dentryKey": "k" * 32, "name": "性能测试文档", "nodeId": "n" * 32}},
+        "data": {"extra": ["字段%d" % i for i in range(2000)]},
+    }
+    block = (
+        '<div class="row"><span class="cell" data-id="{i}">内容 {i}</span>'
+        '<a href="/i/nodes/{i}">link</a></div>\n'
+        '<script>window.__cfg_{i} = {{"a": {i}, "b": "{i}"}};</script>\n'
+    )
+    head = '<!DOCTYPE html><html><head><meta charset="utf-8"><title>t</title></head><body>\n'
+    script = f'<script id="mainsite_server_content" type="application/json">{json.dumps(mainsite, ensure_ascii=False)}</script>\n'
+    blocks = []
+    size = len(head) + len(script)
+    i = 0
+    while size < target_size:
+        part = block.format(i=i)
+        blocks.append(part)
+        size += len(part)
+        i += 1
+    middle = len(blocks) // 2
+    return head + ''.join(blocks[:middle]) + script + ''.join(blocks[middle:]) + '</body></html>'
+
+
+def extract_with_beautifulsoup(html: str) -> dict:
+    """原有实现：完整构建 html.parser 文档树"""
+    soup = BeautifulSoup(html, 'html.parser')
+    script = soup.find('script', {'id': 'mainsite_server_content'})
+    return json.loads(script.string.strip())
+
+
+def extract_with_scanner(html: str) -> dict:
+    """流式实现：按网络块大小逐块feed，找到结束标签即停止"""
+    scanner = server.MainsiteScriptScanner()
+    for start in range(0, len(html), CHUNK_SIZE):
+        if scanner.feed(html[start:start + CHUNK_SIZE]):
+            break
+    return json.loads(scanner.result.strip())
+
+
+def timeit(func, html: str) -> float:
+    best = float('inf')
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(html)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    print(f"{'页面大小':>10} {'BeautifulSoup':>15} {'流式扫描':>12} {'加速比':>8}")
+    for size in PAGE_SIZES:
+        html = build_page(size)
+        assert extract_with_beautifulsoup(html) == extract_with_scanner(html)
+        bs_time = timeit(extract_with_beautifulsoup, html)
+        scan_time = timeit(extract_with_scanner, html)
+        print(f"{len(html) // 1024:>8}KB {bs_time * 1000:>13.2f}ms {scan_time * 1000:>10.2f}ms {bs_time / scan_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
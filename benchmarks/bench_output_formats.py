@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+get_html 各输出格式的体积与渲染耗时对比（html / markdown / text）
+
+输出体积直接决定传给客户端（以及LLM上下文）的字节数，
+同时给出按 4 字节/token 粗略估算的token数，便于比较成本。
+
+用法:
+    python benchmarks/bench_output_formats.py
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import server  # noqa: E402
+
+BLOCK_COUNTS = [100, 1000, 10000]
+REPEAT = 3
+FORMATS = ["html", "markdown", "text"]
+
+
+def build_content(block_count: int):
+    """构造混合段落、表格、代码块和图片的文档内容"""
+    body = ['root', {}]
+    for i in range(block_count):
+        if i % 10 == 0:
+            rows = [['tr', {}] + [['tc', {'vAlign': 'top'}, ['p', {}, ['span', {'sz': 11, 'szUnit': 'pt'}, f'单元格 {i}-{c}']]]
+                                  for c in range(3)] for _ in range(3)]
+            body.append(['table', {}] + rows)
+        elif i % 7 == 0:
+            body.append(['code', {'syntax': 'text/x-python', 'code': f'print({i})\n' * 3}])
+        elif i % 13 == 0:
+            body.append(['p', {}, ['img', {'src': f'/core/api/resources/img/{i}.png', 'name': f'图{i}', 'width': 600}]])
+        else:
+            body.append(['p', {}, ['span', {'bold': i % 3 == 0, 'color': '#333333', 'sz': 11, 'szUnit': 'pt'},
+                                   f'第{i}段：钉钉文档内容解析 paragraph text']])
+    return {'main': 'm', 'parts': {'m': {'data': {'body': body}}}}
+
+
+def main() -> None:
+    print(f"{'块数':>7} {'格式':<9} {'字节':>10} {'估算token':>10} {'占HTML':>7} {'耗时':>9}")
+    for block_count in BLOCK_COUNTS:
+        content = build_content(block_count)
+        html_size = None
+        for output_format in FORMATS:
+            render = server.OUTPUT_RENDERERS[output_format]
+            best = float('inf')
+            for _ in range(REPEAT):
+                start = time.perf_counter()
+                output = render(content, '性能测试')
+                best = min(best, time.perf_counter() - start)
+            size = len(output.encode('utf-8'))
+            html_size = html_size or size
+            print(f"{block_count:>7} {output_format:<9} {size:>10} {size // 4:>10} {size / html_size:>7.0%} {best * 1000:>7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,18 +5,33 @@
 提供钉钉文档内容提取、解析和HTML生成功能
 """
 
-from typing import Annotated, Optional, Dict, Any, List
+from typing import Annotated, Optional, Dict, Any, List, Tuple, Union, Callable, Awaitable, TypeVar, Iterable, Iterator, Literal
 import os
+import sys
 import json
 import asyncio
 import re
 import html as html_module
 import random
+import time
+import functools
+import threading
 import urllib3
 import logging
 import traceback
+import http.cookiejar
+import email.utils
+import urllib.parse
+import gzip
+import shutil
+import secrets
+import tempfile
 from pathlib import Path
 from dataclasses import dataclass
+from contextlib import asynccontextmanager
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor, BrokenExecutor
 
 import httpx
 from mcp.shared.exceptions import McpError
@@ -38,9 +53,32 @@ from bs4 import BeautifulSoup
 import hashlib
 import mimetypes
 
+# 检查 HTTP/2 支持是否可用（需要安装 httpx[http2]）
+try:
+    import h2  # noqa: F401
+    H2_AVAILABLE = True
+except ImportError:
+    H2_AVAILABLE = False
+
+# 检查 orjson 是否可用（可选的高性能JSON后端）
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# 检查 zstandard 是否可用（紧凑导出模式优先使用zstd压缩）
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
 # 禁用SSL警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+T = TypeVar("T")
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -76,6 +114,9 @@ CODE_LANGUAGE_MAP = {
     'text/css': 'css'
 }
 
+# 标题元素标签 → 级别
+HEADING_LEVELS = {f'h{level}': level for level in range(1, 7)}
+
 # 从环境变量获取钉钉Cookie
 DINGTALK_COOKIE = os.getenv("DINGTALK_COOKIE")
 
@@ -83,6 +124,123 @@ DINGTALK_COOKIE = os.getenv("DINGTALK_COOKIE")
 _default_output_dir = os.getenv("DINGTALK_DOC_OUTPUT_DIR", os.path.expanduser("~/Documents/cursor-mcp/dingDoc"))
 DEFAULT_OUTPUT_DIR = os.path.expanduser(_default_output_dir)
 
+# JSON后端：auto（安装了orjson时使用orjson）、orjson 或 stdlib
+JSON_BACKEND = os.getenv("DINGTALK_JSON_BACKEND", "auto").lower()
+
+# 导出文件写入线程数
+EXPORT_WRITER_THREADS = int(os.getenv("DINGTALK_EXPORT_WRITER_THREADS", "4"))
+# 图片写盘前的合并缓冲大小（字节）
+IMAGE_WRITE_BUFFER_SIZE = 256 * 1024
+
+# 内容大小（字节）超过该阈值的文档在渲染执行器中生成HTML，负数表示始终内联渲染
+RENDER_OFFLOAD_THRESHOLD = int(os.getenv("DINGTALK_RENDER_OFFLOAD_THRESHOLD", str(512 * 1024)))
+# 渲染执行器：auto（free-threaded构建用线程池，否则用进程池）/ process / thread / inline
+RENDER_EXECUTOR = os.getenv("DINGTALK_RENDER_EXECUTOR", "auto").lower()
+# 渲染执行器的工作进程/线程数
+RENDER_WORKERS = int(os.getenv("DINGTALK_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# 内容大小（字节）超过该阈值的文档保存HTML时流式写入文件（不返回完整HTML字符串），负数表示禁用
+HTML_STREAM_THRESHOLD = int(os.getenv("DINGTALK_HTML_STREAM_THRESHOLD", str(4 * 1024 * 1024)))
+
+# 图片URL中的易变参数（签名、过期时间等），计算图片缓存键前会被去除；以*结尾表示前缀匹配，不区分大小写
+IMAGE_URL_VOLATILE_PARAMS = [
+    param.strip().lower()
+    for param in os.getenv(
+        "DINGTALK_IMAGE_URL_VOLATILE_PARAMS",
+        "Expires,Signature,OSSAccessKeyId,security-token,x-oss-signature*,x-oss-credential,x-oss-date,x-oss-expires,x-amz-*,auth_key,token,timestamp,t,_"
+    ).split(",")
+    if param.strip()
+]
+
+# 全局图片存储：启用后图片按内容hash保存在缓存目录中，各导出目录通过链接引用
+IMAGE_STORE_ENABLED = os.getenv("DINGTALK_IMAGE_STORE", "false").lower() in ("1", "true", "yes")
+# 导出目录引用全局存储的方式：hardlink（失败时回退为symlink、copy）/ symlink / copy
+IMAGE_STORE_LINK_MODE = os.getenv("DINGTALK_IMAGE_STORE_LINK_MODE", "hardlink").lower()
+# 垃圾回收时保留最近修改的未引用blob的宽限时间（秒）
+IMAGE_STORE_GC_GRACE = float(os.getenv("DINGTALK_IMAGE_STORE_GC_GRACE", "3600"))
+
+# 图片代理监听地址与端口（端口为0时自动分配）
+IMAGE_PROXY_HOST = os.getenv("DINGTALK_IMAGE_PROXY_HOST", "127.0.0.1")
+IMAGE_PROXY_PORT = int(os.getenv("DINGTALK_IMAGE_PROXY_PORT", "0"))
+# 图片代理空闲连接的超时时间（秒），也用作读取每个请求头行的超时
+IMAGE_PROXY_IDLE_TIMEOUT = float(os.getenv("DINGTALK_IMAGE_PROXY_IDLE_TIMEOUT", "30"))
+# 图片代理登记的图片地址（含Cookie）最多保留的条数与时间（秒），超出后按LRU淘汰
+IMAGE_PROXY_MAX_TARGETS = int(os.getenv("DINGTALK_IMAGE_PROXY_MAX_TARGETS", "10000"))
+IMAGE_PROXY_TARGET_TTL = float(os.getenv("DINGTALK_IMAGE_PROXY_TARGET_TTL", str(24 * 3600)))
+# 单个请求最多接受的请求头行数
+IMAGE_PROXY_MAX_HEADERS = 100
+
+# 中间数据导出格式：pretty（逐个缩进JSON文件）或 compact（单个去重压缩文件）
+EXPORT_STORAGE_MODE = os.getenv("DINGTALK_EXPORT_STORAGE_MODE", "pretty").lower()
+# 紧凑模式的压缩算法：auto / zstd / gzip
+EXPORT_COMPRESSION = os.getenv("DINGTALK_EXPORT_COMPRESSION", "auto").lower()
+
+# 批量解析（parse_documents）的默认并发文档数与单次最多文档数
+BATCH_CONCURRENCY = int(os.getenv("DINGTALK_BATCH_CONCURRENCY", "4"))
+BATCH_MAX_DOCUMENTS = int(os.getenv("DINGTALK_BATCH_MAX_DOCUMENTS", "200"))
+
+# 本地缓存目录（元数据、文档内容等跨进程复用的缓存）
+CACHE_DIR = os.path.expanduser(os.getenv("DINGTALK_DOC_CACHE_DIR", "~/.cache/mcp-dingtalk-doc"))
+
+# node_id → dentryKey 缓存配置（TTL为0时禁用）
+DENTRY_CACHE_TTL = float(os.getenv("DINGTALK_DENTRY_CACHE_TTL", str(7 * 24 * 3600)))
+DENTRY_CACHE_SIZE = int(os.getenv("DINGTALK_DENTRY_CACHE_SIZE", "2048"))
+
+# 文档内容缓存配置（TTL内直接使用；之后STALE_TTL内先返回旧内容并后台刷新）
+DOCUMENT_CACHE_TTL = float(os.getenv("DINGTALK_DOCUMENT_CACHE_TTL", "300"))
+DOCUMENT_CACHE_STALE_TTL = float(os.getenv("DINGTALK_DOCUMENT_CACHE_STALE_TTL", "86400"))
+DOCUMENT_CACHE_SIZE = int(os.getenv("DINGTALK_DOCUMENT_CACHE_SIZE", "128"))
+
+# HTML渲染结果缓存配置（MAX_BYTES为0时禁用；DISK=1时同时持久化到缓存目录）
+RENDER_CACHE_MAX_BYTES = int(os.getenv("DINGTALK_RENDER_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RENDER_CACHE_DISK = os.getenv("DINGTALK_RENDER_CACHE_DISK", "0").lower() in ("1", "true", "yes")
+RENDER_CACHE_DISK_MAX_BYTES = int(os.getenv("DINGTALK_RENDER_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+# 渲染器输出变化时递增，使磁盘上旧版本的渲染结果失效
+RENDERER_VERSION = 2
+
+# get_html分页：未指定max_bytes/max_blocks时每页的默认字节预算（0表示默认不分页）
+PAGE_MAX_BYTES = int(os.getenv("DINGTALK_PAGE_MAX_BYTES", "0"))
+# 分页渲染结果的缓存配置（翻页时直接从缓存读取，不重新获取文档）
+PAGE_CACHE_TTL = float(os.getenv("DINGTALK_PAGE_CACHE_TTL", "1800"))
+PAGE_CACHE_MAX_BYTES = int(os.getenv("DINGTALK_PAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# HTTP连接池配置（进程内所有请求共享同一个客户端）
+HTTP2_ENABLED = os.getenv("DINGTALK_HTTP2", "1").lower() not in ("0", "false", "no")
+HTTP_MAX_CONNECTIONS = int(os.getenv("DINGTALK_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("DINGTALK_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("DINGTALK_HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# 图片下载并发控制配置（AIMD自适应窗口）
+IMAGE_MIN_CONCURRENCY = int(os.getenv("DINGTALK_IMAGE_MIN_CONCURRENCY", "2"))
+IMAGE_MAX_CONCURRENCY = int(os.getenv("DINGTALK_IMAGE_MAX_CONCURRENCY", "32"))
+IMAGE_INITIAL_CONCURRENCY = int(os.getenv("DINGTALK_IMAGE_INITIAL_CONCURRENCY", "8"))
+IMAGE_PER_HOST_CONCURRENCY = int(os.getenv("DINGTALK_IMAGE_PER_HOST_CONCURRENCY", "16"))
+IMAGE_LATENCY_TARGET = float(os.getenv("DINGTALK_IMAGE_LATENCY_TARGET", "2.0"))
+
+# 图片流式下载配置
+IMAGE_MAX_BYTES = int(os.getenv("DINGTALK_IMAGE_MAX_BYTES", str(50 * 1024 * 1024)))
+# 未完成下载的临时文件（.part）保留时间（秒），超时后不再续传并被清理
+IMAGE_PARTIAL_MAX_AGE = float(os.getenv("DINGTALK_IMAGE_PARTIAL_MAX_AGE", str(24 * 3600)))
+
+# 图片缓存命中时是否发送条件请求（ETag/Last-Modified）校验，默认直接使用本地文件
+IMAGE_CACHE_REVALIDATE = os.getenv("DINGTALK_IMAGE_CACHE_REVALIDATE", "0").lower() in ("1", "true", "yes")
+IMAGE_INDEX_FILENAME = ".image_index.json"
+
+# 重试与熔断配置
+RETRY_MAX_ATTEMPTS = int(os.getenv("DINGTALK_RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("DINGTALK_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("DINGTALK_RETRY_MAX_DELAY", "10"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("DINGTALK_CIRCUIT_FAILURE_THRESHOLD", "8"))
+CIRCUIT_RECOVERY_TIMEOUT = float(os.getenv("DINGTALK_CIRCUIT_RECOVERY_TIMEOUT", "30"))
+
+# 出站请求限流配置（每秒请求数，0表示不限流；BURST为允许的突发请求数）
+RATE_LIMIT_PAGE = float(os.getenv("DINGTALK_RATE_LIMIT_PAGE", "5"))
+RATE_LIMIT_PAGE_BURST = float(os.getenv("DINGTALK_RATE_LIMIT_PAGE_BURST", "10"))
+RATE_LIMIT_API = float(os.getenv("DINGTALK_RATE_LIMIT_API", "5"))
+RATE_LIMIT_API_BURST = float(os.getenv("DINGTALK_RATE_LIMIT_API_BURST", "10"))
+RATE_LIMIT_IMAGE = float(os.getenv("DINGTALK_RATE_LIMIT_IMAGE", "20"))
+RATE_LIMIT_IMAGE_BURST = float(os.getenv("DINGTALK_RATE_LIMIT_IMAGE_BURST", "40"))
+
 
 # ==================== 数据模型 ====================
 @dataclass
@@ -95,6 +253,39 @@ class DocumentResult:
     content: Optional[Dict[str, Any]] = None
     html: Optional[str] = None
     output_dir: Optional[str] = None
+    saved_files: Optional[List[str]] = None
+    # 非HTML输出格式（markdown / text）的渲染结果
+    rendered: Optional[str] = None
+    # 分页模式下按正文块切分的渲染结果（拼接后即完整文档）
+    blocks: Optional[List[str]] = None
+
+
+@dataclass
+class BatchDocumentStatus:
+    """批量解析中单个文档的结果"""
+    index: int
+    url_or_node_id: str
+    ok: bool
+    node_id: Optional[str] = None
+    doc_name: Optional[str] = None
+    output_dir: Optional[str] = None
+    saved_files: Optional[List[str]] = None
+    error: Optional[str] = None
+    # 等待并发名额的时间与实际解析耗时（秒）
+    wait: float = 0.0
+    elapsed: float = 0.0
+
+
+@dataclass
+class DocumentSection:
+    """章节提取结果"""
+    node_id: str
+    doc_name: str
+    start: int
+    end: int
+    total_blocks: int
+    heading: Optional[Dict[str, Any]] = None
+    rendered: Optional[str] = None
 
 
 class DingTalkDocRequest(BaseModel):
@@ -115,6 +306,13 @@ class DingTalkDocRequest(BaseModel):
         Optional[str],
         Field(description="输出目录路径（可选）", default=None)
     ]
+    image_mode: Annotated[
+        Literal["download", "proxy"],
+        Field(
+            description="图片处理方式：download 导出时下载全部图片；proxy 不下载，图片地址改写为本机代理，首次查看时才获取（仅在服务运行期间可用）",
+            default="download"
+        )
+    ]
 
 
 class DingTalkDocParseRequest(BaseModel):
@@ -127,6 +325,123 @@ class DingTalkDocParseRequest(BaseModel):
         Optional[str],
         Field(description="钉钉登录Cookie（可选，未提供则使用环境变量）", default=None)
     ]
+    image_mode: Annotated[
+        Literal["remote", "proxy"],
+        Field(
+            description="图片地址：remote 使用钉钉原始地址（需要登录态才能显示）；proxy 改写为本机代理地址，首次查看时获取",
+            default="remote"
+        )
+    ]
+    format: Annotated[
+        Literal["html", "markdown", "text"],
+        Field(
+            description="输出格式：html 完整页面；markdown 精简Markdown（无样式）；text 纯文本（体积最小）",
+            default="html"
+        )
+    ]
+    max_bytes: Annotated[
+        Optional[int],
+        Field(
+            description="分页：每页最多返回的字节数（按正文块切分，单个超大块会单独成页）；指定后结果中会附带下一页游标",
+            default=None,
+            gt=0
+        )
+    ]
+    max_blocks: Annotated[
+        Optional[int],
+        Field(description="分页：每页最多返回的正文块数（段落、表格、代码块等）", default=None, gt=0)
+    ]
+    cursor: Annotated[
+        Optional[str],
+        Field(
+            description="分页游标（上一页返回的值）；提供时从缓存的渲染结果中读取下一页，format、image_mode、max_bytes、max_blocks沿用第一页（显式给出不同的值会被拒绝）",
+            default=None
+        )
+    ]
+
+
+class DingTalkDocBatchRequest(BaseModel):
+    """钉钉文档批量解析参数"""
+    url_or_node_ids: Annotated[
+        List[str],
+        Field(description="钉钉文档的完整URL或NODE_ID列表", min_length=1)
+    ]
+    cookie: Annotated[
+        Optional[str],
+        Field(description="钉钉登录Cookie（可选，未提供则使用环境变量）", default=None)
+    ]
+    save_files: Annotated[
+        bool,
+        Field(description="是否保存中间文件", default=True)
+    ]
+    output_dir: Annotated[
+        Optional[str],
+        Field(description="输出目录路径（可选）", default=None)
+    ]
+    image_mode: Annotated[
+        Literal["download", "proxy"],
+        Field(
+            description="图片处理方式：download 导出时下载全部图片；proxy 不下载，图片地址改写为本机代理",
+            default="download"
+        )
+    ]
+    concurrency: Annotated[
+        Optional[int],
+        Field(description="同时解析的文档数（可选，默认使用环境变量配置）", default=None, ge=1, le=32)
+    ]
+
+
+class DingTalkDocSectionRequest(BaseModel):
+    """钉钉文档章节提取参数"""
+    url_or_node_id: Annotated[
+        str,
+        Field(description="钉钉文档的完整URL或NODE_ID")
+    ]
+    cookie: Annotated[
+        Optional[str],
+        Field(description="钉钉登录Cookie（可选，未提供则使用环境变量）", default=None)
+    ]
+    heading: Annotated[
+        Optional[str],
+        Field(
+            description="章节标题文本（完全匹配优先，其次包含匹配，不区分大小写）；与start_block都未指定时返回文档大纲",
+            default=None
+        )
+    ]
+    start_block: Annotated[
+        Optional[int],
+        Field(description="起始顶层块下标（从0开始，含），大纲中列出了每个标题的块范围", default=None, ge=0)
+    ]
+    end_block: Annotated[
+        Optional[int],
+        Field(description="结束顶层块下标（不含），默认到文档末尾", default=None, ge=0)
+    ]
+    image_mode: Annotated[
+        Literal["remote", "proxy"],
+        Field(
+            description="图片地址：remote 使用钉钉原始地址（需要登录态才能显示）；proxy 改写为本机代理地址，首次查看时获取",
+            default="remote"
+        )
+    ]
+    format: Annotated[
+        Literal["html", "markdown", "text"],
+        Field(
+            description="输出格式：html 完整页面；markdown 精简Markdown（无样式）；text 纯文本（体积最小）",
+            default="html"
+        )
+    ]
+
+
+class ServerStatsRequest(BaseModel):
+    """服务运行状态查询参数（无参数）"""
+
+
+class ImageStoreGcRequest(BaseModel):
+    """全局图片存储垃圾回收参数"""
+    grace_seconds: Annotated[
+        Optional[float],
+        Field(description="未被引用的图片至少闲置多少秒才会被删除（默认使用环境变量配置）", default=None)
+    ]
 
 
 # ==================== 错误处理辅助函数 ====================
@@ -261,703 +576,4703 @@ def extract_node_id_from_url(url_or_node_id: str) -> str:
     return url_or_node_id
 
 
-# ==================== HTTP请求函数 ====================
-async def fetch_node_by_get(node_id: str, cookie: str) -> str:
+# ==================== JSON编解码 ====================
+class JsonCodec:
     """
-    通过GET请求获取钉钉文档节点数据
-    
-    Args:
-        node_id: 文档节点ID
-        cookie: 钉钉登录Cookie
-        
-    Returns:
-        HTML响应文本
-        
-    Raises:
-        McpError: 当HTTP请求失败时
+    JSON编解码接口（标准库实现）
+
+    loads接受str或bytes；dumps统一返回UTF-8字节，不转义非ASCII字符。
     """
-    url = f"{BASE_URL}/i/nodes/{node_id}"
-    
-    headers = {
-        **COMMON_HEADERS,
-        "authority": "alidocs.dingtalk.com",
-        "method": "GET",
-        "scheme": "https",
-        "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-        "cookie": cookie,
-    }
-    
-    async with httpx.AsyncClient(verify=False, timeout=DEFAULT_TIMEOUT) as client:
-        try:
-            response = await client.get(url, headers=headers, params={"rnd": random.random()})
-            response.raise_for_status()
-            return response.text
-        except httpx.HTTPError as e:
-            error_msg = format_http_error(e, url, "获取钉钉文档节点")
-            logger.error(f"GET请求失败: {error_msg}")
-            raise McpError(ErrorData(
-                code=INTERNAL_ERROR,
-                message=f"GET请求失败:\n{error_msg}"
-            ))
+    name = "json"
 
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return json.loads(data)
 
-async def fetch_document_data(cookie: str, dentry_key: str) -> Dict[str, Any]:
-    """
-    获取钉钉文档数据（POST请求）
-    
-    Args:
-        cookie: 钉钉登录Cookie
-        dentry_key: 文档entry key
-        
-    Returns:
-        文档数据字典
-        
-    Raises:
-        McpError: 当HTTP请求失败时
-    """
-    headers = {
-        **COMMON_HEADERS,
-        "authority": "alidocs.dingtalk.com",
-        "a-dentry-key": dentry_key,
-        "accept": "*/*",
-        "content-type": "application/json",
-        "cookie": cookie,
-        "origin": BASE_URL,
-    }
-    
-    payload = {"fetchBody": True}
-    
-    async with httpx.AsyncClient(verify=False, timeout=DEFAULT_TIMEOUT) as client:
+    def dumps(self, obj: Any, pretty: bool = False, sort_keys: bool = False) -> bytes:
+        if pretty:
+            text = json.dumps(obj, ensure_ascii=False, indent=2, sort_keys=sort_keys)
+        else:
+            text = json.dumps(obj, ensure_ascii=False, separators=(',', ':'), sort_keys=sort_keys)
+        return text.encode('utf-8')
+
+
+class OrjsonCodec(JsonCodec):
+    """基于orjson的JSON编解码，orjson不支持的输入（如超出64位的整数）回退到标准库"""
+    name = "orjson"
+
+    def loads(self, data: Union[str, bytes]) -> Any:
         try:
-            response = await client.post(API_DOCUMENT_DATA, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPError as e:
-            error_msg = format_http_error(e, API_DOCUMENT_DATA, "获取钉钉文档数据")
-            logger.error(f"POST请求失败: {error_msg}")
-            raise McpError(ErrorData(
-                code=INTERNAL_ERROR,
-                message=f"POST请求失败:\n{error_msg}"
-            ))
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # 回退到标准库：既兼容orjson不支持的输入，也保留标准库的错误信息
+            return json.loads(data)
+
+    def dumps(self, obj: Any, pretty: bool = False, sort_keys: bool = False) -> bytes:
+        option = 0
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, option=option)
+        except (orjson.JSONEncodeError, TypeError):
+            return super().dumps(obj, pretty=pretty, sort_keys=sort_keys)
 
 
-async def download_image(url: str, cookie: str, output_dir: Path) -> Optional[str]:
+def _select_json_codec() -> JsonCodec:
+    """根据DINGTALK_JSON_BACKEND和已安装的依赖选择JSON后端"""
+    if JSON_BACKEND == "stdlib":
+        return JsonCodec()
+    if ORJSON_AVAILABLE:
+        return OrjsonCodec()
+    if JSON_BACKEND == "orjson":
+        logger.warning("DINGTALK_JSON_BACKEND=orjson 但未安装orjson，使用标准库json")
+    return JsonCodec()
+
+
+_json_codec = _select_json_codec()
+
+
+def json_loads(data: Union[str, bytes]) -> Any:
+    """使用当前JSON后端解析"""
+    return _json_codec.loads(data)
+
+
+def json_dumps(obj: Any, pretty: bool = False, sort_keys: bool = False) -> bytes:
+    """使用当前JSON后端序列化为UTF-8字节"""
+    return _json_codec.dumps(obj, pretty=pretty, sort_keys=sort_keys)
+
+
+# ==================== HTTP客户端 ====================
+class _RejectAllCookiePolicy(http.cookiejar.DefaultCookiePolicy):
+    """拒绝保存任何响应Cookie，避免共享客户端在不同调用方之间串用Cookie"""
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def create_http_client() -> httpx.AsyncClient:
     """
-    下载图片并保存到本地
-    
-    Args:
-        url: 图片URL
-        cookie: 钉钉登录Cookie
-        output_dir: 输出目录路径
-        
+    创建带连接池的HTTP客户端
+
+    启用keep-alive，安装了h2时启用HTTP/2多路复用。
+    Cookie由每个请求的headers显式传入，客户端自身不保存任何Cookie。
+
     Returns:
-        本地图片路径（相对于HTML文件的路径），如果下载失败则返回None
+        新的httpx.AsyncClient实例
     """
-    if not url:
-        return None
-    
-    # 确保图片目录存在
-    images_dir = output_dir / "images"
-    images_dir.mkdir(exist_ok=True)
-    
-    try:
-        # 构建完整的URL
-        original_url = url
-        if not url.startswith('http'):
-            url = f'{BASE_URL}{url}'
-        
-        # 生成文件名（使用原始URL的hash值，确保一致性）
-        url_hash = hashlib.md5(original_url.encode()).hexdigest()
-        
-        # 下载图片
-        headers = {
-            **COMMON_HEADERS,
-            "authority": "alidocs.dingtalk.com",
-            "accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
-            "referer": f"{BASE_URL}/",
-            "cookie": cookie,
-        }
-        
-        async with httpx.AsyncClient(
-            verify=False, 
-            timeout=DEFAULT_TIMEOUT,
-            follow_redirects=True  # 明确启用重定向跟随
-        ) as client:
-            response = await client.get(url, headers=headers)
-            response.raise_for_status()
-            
-            # 从响应头获取Content-Type来确定文件扩展名
-            ext = None
-            content_type = response.headers.get('content-type', '')
-            if content_type:
-                ext = mimetypes.guess_extension(content_type.split(';')[0].strip())
-            
-            # 如果无法从Content-Type获取，尝试从最终URL获取
-            if not ext:
-                final_url = str(response.url)  # 获取重定向后的最终URL
-                parsed_url = final_url.split('?')[0]  # 移除查询参数
-                ext = mimetypes.guess_extension(mimetypes.guess_type(parsed_url)[0] or 'image/jpeg')
-            
-            # 如果还是无法确定，使用默认扩展名
-            if not ext:
-                ext = '.jpg'
-            
-            filename = f"{url_hash}{ext}"
-            file_path = images_dir / filename
-            
-            # 如果文件已存在，直接返回路径
-            if file_path.exists():
-                return f"images/{filename}"
-            
-            # 保存图片
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
-            
-            return f"images/{filename}"
-            
-    except Exception as e:
-        # 下载失败时返回None，使用原始URL
-        logger.warning(f"下载图片失败 {url}: {str(e)}")
-        return None
+    limits = httpx.Limits(
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        verify=False,
+        timeout=DEFAULT_TIMEOUT,
+        http2=HTTP2_ENABLED and H2_AVAILABLE,
+        limits=limits,
+        cookies=http.cookiejar.CookieJar(policy=_RejectAllCookiePolicy()),
+    )
 
 
-# ==================== 数据提取函数 ====================
-def extract_mainsite_content(html: str) -> Dict[str, Any]:
+def get_http_client() -> httpx.AsyncClient:
     """
-    从HTML中提取mainsite_server_content的JSON数据
-    
-    Args:
-        html: HTML页面内容
-        
+    获取进程内共享的HTTP客户端，不存在或已关闭时自动创建
+
     Returns:
-        解析后的JSON数据字典
-        
-    Raises:
-        McpError: 当无法找到或解析JSON数据时
+        共享的httpx.AsyncClient实例
     """
-    soup = BeautifulSoup(html, 'html.parser')
-    script = soup.find('script', {'id': 'mainsite_server_content'})
-    
-    if not script or not script.string:
-        raise McpError(ErrorData(
-            code=INTERNAL_ERROR,
-            message="未找到mainsite_server_content"
-        ))
-    
-    try:
-        return json.loads(script.string.strip())
-    except json.JSONDecodeError as e:
-        raise McpError(ErrorData(
-            code=INTERNAL_ERROR,
-            message=f"JSON解析失败: {str(e)}"
-        ))
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = create_http_client()
+    return _http_client
 
 
-def extract_document_content(document_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+async def close_http_client() -> None:
+    """关闭共享的HTTP客户端，释放连接池"""
+    global _http_client
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client = None
+
+
+# ==================== 图片下载调度 ====================
+class DownloadPermit:
+    """一次下载占用的并发名额，由调用方记录响应状态码"""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.status_code: Optional[int] = None
+        self.started_at = time.monotonic()
+
+
+class AdaptiveDownloadScheduler:
     """
-    从document_data中提取文档内容
-    
-    Args:
-        document_data: 文档数据字典
-        
-    Returns:
-        文档内容字典，如果无法提取则返回None
+    图片下载调度器：全局与单host在途请求上限 + AIMD自适应并发窗口
+
+    延迟正常且请求成功时窗口加性增长（每个窗口的成功请求+1），
+    遇到429/5xx或超时时窗口减半，每个往返周期最多回退一次。
     """
-    if not document_data:
-        return None
-    
-    try:
-        # 方式1: 直接从JSON中获取content
-        content_str = document_data['data']['documentContent']['checkpoint']['content']
-        return json.loads(content_str)
-    except (KeyError, json.JSONDecodeError):
-        # 方式2: OSS加密存储（暂不支持完整解密）
-        return None
 
+    def __init__(
+        self,
+        initial: int = IMAGE_INITIAL_CONCURRENCY,
+        min_limit: int = IMAGE_MIN_CONCURRENCY,
+        max_limit: int = IMAGE_MAX_CONCURRENCY,
+        per_host_limit: int = IMAGE_PER_HOST_CONCURRENCY,
+        latency_target: float = IMAGE_LATENCY_TARGET,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.per_host_limit = max(1, per_host_limit)
+        self.latency_target = latency_target
+        self._window = float(min(max(initial, self.min_limit), self.max_limit))
+        self._in_flight = 0
+        self._host_in_flight: Dict[str, int] = {}
+        self._waiters: List[Any] = []
+        self._last_backoff = 0.0
+        self._avg_latency: Optional[float] = None
+        self._successes = 0
+        self._throttled = 0
+        self._errors = 0
 
-def extract_dentry_key(mainsite_content: Dict[str, Any]) -> str:
-    """
-    从mainsite_content中提取dentryKey
-    
-    Args:
-        mainsite_content: mainsite内容字典
-        
+    @property
+    def limit(self) -> int:
+        """当前并发窗口（整数）"""
+        return max(self.min_limit, int(self._window))
+
+    def _can_start(self, host: str) -> bool:
+        return (
+            self._in_flight < self.limit
+            and self._host_in_flight.get(host, 0) < self.per_host_limit
+        )
+
+    def _start(self, host: str) -> None:
+        self._in_flight += 1
+        self._host_in_flight[host] = self._host_in_flight.get(host, 0) + 1
+
+    def _release(self, host: str) -> None:
+        self._in_flight -= 1
+        remaining = self._host_in_flight.get(host, 1) - 1
+        if remaining > 0:
+            self._host_in_flight[host] = remaining
+        else:
+            self._host_in_flight.pop(host, None)
+        self._wake()
+
+    def _wake(self) -> None:
+        """按排队顺序唤醒可以开始的等待者（单host已满的跳过，不阻塞其他host）"""
+        for waiter in list(self._waiters):
+            if self._in_flight >= self.limit:
+                break
+            host, future = waiter
+            if future.done():
+                self._waiters.remove(waiter)
+                continue
+            if self._can_start(host):
+                self._waiters.remove(waiter)
+                self._start(host)
+                future.set_result(None)
+
+    async def acquire(self, host: str) -> DownloadPermit:
+        """等待并占用一个下载名额"""
+        if not self._waiters and self._can_start(host):
+            self._start(host)
+            return DownloadPermit(host)
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (host, future)
+        self._waiters.append(waiter)
+        # 排在前面的等待者可能只是被各自host的上限挡住，本请求的host仍有空闲时立即开始
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 名额已分配但调用方被取消，归还名额
+                self._release(host)
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        return DownloadPermit(host)
+
+    def release(self, permit: DownloadPermit, error: Optional[BaseException] = None) -> None:
+        """归还名额，并根据结果调整并发窗口"""
+        latency = time.monotonic() - permit.started_at
+        self._record(permit, latency, error)
+        self._release(permit.host)
+
+    def _record(self, permit: DownloadPermit, latency: float, error: Optional[BaseException]) -> None:
+        if isinstance(error, asyncio.CancelledError):
+            return
+        status_code = permit.status_code
+        if isinstance(error, httpx.HTTPStatusError):
+            status_code = error.response.status_code
+
+        overloaded = (
+            isinstance(error, httpx.TimeoutException)
+            or status_code == 429
+            or (status_code is not None and status_code >= 500)
+        )
+        if overloaded:
+            self._throttled += 1
+            # 只有在上次回退之后发出的请求才触发回退，避免同一批失败把窗口连续减半
+            if permit.started_at >= self._last_backoff:
+                self._window = max(float(self.min_limit), self._window / 2)
+                self._last_backoff = time.monotonic()
+                logger.info(f"图片下载并发窗口回退至 {self.limit}（状态码: {status_code}）")
+            return
+
+        if error is not None or (status_code is not None and status_code >= 400):
+            self._errors += 1
+            return
+
+        self._successes += 1
+        if self._avg_latency is None:
+            self._avg_latency = latency
+        else:
+            self._avg_latency = 0.8 * self._avg_latency + 0.2 * latency
+        if self._avg_latency <= self.latency_target:
+            self._window = min(float(self.max_limit), self._window + 1.0 / self._window)
+            self._wake()
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        """
+        占用下载名额的上下文管理器
+
+        Args:
+            host: 请求目标host
+
+        Yields:
+            DownloadPermit对象，调用方可设置status_code
+        """
+        permit = await self.acquire(host)
+        try:
+            yield permit
+        except BaseException as e:
+            self.release(permit, e)
+            raise
+        else:
+            self.release(permit)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回调度器当前状态，用于观测"""
+        return {
+            "window": self.limit,
+            "window_exact": round(self._window, 2),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "per_host_limit": self.per_host_limit,
+            "in_flight": self._in_flight,
+            "queued": sum(1 for _, future in self._waiters if not future.done()),
+            "in_flight_by_host": dict(self._host_in_flight),
+            "avg_latency_ms": round(self._avg_latency * 1000, 1) if self._avg_latency is not None else None,
+            "successes": self._successes,
+            "throttled": self._throttled,
+            "errors": self._errors,
+        }
+
+
+_image_scheduler = AdaptiveDownloadScheduler()
+
+
+def get_image_scheduler() -> AdaptiveDownloadScheduler:
+    """获取进程内共享的图片下载调度器"""
+    return _image_scheduler
+
+
+# ==================== 请求限流 ====================
+class TokenBucket:
+    """
+    令牌桶限流器
+
+    按固定速率补充令牌，允许capacity大小的突发；令牌不足的请求按到达顺序排队等待，
+    而不是被拒绝。rate<=0时不限流。
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float):
+        self.name = name
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._waiting = 0
+        self._acquired = 0
+        self._delayed = 0
+        self._total_wait = 0.0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self) -> None:
+        """获取一个令牌，不足时等待"""
+        if self.rate <= 0:
+            return
+        self._waiting += 1
+        try:
+            # asyncio.Lock按FIFO唤醒，排队请求依次按速率放行
+            async with self._lock:
+                self._refill()
+                if self._tokens < 1:
+                    wait = (1 - self._tokens) / self.rate
+                    self._delayed += 1
+                    self._total_wait += wait
+                    await asyncio.sleep(wait)
+                    self._refill()
+                self._tokens -= 1
+                self._acquired += 1
+        finally:
+            self._waiting -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回限流器当前状态，用于观测"""
+        if self.rate > 0:
+            self._refill()
+        return {
+            "rate_per_second": self.rate,
+            "capacity": self.capacity,
+            "tokens": round(self._tokens, 2),
+            "queued": self._waiting,
+            "acquired": self._acquired,
+            "delayed": self._delayed,
+            "total_wait_seconds": round(self._total_wait, 3),
+        }
+
+
+_rate_limiters: Dict[str, TokenBucket] = {
+    "page": TokenBucket("page", RATE_LIMIT_PAGE, RATE_LIMIT_PAGE_BURST),
+    "api": TokenBucket("api", RATE_LIMIT_API, RATE_LIMIT_API_BURST),
+    "image": TokenBucket("image", RATE_LIMIT_IMAGE, RATE_LIMIT_IMAGE_BURST),
+}
+
+
+def get_rate_limiter(kind: str) -> TokenBucket:
+    """
+    获取指定请求类别的限流器
+    
+    Args:
+        kind: 请求类别，page（文档页面GET）、api（文档数据POST）或image（图片下载）
+    """
+    return _rate_limiters[kind]
+
+
+# ==================== 重试与熔断 ====================
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被快速拒绝"""
+
+
+@dataclass
+class RetryPolicy:
+    """重试策略：指数退避 + 全抖动，支持Retry-After"""
+    max_attempts: int = RETRY_MAX_ATTEMPTS
+    base_delay: float = RETRY_BASE_DELAY
+    max_delay: float = RETRY_MAX_DELAY
+    retry_statuses: tuple = (429, 500, 502, 503, 504)
+
+    def is_retryable(self, error: BaseException) -> bool:
+        """判断错误是否值得重试（瞬时网络错误或限流/服务端错误）"""
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in self.retry_statuses
+        return isinstance(error, httpx.TransportError)
+
+    def compute_delay(self, attempt: int, error: BaseException) -> float:
+        """
+        计算第attempt次失败后的等待时间
+        
+        服务端返回Retry-After时优先使用（不超过max_delay），否则使用全抖动指数退避。
+        """
+        if isinstance(error, httpx.HTTPStatusError):
+            retry_after = _parse_retry_after(error.response.headers.get('retry-after'))
+            if retry_after is not None:
+                return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After头（秒数或HTTP日期）"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败达到阈值后打开，冷却期内直接拒绝请求；
+    冷却结束后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+        recovery_timeout: float = CIRCUIT_RECOVERY_TIMEOUT,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        # 单调时钟，测试中可替换
+        self._clock = clock
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._rejected = 0
+
+    def before_request(self) -> None:
+        """
+        请求前检查熔断状态
+        
+        Raises:
+            CircuitOpenError: 熔断打开或半开探测进行中时
+        """
+        if self.state == "open":
+            if self._clock() - self._opened_at < self.recovery_timeout:
+                self._rejected += 1
+                raise CircuitOpenError(f"{self.name} 熔断中，{self.recovery_timeout:.0f}秒内暂停请求")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                self._rejected += 1
+                raise CircuitOpenError(f"{self.name} 熔断恢复探测中，暂停请求")
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        """请求成功（或服务端可达）时调用"""
+        if self.state != "closed":
+            logger.info(f"熔断器关闭: {self.name}")
+        self.state = "closed"
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """请求遇到可重试错误时调用"""
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self._failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"熔断器打开: {self.name}（连续失败 {self._failures} 次）")
+            self.state = "open"
+            self._opened_at = self._clock()
+
+    def record_cancelled(self) -> None:
+        """请求被取消时释放半开探测名额"""
+        self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回熔断器当前状态，用于观测"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "rejected": self._rejected,
+        }
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(host: str) -> CircuitBreaker:
+    """获取host对应的熔断器（同一host共享）"""
+    breaker = _circuit_breakers.get(host)
+    if breaker is None:
+        breaker = _circuit_breakers[host] = CircuitBreaker(host)
+    return breaker
+
+
+async def call_with_retry(
+    operation: Callable[[], Awaitable[T]],
+    url: str,
+    policy: RetryPolicy = DEFAULT_RETRY_POLICY,
+    rate_limit: Optional[str] = None,
+) -> T:
+    """
+    按重试策略执行一次HTTP操作，并经过目标host的熔断器
+    
+    Args:
+        operation: 无参协程函数，每次尝试调用一次
+        url: 请求URL（用于选择熔断器和日志）
+        policy: 重试策略
+        rate_limit: 限流类别（page/api/image），每次尝试前获取一个令牌
+        
     Returns:
-        dentryKey字符串
+        operation的返回值
         
     Raises:
-        McpError: 当无法找到dentryKey时
+        CircuitOpenError: 熔断打开时
+        Exception: 不可重试的错误或重试耗尽后的最后一个错误
     """
-    # 尝试从dentryInfo中获取
-    if 'dentryInfo' in mainsite_content and 'data' in mainsite_content['dentryInfo']:
-        dentry_key = mainsite_content['dentryInfo']['data'].get('dentryKey')
-        if dentry_key:
-            return dentry_key
+    breaker = get_circuit_breaker(httpx.URL(url).host)
+    attempt = 0
+    while True:
+        breaker.before_request()
+        try:
+            if rate_limit:
+                await get_rate_limiter(rate_limit).acquire()
+            result = await operation()
+        except asyncio.CancelledError:
+            breaker.record_cancelled()
+            raise
+        except Exception as e:
+            if not policy.is_retryable(e):
+                # 非瞬时错误（如404）说明服务端可达
+                breaker.record_success()
+                raise
+            breaker.record_failure()
+            attempt += 1
+            if attempt >= policy.max_attempts:
+                raise
+            delay = policy.compute_delay(attempt - 1, e)
+            logger.info(f"请求失败，{delay:.2f}秒后第{attempt}次重试 {url}: {type(e).__name__} {str(e)}")
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+# ==================== 并发请求合并 ====================
+class SingleFlight:
+    """
+    并发请求合并（single-flight）
+
+    同一key同时只执行一次，期间到达的调用方共享同一个结果。
+    单个调用方被取消不会影响正在执行的任务和其他调用方。
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._tasks: Dict[Any, asyncio.Task] = {}
+        self._executed = 0
+        self._shared = 0
+
+    async def do(self, key: Any, operation: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行operation，若相同key已在执行中则等待其结果
+        
+        Args:
+            key: 合并键
+            operation: 无参协程函数
+            
+        Returns:
+            operation的返回值（与并发调用方共享）
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(operation())
+            self._tasks[key] = task
+            self._executed += 1
+            task.add_done_callback(lambda t: self._on_done(key, t))
+        else:
+            self._shared += 1
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: Any, task: asyncio.Task) -> None:
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # 所有调用方都已取消时，避免出现未读取异常的警告
+        if not task.cancelled():
+            task.exception()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回合并统计，用于观测"""
+        return {
+            "in_flight": len(self._tasks),
+            "executed": self._executed,
+            "shared": self._shared,
+        }
+
+
+_document_flight = SingleFlight("document")
+_image_flight = SingleFlight("image")
+
+
+def _cookie_fingerprint(cookie: str) -> str:
+    """Cookie指纹，用于区分不同身份的缓存与合并键（不保存Cookie原文）"""
+    return hashlib.sha256(cookie.encode()).hexdigest()[:16]
+
+
+# ==================== 导出文件写入 ====================
+class ExportWriter:
+    """
+    导出文件写入器：磁盘写入在有界线程池中执行，不阻塞事件循环
+
+    文件先写入同目录的临时文件再原子重命名；目标文件内容hash未变化时跳过写入。
+    """
+
+    def __init__(self, max_workers: int = EXPORT_WRITER_THREADS):
+        self.max_workers = max(1, max_workers)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {"written": 0, "skipped": 0, "bytes_written": 0}
+        # 统计计数在多个写入线程中更新
+        self._stats_lock = threading.Lock()
+        # write_later：路径 → 最新一次提交的序号，以及每个路径的写入锁（保证最后一次提交生效）
+        self._latest: Dict[Path, int] = {}
+        self._path_locks: Dict[Path, threading.Lock] = {}
+        self._sequence = 0
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="export-writer")
+        return self._executor
+
+    def record(self, written: int = 0, skipped: int = 0, bytes_written: int = 0) -> None:
+        """累加写入统计（也用于在其他执行器中完成的导出写入）"""
+        with self._stats_lock:
+            self._stats["written"] += written
+            self._stats["skipped"] += skipped
+            self._stats["bytes_written"] += bytes_written
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """在写入线程池中执行阻塞的文件操作"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool(), functools.partial(func, *args))
+
+    def submit(self, func: Callable[..., Any], *args: Any) -> None:
+        """
+        在写入线程池中后台执行文件操作，不等待结果；失败时只记录日志
+        
+        用于缓存等不影响本次请求结果的写入，调用方（包括同步代码）不会被阻塞。
+        """
+        self._pool().submit(func, *args).add_done_callback(self._log_background_failure)
+
+    def write_later(self, path: Path, produce: Callable[[], Optional[bytes]]) -> None:
+        """
+        后台原子写入path，produce在写入线程中调用以生成内容（可在其中完成序列化），
+        返回None表示删除该文件
+        
+        同一路径的多次提交只保证最后一次生效：较早的提交若尚未执行会被跳过，
+        不会出现旧内容覆盖新内容。
+        """
+        with self._stats_lock:
+            self._sequence += 1
+            sequence = self._latest[path] = self._sequence
+        self.submit(self._write_later_sync, path, produce, sequence)
+
+    def _write_later_sync(self, path: Path, produce: Callable[[], Optional[bytes]], sequence: int) -> None:
+        with self._stats_lock:
+            lock = self._path_locks.setdefault(path, threading.Lock())
+        with lock:
+            with self._stats_lock:
+                if self._latest.get(path) != sequence:
+                    return
+            data = produce()
+            if data is None:
+                path.unlink(missing_ok=True)
+            else:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                self._write_bytes_sync(path, data)
+            with self._stats_lock:
+                if self._latest.get(path) == sequence:
+                    del self._latest[path]
+                    self._path_locks.pop(path, None)
+
+    @staticmethod
+    def _log_background_failure(future: Any) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"后台写入失败: {str(future.exception())}")
+
+    async def write_bytes(self, path: Path, data: bytes) -> bool:
+        """
+        原子写入字节内容
+        
+        Returns:
+            实际写入返回True，内容未变化跳过时返回False
+        """
+        return await self.run(self._write_bytes_sync, path, data)
+
+    async def write_text(self, path: Path, text: str) -> bool:
+        """原子写入UTF-8文本"""
+        return await self.run(self._write_bytes_sync, path, text.encode('utf-8'))
+
+    async def write_json(self, path: Path, data: Any) -> bool:
+        """序列化（indent=2）并原子写入JSON，序列化同样在线程池中完成"""
+        return await self.run(lambda: self._write_bytes_sync(path, json_dumps(data, pretty=True)))
+
+    def _write_bytes_sync(self, path: Path, data: bytes) -> bool:
+        if _file_content_equals(path, data):
+            self.record(skipped=1)
+            return False
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        self.record(written=1, bytes_written=len(data))
+        return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回写入统计，用于观测"""
+        with self._stats_lock:
+            return {"max_workers": self.max_workers, **self._stats}
+
+    def shutdown(self) -> None:
+        """关闭线程池（等待已提交的写入完成）"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def _file_content_equals(path: Path, data: bytes) -> bool:
+    """判断已有文件内容是否与data相同（先比较大小，再比较hash）"""
+    try:
+        if path.stat().st_size != len(data):
+            return False
+        with open(path, 'rb') as f:
+            existing_hash = hashlib.file_digest(f, 'sha256') if hasattr(hashlib, 'file_digest') else hashlib.sha256(f.read())
+    except OSError:
+        return False
+    return existing_hash.digest() == hashlib.sha256(data).digest()
+
+
+_export_writer = ExportWriter()
+
+
+def get_export_writer() -> ExportWriter:
+    """获取进程内共享的导出文件写入器"""
+    return _export_writer
+
+
+# ==================== 导出存储格式 ====================
+# 紧凑模式下每个文档只写一个压缩文件；document_data中内嵌的content字符串只存一份
+COMPACT_EXPORT_FORMAT = "dingtalk-doc-export"
+COMPACT_EXPORT_VERSION = 1
+_COMPACT_EXPORT_SUFFIXES = {"zstd": ".export.json.zst", "gzip": ".export.json.gz"}
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+def _resolve_export_compression() -> str:
+    """解析实际使用的压缩算法（auto：优先zstd，不可用时回退到gzip）"""
+    if EXPORT_COMPRESSION == "zstd" and not ZSTD_AVAILABLE:
+        logger.warning("未安装zstandard，紧凑导出改用gzip压缩")
+        return "gzip"
+    if EXPORT_COMPRESSION in _COMPACT_EXPORT_SUFFIXES:
+        return EXPORT_COMPRESSION
+    return "zstd" if ZSTD_AVAILABLE else "gzip"
+
+
+def _compress_export(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress_export(data: bytes) -> bytes:
+    """按文件头魔数解压，不依赖文件扩展名"""
+    if data.startswith(_ZSTD_MAGIC):
+        if not ZSTD_AVAILABLE:
+            raise McpError(ErrorData(
+                code=INTERNAL_ERROR,
+                message="导出文件使用zstd压缩，请安装zstandard后再读取"
+            ))
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    if data.startswith(_GZIP_MAGIC):
+        return gzip.decompress(data)
+    return data
+
+
+def _split_checkpoint_content(document_data: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    将document_data中内嵌的content字符串拆出
     
-    # 尝试从data中获取nodeId
-    dentry_key = mainsite_content.get('data', {}).get('nodeId')
-    if dentry_key:
-        return dentry_key
+    只复制从根到checkpoint路径上的字典，其余部分与原对象共享。
     
-    raise McpError(ErrorData(
+    Returns:
+        (去除content后的document_data, content字符串)；没有内嵌content时原样返回
+    """
+    try:
+        data = document_data['data']
+        document_content = data['documentContent']
+        checkpoint = document_content['checkpoint']
+        content_str = checkpoint['content']
+    except (KeyError, TypeError):
+        return document_data, None
+    if not isinstance(content_str, str):
+        return document_data, None
+    stripped = {
+        **document_data,
+        'data': {
+            **data,
+            'documentContent': {**document_content, 'checkpoint': {**checkpoint, 'content': None}},
+        },
+    }
+    return stripped, content_str
+
+
+def _join_checkpoint_content(document_data: Dict[str, Any], content_str: Optional[str]) -> Dict[str, Any]:
+    """_split_checkpoint_content的逆操作"""
+    if content_str is not None:
+        document_data['data']['documentContent']['checkpoint']['content'] = content_str
+    return document_data
+
+
+def _encode_compact_export(
+    node_id: str,
+    mainsite_content: Optional[Dict[str, Any]],
+    document_data: Dict[str, Any],
+    codec: str
+) -> bytes:
+    stripped, content_str = _split_checkpoint_content(document_data)
+    payload = {
+        "format": COMPACT_EXPORT_FORMAT,
+        "version": COMPACT_EXPORT_VERSION,
+        "node_id": node_id,
+        "mainsite": mainsite_content,
+        "document": stripped,
+        "content": content_str,
+    }
+    return _compress_export(json_dumps(payload), codec)
+
+
+async def save_compact_export(
+    output_dir: Path,
+    node_id: str,
+    mainsite_content: Optional[Dict[str, Any]],
+    document_data: Dict[str, Any]
+) -> str:
+    """
+    以紧凑模式保存文档中间数据（单个压缩文件，序列化与压缩在写入线程池中完成）
+    
+    Args:
+        output_dir: 输出目录
+        node_id: 节点ID
+        mainsite_content: mainsite内容，可为None
+        document_data: 文档数据
+        
+    Returns:
+        写入的文件名
+    """
+    codec = _resolve_export_compression()
+    filename = f"{node_id}{_COMPACT_EXPORT_SUFFIXES[codec]}"
+    writer = get_export_writer()
+    data = await writer.run(_encode_compact_export, node_id, mainsite_content, document_data, codec)
+    await writer.write_bytes(output_dir / filename, data)
+    return filename
+
+
+def _load_json_if_exists(path: Path) -> Optional[Any]:
+    if not path.exists():
+        return None
+    return json_loads(path.read_bytes())
+
+
+def find_exported_document(output_dir: Union[str, Path], node_id: str) -> Optional[Path]:
+    """
+    查找已导出的文档数据文件（紧凑格式优先，其次为逐文件JSON格式的document文件）
+    
+    Returns:
+        文件路径，不存在时返回None
+    """
+    output_dir = Path(output_dir)
+    for suffix in _COMPACT_EXPORT_SUFFIXES.values():
+        path = output_dir / f"{node_id}{suffix}"
+        if path.exists():
+            return path
+    path = output_dir / f"{node_id}_document.json"
+    return path if path.exists() else None
+
+
+def load_exported_document(output_dir: Union[str, Path], node_id: str) -> Dict[str, Any]:
+    """
+    读取已导出的文档中间数据，同时兼容紧凑格式与逐文件的JSON格式
+    
+    Args:
+        output_dir: 导出目录（即parse_document返回的输出目录）
+        node_id: 节点ID
+        
+    Returns:
+        包含 mainsite / document / content 三个键的字典，缺失的部分为None
+        
+    Raises:
+        McpError: 当目录中找不到该文档的导出文件或格式不受支持时
+    """
+    output_dir = Path(output_dir)
+    for suffix in _COMPACT_EXPORT_SUFFIXES.values():
+        path = output_dir / f"{node_id}{suffix}"
+        if not path.exists():
+            continue
+        payload = json_loads(_decompress_export(path.read_bytes()))
+        if payload.get("format") != COMPACT_EXPORT_FORMAT or payload.get("version") != COMPACT_EXPORT_VERSION:
+            raise McpError(ErrorData(
+                code=INTERNAL_ERROR,
+                message=f"不支持的导出文件格式: {path}"
+            ))
+        content_str = payload.get("content")
+        document_data = payload.get("document")
+        if document_data is not None:
+            document_data = _join_checkpoint_content(document_data, content_str)
+        return {
+            "mainsite": payload.get("mainsite"),
+            "document": document_data,
+            "content": json_loads(content_str) if content_str is not None else None,
+        }
+    
+    document_data = _load_json_if_exists(output_dir / f"{node_id}_document.json")
+    if document_data is None:
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message=f"未找到文档 {node_id} 的导出文件: {output_dir}"
+        ))
+    content = _load_json_if_exists(output_dir / f"{node_id}_content.json")
+    if content is None:
+        content = extract_document_content(document_data)
+    return {
+        "mainsite": _load_json_if_exists(output_dir / f"{node_id}_mainsite.json"),
+        "document": document_data,
+        "content": content,
+    }
+
+
+# ==================== HTTP请求函数 ====================
+def _node_page_headers(cookie: str) -> Dict[str, str]:
+    """文档节点页面GET请求的Headers"""
+    return {
+        **COMMON_HEADERS,
+        "authority": "alidocs.dingtalk.com",
+        "method": "GET",
+        "scheme": "https",
+        "accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+        "cookie": cookie,
+    }
+
+
+def _node_page_error(e: Exception, url: str) -> McpError:
+    """将文档节点页面请求的异常转换为McpError"""
+    if isinstance(e, CircuitOpenError):
+        return McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message=f"GET请求失败: 钉钉服务暂时不可用，请稍后重试（{str(e)}）"
+        ))
+    error_msg = format_http_error(e, url, "获取钉钉文档节点")
+    logger.error(f"GET请求失败: {error_msg}")
+    return McpError(ErrorData(
         code=INTERNAL_ERROR,
-        message="未找到dentryKey或nodeId"
+        message=f"GET请求失败:\n{error_msg}"
     ))
 
 
-# ==================== HTML解析函数 ====================
-def parse_code_block(code_elem: List[Any]) -> str:
+async def fetch_mainsite_content(node_id: str, cookie: str) -> Dict[str, Any]:
+    """
+    流式获取文档节点页面并提取mainsite_server_content
+    
+    边接收边扫描，脚本内容完整后立即停止读取剩余响应；
+    流式扫描未找到时，使用完整页面回退到BeautifulSoup解析。
+    
+    Args:
+        node_id: 文档节点ID
+        cookie: 钉钉登录Cookie
+        
+    Returns:
+        解析后的JSON数据字典
+        
+    Raises:
+        McpError: 当HTTP请求失败或无法提取数据时
+    """
+    url = f"{BASE_URL}/i/nodes/{node_id}"
+    headers = _node_page_headers(cookie)
+    client = get_http_client()
+    
+    async def _scan() -> MainsiteScriptScanner:
+        scanner = MainsiteScriptScanner()
+        async with client.stream("GET", url, headers=headers, params={"rnd": random.random()}) as response:
+            if not response.is_success:
+                await response.aread()
+                response.raise_for_status()
+            async for chunk in response.aiter_text():
+                if scanner.feed(chunk):
+                    break
+        return scanner
+    
+    try:
+        scanner = await call_with_retry(_scan, url, rate_limit="page")
+    except (CircuitOpenError, httpx.HTTPError) as e:
+        raise _node_page_error(e, url)
+    
+    if scanner.result is not None and scanner.result.strip():
+        return _parse_mainsite_json(scanner.result)
+    return extract_mainsite_content(scanner.text())
+
+
+class DocumentNotFoundError(McpError):
+    """dentryKey对应的文档不存在（文档已删除或dentryKey已失效）"""
+
+
+DOCUMENT_NOT_FOUND_STATUSES = (404, 410)
+
+
+async def fetch_document_data(cookie: str, dentry_key: str) -> Dict[str, Any]:
+    """
+    获取钉钉文档数据（POST请求）
+    
+    Args:
+        cookie: 钉钉登录Cookie
+        dentry_key: 文档entry key
+        
+    Returns:
+        文档数据字典
+        
+    Raises:
+        DocumentNotFoundError: 服务端返回404/410时
+        McpError: 当HTTP请求失败时
+    """
+    headers = {
+        **COMMON_HEADERS,
+        "authority": "alidocs.dingtalk.com",
+        "a-dentry-key": dentry_key,
+        "accept": "*/*",
+        "content-type": "application/json",
+        "cookie": cookie,
+        "origin": BASE_URL,
+    }
+    
+    payload = {"fetchBody": True}
+    
+    client = get_http_client()
+    
+    async def _post() -> Dict[str, Any]:
+        response = await client.post(API_DOCUMENT_DATA, headers=headers, json=payload)
+        response.raise_for_status()
+        return json_loads(response.content)
+    
+    try:
+        return await call_with_retry(_post, API_DOCUMENT_DATA, rate_limit="api")
+    except CircuitOpenError as e:
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message=f"POST请求失败: 钉钉服务暂时不可用，请稍后重试（{str(e)}）"
+        ))
+    except httpx.HTTPError as e:
+        error_msg = format_http_error(e, API_DOCUMENT_DATA, "获取钉钉文档数据")
+        logger.error(f"POST请求失败: {error_msg}")
+        if isinstance(e, httpx.HTTPStatusError) and e.response.status_code in DOCUMENT_NOT_FOUND_STATUSES:
+            raise DocumentNotFoundError(ErrorData(
+                code=INTERNAL_ERROR,
+                message=f"POST请求失败（文档不存在）:\n{error_msg}"
+            ))
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message=f"POST请求失败:\n{error_msg}"
+        ))
+
+
+def _is_volatile_image_param(name: str) -> bool:
+    name = name.lower()
+    for param in IMAGE_URL_VOLATILE_PARAMS:
+        if param.endswith('*'):
+            if name.startswith(param[:-1]):
+                return True
+        elif name == param:
+            return True
+    return False
+
+
+def normalize_image_url(url: str) -> str:
+    """
+    规范化图片URL：补全域名，统一scheme/host大小写，去除片段和易变的签名类参数，其余参数排序
+    
+    同一张图片的不同签名URL规范化后相同，可共用一个缓存键。
+    
+    Args:
+        url: 图片URL（可以是相对路径）
+        
+    Returns:
+        规范化后的URL
+    """
+    if url[:4].lower() != 'http':
+        url = f'{BASE_URL}{url}'
+    parts = urllib.parse.urlsplit(url)
+    query = sorted(
+        (name, value)
+        for name, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_volatile_image_param(name)
+    )
+    return urllib.parse.urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), parts.path, urllib.parse.urlencode(query), '')
+    )
+
+
+def image_url_hash(url: str) -> str:
+    """图片缓存键：规范化URL的md5"""
+    return hashlib.md5(normalize_image_url(url).encode()).hexdigest()
+
+
+class ImageIndex:
+    """
+    图片缓存索引：以URL hash为键，记录扩展名、ETag、Last-Modified等信息
+
+    索引保存在images目录下，下载前先查索引即可判断本地是否已有图片，
+    无需等到响应返回才知道扩展名。
+    """
+
+    def __init__(self, images_dir: Path):
+        self.path = images_dir / IMAGE_INDEX_FILENAME
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+        # sha256 → 具有该内容hash的URL hash集合（按插入顺序），内容去重时O(1)查找
+        self._by_sha256: Dict[str, Dict[str, None]] = {}
+        self._dirty = False
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            self._entries = {}
+            if self.path.exists():
+                try:
+                    self._entries = json_loads(self.path.read_bytes()).get('images', {})
+                except (OSError, ValueError, AttributeError) as e:
+                    logger.warning(f"图片索引读取失败，将重建 {self.path}: {str(e)}")
+            for url_hash, entry in self._entries.items():
+                self._link_sha256(url_hash, entry.get('sha256'))
+        return self._entries
+
+    def _link_sha256(self, url_hash: str, digest: Optional[str]) -> None:
+        if digest:
+            self._by_sha256.setdefault(digest, {})[url_hash] = None
+
+    def _unlink_sha256(self, url_hash: str, digest: Optional[str]) -> None:
+        url_hashes = self._by_sha256.get(digest) if digest else None
+        if url_hashes is not None:
+            url_hashes.pop(url_hash, None)
+            if not url_hashes:
+                del self._by_sha256[digest]
+
+    def get(self, url_hash: str) -> Optional[Dict[str, Any]]:
+        """查询索引条目，不存在时返回None"""
+        return self._load().get(url_hash)
+
+    def put(self, url_hash: str, **fields: Any) -> None:
+        """写入或更新索引条目"""
+        entry = self._load().setdefault(url_hash, {})
+        digest = fields.get('sha256')
+        if digest is not None and digest != entry.get('sha256'):
+            self._unlink_sha256(url_hash, entry.get('sha256'))
+            self._link_sha256(url_hash, digest)
+        entry.update({k: v for k, v in fields.items() if v is not None})
+        entry['updated_at'] = int(time.time())
+        self._dirty = True
+
+    def remove(self, url_hash: str) -> None:
+        """删除索引条目"""
+        entry = self._load().pop(url_hash, None)
+        if entry is not None:
+            self._unlink_sha256(url_hash, entry.get('sha256'))
+            self._dirty = True
+
+    def items(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """返回全部索引条目"""
+        return list(self._load().items())
+
+    def find_by_sha256(self, digest: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """查找内容hash等于digest的第一个条目"""
+        entries = self._load()
+        for url_hash in self._by_sha256.get(digest, ()):
+            return url_hash, entries[url_hash]
+        return None
+
+    def flush(self) -> None:
+        """将索引写回磁盘（仅在有变更时，后台写入）"""
+        if not self._dirty or self._entries is None:
+            return
+        # 在当前线程序列化出一致的快照，写盘交给写入线程
+        data = json_dumps({'version': 1, 'images': self._entries})
+        get_export_writer().write_later(self.path, lambda: data)
+        self._dirty = False
+
+
+_image_indexes: Dict[str, ImageIndex] = {}
+# 正在使用各images目录索引的批量下载数，归零时从_image_indexes中移除
+_image_index_users: Dict[str, int] = {}
+
+
+def get_image_index(images_dir: Path) -> ImageIndex:
+    """获取images目录对应的图片索引（同一目录共享一个实例）"""
+    key = str(images_dir.resolve())
+    index = _image_indexes.get(key)
+    if index is None:
+        index = _image_indexes[key] = ImageIndex(images_dir)
+    return index
+
+
+def retain_image_index(images_dir: Path) -> str:
+    """
+    登记一次对images目录索引的使用，与release_image_index成对调用
+    
+    Returns:
+        索引键
+    """
+    key = str(images_dir.resolve())
+    _image_index_users[key] = _image_index_users.get(key, 0) + 1
+    return key
+
+
+def release_image_index(key: str) -> None:
+    """结束一次使用；目录不再被使用时丢弃内存中的索引（调用方应已flush）"""
+    users = _image_index_users.get(key, 0) - 1
+    if users > 0:
+        _image_index_users[key] = users
+        return
+    _image_index_users.pop(key, None)
+    _image_indexes.pop(key, None)
+
+
+def _find_cached_image(images_dir: Path, url_hash: str, entry: Optional[Dict[str, Any]]) -> Optional[str]:
+    """
+    查找本地已缓存的图片文件
+    
+    优先使用索引记录的文件名（内容去重后可能指向其他URL的文件）或扩展名；
+    没有索引记录时兼容旧版导出，按hash前缀查找。
+    
+    Returns:
+        已存在的文件名，不存在时返回None
+    """
+    if entry and entry.get('file'):
+        if (images_dir / entry['file']).exists():
+            return entry['file']
+        return None
+    if entry and entry.get('ext'):
+        filename = f"{url_hash}{entry['ext']}"
+        if (images_dir / filename).exists():
+            return filename
+        return None
+    for candidate in images_dir.glob(f"{url_hash}.*"):
+        if candidate.suffix not in _PARTIAL_SUFFIXES:
+            return candidate.name
+    return None
+
+
+# 临时文件（.part）及其旁边记录的续传校验值（.validator）
+_PARTIAL_SUFFIXES = ('.part', '.validator')
+
+
+def _range_validator(response: httpx.Response) -> Optional[str]:
+    """可用于If-Range的校验值：强ETag优先，其次Last-Modified；都没有时返回None"""
+    etag = response.headers.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response.headers.get('last-modified')
+
+
+def _load_partial(part_path: Path) -> Tuple[int, Optional[str]]:
+    """
+    读取可续传的临时文件（在写入线程池中调用）
+    
+    没有校验值或已超过IMAGE_PARTIAL_MAX_AGE的临时文件无法安全续传，直接删除。
+    
+    Returns:
+        (已下载字节数, 校验值)；不可续传时返回(0, None)
+    """
+    validator_path = part_path.with_suffix('.validator')
+    try:
+        stat = part_path.stat()
+        validator = validator_path.read_text(encoding='utf-8').strip()
+    except OSError:
+        validator = ''
+        stat = None
+    if stat is None or not validator or time.time() - stat.st_mtime > IMAGE_PARTIAL_MAX_AGE:
+        _discard_partial(part_path)
+        return 0, None
+    return stat.st_size, validator
+
+
+def _discard_partial(part_path: Path) -> None:
+    part_path.unlink(missing_ok=True)
+    part_path.with_suffix('.validator').unlink(missing_ok=True)
+
+
+def _write_partial_validator(part_path: Path, validator: Optional[str]) -> None:
+    validator_path = part_path.with_suffix('.validator')
+    if validator:
+        validator_path.write_text(validator, encoding='utf-8')
+    else:
+        validator_path.unlink(missing_ok=True)
+
+
+def _finish_partial(part_path: Path, file_path: Path) -> None:
+    os.replace(part_path, file_path)
+    part_path.with_suffix('.validator').unlink(missing_ok=True)
+
+
+def _remove_stale_partials(directory: Path, max_age: float = IMAGE_PARTIAL_MAX_AGE) -> int:
+    """
+    删除目录中超过max_age未更新的临时文件（中断后未再续传的下载）
+    
+    Returns:
+        删除的文件数
+    """
+    cutoff = time.time() - max_age
+    removed = 0
+    for suffix in _PARTIAL_SUFFIXES:
+        for path in directory.glob(f"*{suffix}"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink()
+                    removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+class ImageTooLargeError(Exception):
+    """图片超过允许的最大体积"""
+
+
+def _guess_image_extension(response: httpx.Response) -> str:
+    """
+    根据响应确定图片文件扩展名
+    
+    Args:
+        response: 图片请求的响应对象
+        
+    Returns:
+        文件扩展名（包含点号）
+    """
+    # 从响应头获取Content-Type来确定文件扩展名
+    ext = None
+    content_type = response.headers.get('content-type', '')
+    if content_type:
+        ext = mimetypes.guess_extension(content_type.split(';')[0].strip())
+    
+    # 如果无法从Content-Type获取，尝试从最终URL获取
+    if not ext:
+        final_url = str(response.url)  # 获取重定向后的最终URL
+        parsed_url = final_url.split('?')[0]  # 移除查询参数
+        ext = mimetypes.guess_extension(mimetypes.guess_type(parsed_url)[0] or 'image/jpeg')
+    
+    # 如果还是无法确定，使用默认扩展名
+    return ext or '.jpg'
+
+
+def _expected_image_size(response: httpx.Response, offset: int) -> Optional[int]:
+    """从Content-Range或Content-Length推算图片完整大小，未知时返回None"""
+    content_range = response.headers.get('content-range', '')
+    if response.status_code == 206 and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1].strip()
+        if total.isdigit():
+            return int(total)
+    content_length = response.headers.get('content-length')
+    if content_length and content_length.isdigit():
+        return int(content_length) + (offset if response.status_code == 206 else 0)
+    return None
+
+
+async def _stream_image_once(
+    url: str,
+    headers: Dict[str, str],
+    images_dir: Path,
+    url_hash: str,
+    index: ImageIndex,
+    cached_filename: Optional[str] = None,
+) -> str:
+    """
+    执行一次流式下载：分块写入临时文件，完成后原子重命名到images目录
+    
+    临时文件存在时通过Range + If-Range请求从断点续传，校验值（开始下载时响应的强ETag
+    或Last-Modified）保存在临时文件旁，服务端文件已变化时返回完整内容并重新下载，
+    不会把两个版本的内容拼接在一起；提供cached_filename时发送条件请求，
+    服务端返回304则直接复用本地文件。
+    
+    Returns:
+        保存后的文件名
+        
+    Raises:
+        ImageTooLargeError: 图片超过IMAGE_MAX_BYTES时
+        httpx.HTTPError: 请求失败或传输中断时
+    """
+    part_path = images_dir / f"{url_hash}.part"
+    offset, validator = await get_export_writer().run(_load_partial, part_path)
+    request_headers = dict(headers)
+    if cached_filename:
+        entry = index.get(url_hash) or {}
+        if entry.get('etag'):
+            request_headers["if-none-match"] = entry['etag']
+        if entry.get('last_modified'):
+            request_headers["if-modified-since"] = entry['last_modified']
+    elif offset:
+        request_headers["range"] = f"bytes={offset}-"
+        request_headers["if-range"] = validator
+    
+    client = get_http_client()
+    async with get_image_scheduler().slot(httpx.URL(url).host) as permit:
+        # 明确启用重定向跟随
+        async with client.stream("GET", url, headers=request_headers, follow_redirects=True) as response:
+            permit.status_code = response.status_code
+            if response.status_code == 304 and cached_filename:
+                index.put(url_hash, verified_at=int(time.time()))
+                return cached_filename
+            if response.status_code == 416 and offset:
+                # 断点已失效（服务端文件变化），丢弃临时文件后整体重下
+                await get_export_writer().run(_discard_partial, part_path)
+                raise httpx.RemoteProtocolError("Range请求无效，重新下载", request=response.request)
+            response.raise_for_status()
+            if response.status_code == 206 and _range_validator(response) not in (None, validator):
+                # 服务端忽略了If-Range但返回了其他版本的片段
+                await get_export_writer().run(_discard_partial, part_path)
+                raise httpx.RemoteProtocolError("续传内容版本不一致，重新下载", request=response.request)
+            
+            ext = _guess_image_extension(response)
+            filename = f"{url_hash}{ext}"
+            file_path = images_dir / filename
+            index.put(
+                url_hash,
+                url=url,
+                ext=ext,
+                etag=response.headers.get('etag'),
+                last_modified=response.headers.get('last-modified'),
+            )
+            # 如果文件已存在且无需校验，直接返回
+            if file_path.exists() and not cached_filename:
+                await get_export_writer().run(_discard_partial, part_path)
+                return filename
+            
+            if response.status_code != 206:
+                offset = 0
+            expected_size = _expected_image_size(response, offset)
+            if expected_size is not None and expected_size > IMAGE_MAX_BYTES:
+                await get_export_writer().run(_discard_partial, part_path)
+                raise ImageTooLargeError(f"图片大小 {expected_size} 字节超过上限 {IMAGE_MAX_BYTES} 字节")
+            
+            # 文件操作在写入线程池中执行，避免慢速磁盘阻塞事件循环；
+            # 小块数据先合并再提交，减少线程切换。中断时已收到的数据仍会落盘，以便续传
+            writer = get_export_writer()
+            if not offset:
+                # 记录本次内容的校验值，没有校验值时删除旧记录（中断后不续传）
+                await writer.run(_write_partial_validator, part_path, _range_validator(response))
+            written = offset
+            pending = bytearray()
+            f = await writer.run(open, part_path, 'ab' if offset else 'wb')
+            try:
+                async for chunk in response.aiter_bytes():
+                    written += len(chunk)
+                    if written > IMAGE_MAX_BYTES:
+                        break
+                    pending += chunk
+                    if len(pending) >= IMAGE_WRITE_BUFFER_SIZE:
+                        await writer.run(f.write, bytes(pending))
+                        pending.clear()
+            finally:
+                try:
+                    if pending:
+                        await writer.run(f.write, bytes(pending))
+                finally:
+                    await writer.run(f.close)
+            if written > IMAGE_MAX_BYTES:
+                await writer.run(_discard_partial, part_path)
+                raise ImageTooLargeError(f"图片大小超过上限 {IMAGE_MAX_BYTES} 字节")
+    
+    await get_export_writer().run(_finish_partial, part_path, file_path)
+    index.put(url_hash, size=written)
+    return filename
+
+
+async def _dedupe_image_file(images_dir: Path, index: ImageIndex, url_hash: str, filename: str) -> str:
+    """
+    按内容hash对新下载的图片去重：目录中已有相同字节的文件时删除新文件并复用已有文件
+    
+    Returns:
+        最终使用的文件名
+    """
+    writer = get_export_writer()
+    path = images_dir / filename
+    
+    def _sha256() -> str:
+        with open(path, 'rb') as f:
+            return _file_sha256(f)
+    
+    digest = await writer.run(_sha256)
+    match = index.find_by_sha256(digest)
+    if match is not None:
+        existing = match[1].get('file') or f"{match[0]}{match[1].get('ext', '')}"
+        if existing != filename and (images_dir / existing).exists():
+            await writer.run(path.unlink)
+            index.put(url_hash, sha256=digest, file=existing)
+            return existing
+    index.put(url_hash, sha256=digest, file=filename)
+    return filename
+
+
+def _image_request_headers(cookie: str) -> Dict[str, str]:
+    """图片下载请求头"""
+    return {
+        **COMMON_HEADERS,
+        "authority": "alidocs.dingtalk.com",
+        "accept": "image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8",
+        "referer": f"{BASE_URL}/",
+        "cookie": cookie,
+    }
+
+
+async def download_image(url: str, cookie: str, output_dir: Path) -> Optional[str]:
+    """
+    下载图片并保存到本地
+    
+    下载前先查询图片索引，本地已有时直接复用（或仅发送一次条件请求）；
+    图片以流式方式写入临时文件，失败时按共享重试策略重试，传输中断时使用Range请求断点续传。
+    同一图片到同一目录的并发下载会合并为一次。
+    
+    Args:
+        url: 图片URL
+        cookie: 钉钉登录Cookie
+        output_dir: 输出目录路径
+        
+    Returns:
+        本地图片路径（相对于HTML文件的路径），如果下载失败则返回None
+    """
+    if not url:
+        return None
+    
+    images_dir = output_dir / "images"
+    return await _image_flight.do(
+        (normalize_image_url(url), str(images_dir.resolve())),
+        lambda: _download_image(url, cookie, images_dir),
+    )
+
+
+async def _download_image(url: str, cookie: str, images_dir: Path) -> Optional[str]:
+    """download_image的实际实现（未合并）"""
+    # 确保图片目录存在
+    images_dir.mkdir(exist_ok=True)
+    
+    try:
+        # 构建完整的URL
+        original_url = url
+        if not url.startswith('http'):
+            url = f'{BASE_URL}{url}'
+        
+        # 生成文件名（使用规范化URL的hash值，同一图片的不同签名URL共用一个文件）
+        url_hash = image_url_hash(url)
+        
+        if IMAGE_STORE_ENABLED:
+            # 全局存储模式：图片只在存储中保存一份，导出目录中创建链接
+            blob = await _fetch_into_store(url, url_hash, _image_request_headers(cookie))
+            return f"images/{await get_image_store().link_into(blob, images_dir)}"
+        
+        # 先查本地缓存，命中时无需发起下载
+        index = get_image_index(images_dir)
+        entry = index.get(url_hash)
+        cached_filename = _find_cached_image(images_dir, url_hash, entry)
+        if cached_filename is None and entry is None:
+            # 兼容按原始URL hash命名的旧版导出
+            cached_filename = _find_cached_image(images_dir, hashlib.md5(original_url.encode()).hexdigest(), None)
+        if cached_filename:
+            if entry is None:
+                index.put(url_hash, url=url, ext=Path(cached_filename).suffix, file=cached_filename)
+            can_revalidate = entry is not None and (entry.get('etag') or entry.get('last_modified'))
+            if not (IMAGE_CACHE_REVALIDATE and can_revalidate):
+                return f"images/{cached_filename}"
+        
+        # 下载图片
+        headers = _image_request_headers(cookie)
+        
+        # 传输中断时重试会自动从临时文件断点续传
+        filename = await call_with_retry(
+            lambda: _stream_image_once(url, headers, images_dir, url_hash, index, cached_filename),
+            url,
+            rate_limit="image",
+        )
+        if filename != cached_filename:
+            filename = await _dedupe_image_file(images_dir, index, url_hash, filename)
+        return f"images/{filename}"
+        
+    except Exception as e:
+        # 下载失败时返回None，使用原始URL
+        logger.warning(f"下载图片失败 {url}: {str(e)}")
+        return None
+
+
+# ==================== 全局图片存储 ====================
+class ImageStore:
+    """
+    跨文档共享的内容寻址图片存储
+
+    图片按字节内容的sha256保存在 objects/ 下，同一张图片无论出现在多少个文档中只存一份；
+    存储根目录下的图片索引以URL hash为键记录对应的blob，已下载过的URL无需再次请求。
+    各导出目录的images/通过硬链接（不可用时依次回退为符号链接、复制）引用blob，
+    链接位置记录在 refs.json 中，gc() 据此清理不再被引用的blob。
+    """
+
+    def __init__(self, root: Path, link_mode: str = IMAGE_STORE_LINK_MODE):
+        self.root = root
+        self.objects_dir = root / "objects"
+        self.incoming_dir = root / "incoming"
+        self.link_mode = link_mode
+        self._refs_path = root / "refs.json"
+        self._refs: Optional[Dict[str, List[str]]] = None
+        self._refs_dirty = False
+        self._stats = {"url_hits": 0, "downloads": 0, "dedup_hits": 0, "hardlinks": 0, "symlinks": 0, "copies": 0}
+
+    @property
+    def index(self) -> ImageIndex:
+        """URL hash → blob 的索引（保存在存储根目录）"""
+        return get_image_index(self.root)
+
+    def _load_refs(self) -> Dict[str, List[str]]:
+        if self._refs is None:
+            self._refs = {}
+            if self._refs_path.exists():
+                try:
+                    self._refs = json_loads(self._refs_path.read_bytes()).get('refs', {})
+                except (OSError, ValueError, AttributeError) as e:
+                    logger.warning(f"图片引用表读取失败，将重建 {self._refs_path}: {str(e)}")
+        return self._refs
+
+    def lookup(self, url_hash: str) -> Optional[str]:
+        """按URL hash查找已存储的blob名，不存在时返回None"""
+        entry = self.index.get(url_hash)
+        blob = entry.get('blob') if entry else None
+        if blob and (self.objects_dir / blob).exists():
+            return blob
+        return None
+
+    def record_url_hit(self) -> None:
+        """记录一次URL缓存命中（无需下载即可使用已存储的blob）"""
+        self._stats["url_hits"] += 1
+
+    async def ingest(self, url_hash: str, incoming_filename: str) -> str:
+        """
+        将incoming目录中下载完成的文件按内容hash移入objects目录
+        
+        Returns:
+            blob文件名（sha256 + 扩展名）
+        """
+        blob, deduplicated = await get_export_writer().run(self._ingest_sync, self.incoming_dir / incoming_filename)
+        self._stats["dedup_hits" if deduplicated else "downloads"] += 1
+        self.index.put(url_hash, blob=blob)
+        return blob
+
+    def _ingest_sync(self, path: Path) -> Tuple[str, bool]:
+        with open(path, 'rb') as f:
+            digest = _file_sha256(f)
+        blob = f"{digest}{path.suffix}"
+        target = self.objects_dir / blob
+        if target.exists():
+            path.unlink(missing_ok=True)
+            return blob, True
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        os.replace(path, target)
+        return blob, False
+
+    async def link_into(self, blob: str, images_dir: Path) -> str:
+        """
+        在导出目录的images/下创建指向blob的链接
+        
+        Returns:
+            images目录中的文件名
+        """
+        mode = await get_export_writer().run(self._link_sync, self.objects_dir / blob, images_dir / blob)
+        self._stats[{"hardlink": "hardlinks", "symlink": "symlinks", "copy": "copies"}[mode]] += 1
+        if mode != "copy":
+            refs = self._load_refs().setdefault(blob, [])
+            link_path = os.path.abspath(images_dir / blob)
+            if link_path not in refs:
+                refs.append(link_path)
+                self._refs_dirty = True
+        return blob
+
+    def _link_sync(self, source: Path, target: Path) -> str:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if os.path.lexists(target):
+            try:
+                if os.path.samefile(source, target):
+                    return "symlink" if target.is_symlink() else "hardlink"
+            except OSError:
+                pass
+        modes = {"hardlink": ("hardlink", "symlink", "copy"), "symlink": ("symlink", "copy")}.get(self.link_mode, ("copy",))
+        tmp_path = target.with_name(f".{target.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        for mode in modes:
+            try:
+                if mode == "hardlink":
+                    os.link(source, tmp_path)
+                elif mode == "symlink":
+                    os.symlink(source.resolve(), tmp_path)
+                else:
+                    shutil.copyfile(source, tmp_path)
+                os.replace(tmp_path, target)
+                return mode
+            except OSError as e:
+                if os.path.lexists(tmp_path):
+                    tmp_path.unlink()
+                if mode == modes[-1]:
+                    raise
+                logger.debug(f"图片{mode}失败，尝试下一种方式: {str(e)}")
+        raise AssertionError("unreachable")
+
+    def flush(self) -> None:
+        """将索引和引用表写回磁盘（仅在有变更时，后台写入）"""
+        self.index.flush()
+        if self._refs_dirty and self._refs is not None:
+            data = json_dumps({'version': 1, 'refs': self._refs})
+            get_export_writer().write_later(self._refs_path, lambda: data)
+            self._refs_dirty = False
+
+    async def gc(self, grace_seconds: float = IMAGE_STORE_GC_GRACE) -> Dict[str, Any]:
+        """
+        清理不再被任何导出目录引用的blob
+        
+        引用表中已删除或已被替换的链接会先被剔除；修改时间在grace_seconds以内的blob
+        视为可能正在使用（刚下载、尚未链接），不会被删除。
+        链接检查、目录扫描和删除在写入线程池中执行；引用表与索引只在事件循环中修改，
+        扫描期间新登记引用的blob不会被删除。
+        
+        Args:
+            grace_seconds: 宽限时间（秒）
+            
+        Returns:
+            清理结果统计
+        """
+        writer = get_export_writer()
+        refs = await writer.run(self._load_refs)
+        snapshot = {blob: list(paths) for blob, paths in refs.items()}
+        alive, unreferenced = await writer.run(self._gc_scan, snapshot)
+        
+        dropped_refs = 0
+        for blob, paths in snapshot.items():
+            dead = set(paths) - set(alive.get(blob, ()))
+            if not dead or blob not in refs:
+                continue
+            dropped_refs += len(dead)
+            remaining = [path for path in refs[blob] if path not in dead]
+            if remaining:
+                refs[blob] = remaining
+            else:
+                del refs[blob]
+            self._refs_dirty = True
+        
+        candidates = [blob for blob in unreferenced if blob not in refs]
+        removed_blobs, removed_bytes = await writer.run(self._gc_remove, candidates, grace_seconds)
+        
+        index = self.index
+        for url_hash, entry in list(index.items()):
+            if entry.get('blob') in removed_blobs:
+                index.remove(url_hash)
+        self.flush()
+        return {
+            "removed_blobs": len(removed_blobs),
+            "removed_bytes": removed_bytes,
+            "dropped_refs": dropped_refs,
+            "referenced_blobs": len(refs),
+        }
+
+    def _gc_scan(self, refs: Dict[str, List[str]]) -> Tuple[Dict[str, List[str]], List[str]]:
+        """返回(blob → 仍然有效的链接, 没有有效链接的blob列表)"""
+        alive = {}
+        for blob, paths in refs.items():
+            blob_path = self.objects_dir / blob
+            alive[blob] = [path for path in paths if _same_file(path, blob_path)]
+        if not self.objects_dir.exists():
+            return alive, []
+        unreferenced = [path.name for path in self.objects_dir.iterdir() if not alive.get(path.name)]
+        return alive, unreferenced
+
+    def _gc_remove(self, blobs: List[str], grace_seconds: float) -> Tuple[set, int]:
+        removed_blobs: set = set()
+        removed_bytes = 0
+        now = time.time()
+        for blob in blobs:
+            blob_path = self.objects_dir / blob
+            try:
+                stat = blob_path.stat()
+                if now - stat.st_mtime < grace_seconds:
+                    continue
+                blob_path.unlink()
+            except OSError:
+                continue
+            removed_blobs.add(blob)
+            removed_bytes += stat.st_size
+        return removed_blobs, removed_bytes
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回存储统计，用于观测"""
+        return {"root": str(self.root), "link_mode": self.link_mode, **self._stats}
+
+
+def _file_sha256(f) -> str:
+    """计算已打开二进制文件的sha256"""
+    if hasattr(hashlib, 'file_digest'):
+        return hashlib.file_digest(f, 'sha256').hexdigest()
+    digest = hashlib.sha256()
+    for block in iter(lambda: f.read(1024 * 1024), b''):
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def _same_file(path: str, blob_path: Path) -> bool:
+    try:
+        return os.path.samefile(path, blob_path)
+    except OSError:
+        return False
+
+
+_image_store: Optional[ImageStore] = None
+_image_store_flight = SingleFlight("image_store")
+
+
+def get_image_store() -> ImageStore:
+    """获取进程内共享的全局图片存储"""
+    global _image_store
+    if _image_store is None:
+        _image_store = ImageStore(Path(CACHE_DIR) / "images")
+    return _image_store
+
+
+async def _fetch_into_store(
+    url: str,
+    url_hash: str,
+    headers: Dict[str, str],
+    store: Optional[ImageStore] = None
+) -> str:
+    """
+    确保URL对应的图片已在图片存储中（同一存储中同一URL的并发请求合并为一次）
+    
+    Args:
+        url: 图片URL
+        url_hash: URL hash
+        headers: 请求头
+        store: 图片存储，默认为全局图片存储
+    
+    Returns:
+        blob文件名
+    """
+    if store is None:
+        store = get_image_store()
+    
+    async def _fetch() -> str:
+        blob = store.lookup(url_hash)
+        if blob:
+            entry = store.index.get(url_hash) or {}
+            can_revalidate = entry.get('etag') or entry.get('last_modified')
+            if not (IMAGE_CACHE_REVALIDATE and can_revalidate):
+                store.record_url_hit()
+                return blob
+        store.incoming_dir.mkdir(parents=True, exist_ok=True)
+        filename = await call_with_retry(
+            lambda: _stream_image_once(url, headers, store.incoming_dir, url_hash, store.index, blob),
+            url,
+            rate_limit="image",
+        )
+        if blob and filename == blob:
+            # 304：存储中的blob仍然有效
+            return blob
+        return await store.ingest(url_hash, filename)
+    
+    return await _image_store_flight.do((str(store.root), url_hash), _fetch)
+
+
+# ==================== 图片代理 ====================
+class ImageProxy:
+    """
+    本地图片代理：HTML中的图片地址改写为本机HTTP端点，浏览器首次查看时才从alidocs获取
+
+    启用全局图片存储时图片经其缓存，否则使用代理私有的临时存储（关闭代理时删除），
+    不会在缓存目录中留下无人引用的blob。上游支持ETag/Last-Modified条件请求，
+    对浏览器返回以内容hash为值的强ETag，重复查看时直接返回304。
+    端点只监听本机地址，路径中带有进程级随机密钥，只能访问已登记的图片；
+    同一图片由不同Cookie登记时得到不同的代理地址，各自使用自己的Cookie拉取。
+    登记的地址（含Cookie）按LRU与TTL淘汰，不会无限累积。
+    """
+
+    def __init__(
+        self,
+        host: str = IMAGE_PROXY_HOST,
+        port: int = IMAGE_PROXY_PORT,
+        max_targets: int = IMAGE_PROXY_MAX_TARGETS,
+        target_ttl: float = IMAGE_PROXY_TARGET_TTL,
+    ):
+        self.host = host
+        self.port = port
+        self.max_targets = max(1, max_targets)
+        self.target_ttl = target_ttl
+        self._secret = secrets.token_urlsafe(16)
+        # token → (图片URL, Cookie, 登记时间)
+        self._targets: "OrderedDict[str, Tuple[str, str, float]]" = OrderedDict()
+        self._private_store: Optional[ImageStore] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._start_lock = asyncio.Lock()
+        self._stats = {"requests": 0, "served": 0, "not_modified": 0, "not_found": 0, "errors": 0, "evicted": 0}
+
+    @property
+    def base_url(self) -> Optional[str]:
+        return f"http://{self.host}:{self.port}" if self._server is not None else None
+
+    @property
+    def store(self) -> ImageStore:
+        """代理使用的图片存储：全局存储，未启用时为私有临时存储"""
+        if IMAGE_STORE_ENABLED:
+            return get_image_store()
+        if self._private_store is None:
+            root = Path(tempfile.mkdtemp(prefix="dingtalk-image-proxy-"))
+            self._private_store = ImageStore(root)
+        return self._private_store
+
+    def _target(self, token: str) -> Optional[Tuple[str, str]]:
+        target = self._targets.get(token)
+        if target is None:
+            return None
+        url, cookie, registered_at = target
+        if time.monotonic() - registered_at > self.target_ttl:
+            del self._targets[token]
+            self._stats["evicted"] += 1
+            return None
+        return url, cookie
+
+    async def start(self) -> str:
+        """启动代理端点（已启动时直接返回），返回基础URL"""
+        async with self._start_lock:
+            if self._server is None:
+                self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+                self.port = self._server.sockets[0].getsockname()[1]
+                logger.info(f"图片代理已启动: {self.base_url}")
+        return self.base_url
+
+    async def url_for(self, url: str, cookie: str) -> str:
+        """
+        登记图片并返回代理地址
+        
+        Args:
+            url: 图片URL（可以是相对路径）
+            cookie: 拉取图片时使用的钉钉登录Cookie
+            
+        Returns:
+            本机代理URL
+        """
+        base_url = await self.start()
+        if not url.startswith('http'):
+            url = f'{BASE_URL}{url}'
+        # token同时包含图片和Cookie指纹，不同用户的登记互不覆盖
+        token = hashlib.md5(f"{image_url_hash(url)}:{_cookie_fingerprint(cookie)}".encode()).hexdigest()
+        self._targets[token] = (url, cookie, time.monotonic())
+        self._targets.move_to_end(token)
+        while len(self._targets) > self.max_targets:
+            self._targets.popitem(last=False)
+            self._stats["evicted"] += 1
+        ext = Path(urllib.parse.urlsplit(url).path).suffix
+        return f"{base_url}/img/{self._secret}/{token}{ext}"
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), IMAGE_PROXY_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+                headers = await self._read_headers(reader)
+                if headers is None:
+                    break
+                
+                parts = request_line.decode('latin-1').split()
+                method = parts[0] if parts else ''
+                path = parts[1] if len(parts) > 1 else ''
+                keep_alive = (
+                    len(parts) > 2 and parts[2] == 'HTTP/1.1'
+                    and headers.get('connection', '').lower() != 'close'
+                )
+                await self._handle_request(method, path, headers, writer, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    async def _read_headers(reader: asyncio.StreamReader) -> Optional[Dict[str, str]]:
+        """读取请求头（每行都有超时），超时、连接关闭或请求头过多时返回None"""
+        headers: Dict[str, str] = {}
+        for _ in range(IMAGE_PROXY_MAX_HEADERS + 1):
+            try:
+                line = await asyncio.wait_for(reader.readline(), IMAGE_PROXY_IDLE_TIMEOUT)
+            except asyncio.TimeoutError:
+                return None
+            if line in (b'\r\n', b'\n'):
+                return headers
+            if not line:
+                return None
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        return None
+
+    async def _handle_request(
+        self,
+        method: str,
+        path: str,
+        headers: Dict[str, str],
+        writer: asyncio.StreamWriter,
+        keep_alive: bool
+    ) -> None:
+        self._stats["requests"] += 1
+        if method not in ('GET', 'HEAD'):
+            await self._respond(writer, 405, b'method not allowed', keep_alive=keep_alive)
+            return
+        
+        prefix = f"/img/{self._secret}/"
+        token = Path(path[len(prefix):].split('?', 1)[0]).stem if path.startswith(prefix) else ''
+        target = self._target(token)
+        if target is None:
+            self._stats["not_found"] += 1
+            await self._respond(writer, 404, b'not found', keep_alive=keep_alive)
+            return
+        
+        url, cookie = target
+        store = self.store
+        try:
+            blob = await _fetch_into_store(url, image_url_hash(url), _image_request_headers(cookie), store)
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.warning(f"图片代理获取失败 {url}: {str(e)}")
+            await self._respond(writer, 502, b'upstream error', keep_alive=keep_alive)
+            return
+        
+        etag = f'"{Path(blob).stem}"'
+        response_headers = {
+            "Content-Type": mimetypes.guess_type(blob)[0] or 'application/octet-stream',
+            "ETag": etag,
+            "Cache-Control": "private, max-age=86400",
+        }
+        if headers.get('if-none-match') == etag:
+            self._stats["not_modified"] += 1
+            await self._respond(writer, 304, b'', response_headers, keep_alive, head_only=True)
+            return
+        body = await get_export_writer().run(store.objects_dir.joinpath(blob).read_bytes)
+        self._stats["served"] += 1
+        await self._respond(writer, 200, body, response_headers, keep_alive, head_only=method == 'HEAD')
+
+    async def _respond(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        body: bytes,
+        headers: Optional[Dict[str, str]] = None,
+        keep_alive: bool = False,
+        head_only: bool = False
+    ) -> None:
+        reason = {200: "OK", 304: "Not Modified", 404: "Not Found", 405: "Method Not Allowed", 502: "Bad Gateway"}[status]
+        lines = [f"HTTP/1.1 {status} {reason}"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        if status != 304:
+            lines.append(f"Content-Length: {len(body)}")
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if not head_only:
+            writer.write(body)
+        await writer.drain()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回代理统计，用于观测"""
+        return {"url": self.base_url, "registered": len(self._targets), **self._stats}
+
+    async def close(self) -> None:
+        """关闭代理端点，删除私有临时存储并清空登记的地址"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        self._targets.clear()
+        if self._private_store is not None:
+            root = self._private_store.root
+            self._private_store = None
+            _image_indexes.pop(str(root.resolve()), None)
+            await asyncio.to_thread(shutil.rmtree, root, True)
+
+
+_image_proxy: Optional[ImageProxy] = None
+
+
+def get_image_proxy() -> ImageProxy:
+    """获取进程内共享的图片代理"""
+    global _image_proxy
+    if _image_proxy is None:
+        _image_proxy = ImageProxy()
+    return _image_proxy
+
+
+async def _proxy_image_urls(image_urls: Iterable[str], cookie: str) -> Dict[str, str]:
+    """将图片URL登记到本地代理，返回原始URL到代理地址的映射"""
+    proxy = get_image_proxy()
+    return {url: await proxy.url_for(url, cookie) for url in image_urls}
+
+
+# ==================== 数据提取函数 ====================
+class MainsiteScriptScanner:
+    """
+    增量定位 <script id="mainsite_server_content"> 的脚本内容
+
+    逐块feed页面文本，只在块边界附近的小窗口内做正则搜索，
+    找到结束标签后feed返回True，调用方即可停止读取剩余响应。
+    """
+
+    _OPEN_RE = re.compile(
+        r'<script\b[^>]*?\bid\s*=\s*["\']?mainsite_server_content(?=["\'\s>])[^>]*>',
+        re.IGNORECASE,
+    )
+    _CLOSE_RE = re.compile(r'</script', re.IGNORECASE)
+    # 跨块搜索时保留的上一块末尾长度（需覆盖完整的开始标签）
+    _OPEN_TAIL = 2048
+    _CLOSE_TAIL = len('</script') - 1
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._tail = ''
+        self._body: Optional[List[str]] = None
+        self._body_len = 0
+        self.result: Optional[str] = None
+
+    def feed(self, chunk: str) -> bool:
+        """
+        输入一块页面文本
+        
+        Returns:
+            已找到完整脚本内容时返回True
+        """
+        if self.result is not None:
+            return True
+        self._chunks.append(chunk)
+        if self._body is None:
+            window = self._tail + chunk
+            match = self._OPEN_RE.search(window)
+            if not match:
+                self._tail = window[-self._OPEN_TAIL:]
+                return False
+            self._body = []
+            self._tail = ''
+            chunk = window[match.end():]
+        return self._feed_body(chunk)
+
+    def _feed_body(self, chunk: str) -> bool:
+        window = self._tail + chunk
+        match = self._CLOSE_RE.search(window)
+        self._body.append(chunk)
+        if match:
+            end = self._body_len - len(self._tail) + match.start()
+            self.result = ''.join(self._body)[:end]
+            self._body = None
+            self._chunks = []
+            return True
+        self._body_len += len(chunk)
+        self._tail = window[-self._CLOSE_TAIL:]
+        return False
+
+    def text(self) -> str:
+        """已接收的完整页面文本（用于回退解析）"""
+        return ''.join(self._chunks)
+
+
+def _parse_mainsite_json(script_text: str) -> Dict[str, Any]:
+    """解析mainsite_server_content脚本中的JSON"""
+    try:
+        return json_loads(script_text.strip())
+    except json.JSONDecodeError as e:
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message=f"JSON解析失败: {str(e)}"
+        ))
+
+
+def _find_mainsite_script(html: str) -> Optional[str]:
+    """使用正则快速定位mainsite_server_content脚本内容，未找到时返回None"""
+    scanner = MainsiteScriptScanner()
+    scanner.feed(html)
+    return scanner.result
+
+
+def extract_mainsite_content(html: str) -> Dict[str, Any]:
+    """
+    从HTML中提取mainsite_server_content的JSON数据
+    
+    优先使用正则快速定位脚本，定位失败时回退到BeautifulSoup完整解析。
+    
+    Args:
+        html: HTML页面内容
+        
+    Returns:
+        解析后的JSON数据字典
+        
+    Raises:
+        McpError: 当无法找到或解析JSON数据时
+    """
+    script_text = _find_mainsite_script(html)
+    if script_text and script_text.strip():
+        return _parse_mainsite_json(script_text)
+    
+    soup = BeautifulSoup(html, 'html.parser')
+    script = soup.find('script', {'id': 'mainsite_server_content'})
+    
+    if not script or not script.string:
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message="未找到mainsite_server_content"
+        ))
+    
+    return _parse_mainsite_json(script.string)
+
+
+def extract_document_content(document_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    从document_data中提取文档内容
+    
+    Args:
+        document_data: 文档数据字典
+        
+    Returns:
+        文档内容字典，如果无法提取则返回None
+    """
+    if not document_data:
+        return None
+    
+    try:
+        # 方式1: 直接从JSON中获取content
+        content_str = document_data['data']['documentContent']['checkpoint']['content']
+        return json_loads(content_str)
+    except (KeyError, json.JSONDecodeError):
+        # 方式2: OSS加密存储（暂不支持完整解密）
+        return None
+
+
+def _element_text(elem: List[Any]) -> str:
+    """拼接元素（及其嵌套子元素）中的全部文本"""
+    parts: List[str] = []
+    stack = [iter(elem[2:])]
+    while stack:
+        for child in stack[-1]:
+            if isinstance(child, str):
+                parts.append(child)
+            elif isinstance(child, list) and len(child) >= 2:
+                stack.append(iter(child[2:]))
+                break
+        else:
+            stack.pop()
+    return ''.join(parts)
+
+
+def build_document_outline(content: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    预先计算文档大纲：每个标题（h1-h6）所在的顶层块下标及其章节范围
+    
+    章节从标题所在块开始，到下一个同级或更高级标题为止（不含），块下标按body顶层元素计数。
+    
+    Args:
+        content: 文档内容字典
+        
+    Returns:
+        {"blocks": 顶层块总数, "headings": [{"index", "end", "level", "text"}, ...]}，
+        没有文档主体时返回None
+    """
+    body = _main_body(content)
+    if body is None:
+        return None
+    headings: List[Dict[str, Any]] = []
+    # 尚未闭合的标题（级别递增），遇到同级或更高级标题时闭合
+    open_headings: List[Dict[str, Any]] = []
+    total = max(len(body) - 2, 0)
+    for index in range(total):
+        item = body[index + 2]
+        if not isinstance(item, list) or len(item) < 2:
+            continue
+        level = HEADING_LEVELS.get(item[0])
+        if level is None:
+            continue
+        while open_headings and open_headings[-1]["level"] >= level:
+            open_headings.pop()["end"] = index
+        heading = {"index": index, "end": total, "level": level, "text": _element_text(item).strip()}
+        headings.append(heading)
+        open_headings.append(heading)
+    return {"blocks": total, "headings": headings}
+
+
+def extract_dentry_key(mainsite_content: Dict[str, Any]) -> str:
+    """
+    从mainsite_content中提取dentryKey
+    
+    Args:
+        mainsite_content: mainsite内容字典
+        
+    Returns:
+        dentryKey字符串
+        
+    Raises:
+        McpError: 当无法找到dentryKey时
+    """
+    # 尝试从dentryInfo中获取
+    if 'dentryInfo' in mainsite_content and 'data' in mainsite_content['dentryInfo']:
+        dentry_key = mainsite_content['dentryInfo']['data'].get('dentryKey')
+        if dentry_key:
+            return dentry_key
+    
+    # 尝试从data中获取nodeId
+    dentry_key = mainsite_content.get('data', {}).get('nodeId')
+    if dentry_key:
+        return dentry_key
+    
+    raise McpError(ErrorData(
+        code=INTERNAL_ERROR,
+        message="未找到dentryKey或nodeId"
+    ))
+
+
+# ==================== HTML解析函数 ====================
+def parse_code_block(code_elem: List[Any]) -> str:
+    """
+    解析代码块元素
+    
+    Args:
+        code_elem: 代码块元素列表
+        
+    Returns:
+        HTML格式的代码块字符串
+    """
+    if not isinstance(code_elem, list) or len(code_elem) < 2 or code_elem[0] != 'code':
+        return ''
+    
+    attrs = code_elem[1] if len(code_elem) > 1 else {}
+    syntax = attrs.get('syntax', 'text/plain')
+    code = attrs.get('code', '')
+    
+    if not code:
+        return ''
+    
+    # 获取语言标识
+    language = CODE_LANGUAGE_MAP.get(syntax, syntax.replace('text/x-', '').replace('text/', ''))
+    code_escaped = html_module.escape(code)
+    
+    return f'''<div class="code-block">
+    <div class="code-header">
+        <span class="code-language">{language}</span>
+        <button class="code-copy" onclick="copyCode(this)" title="复制代码">📋 复制</button>
+    </div>
+    <pre><code class="language-{language}">{code_escaped}</code></pre>
+</div>'''
+
+
+def parse_text_style(style_obj: Dict[str, Any]) -> str:
+    """
+    解析文本样式
+    
+    Args:
+        style_obj: 样式对象字典
+        
+    Returns:
+        CSS样式字符串
+    """
+    styles = []
+    if style_obj.get('bold'):
+        styles.append('font-weight: bold')
+    if style_obj.get('color'):
+        styles.append(f'color: {style_obj["color"]}')
+    if style_obj.get('sz') and style_obj.get('szUnit'):
+        styles.append(f'font-size: {style_obj["sz"]}{style_obj["szUnit"]}')
+    return '; '.join(styles) if styles else ''
+
+
+def parse_span(span_elem: List[Any]) -> str:
+    """
+    解析span元素
+    
+    Args:
+        span_elem: span元素列表
+        
+    Returns:
+        HTML格式的span字符串
+    """
+    if not isinstance(span_elem, list) or len(span_elem) < 2 or span_elem[0] != 'span':
+        return ''
+    
+    html_parts: List[str] = []
+    HtmlRenderer.emit_span(span_elem, html_parts)
+    return ''.join(html_parts)
+
+
+def collect_image_urls(content: Dict[str, Any]) -> set:
+    """
+    收集文档中所有图片URL
+    
+    Args:
+        content: 文档内容字典
+        
+    Returns:
+        图片URL集合
+    """
+    image_urls = set()
+    
+    if content:
+        main_key = content.get('main')
+        if main_key:
+            parts = content.get('parts', {})
+            main_part = parts.get(main_key, {})
+            data = main_part.get('data', {})
+            body = data.get('body', [])
+            # 显式栈遍历，深度嵌套的文档不会触发递归深度限制；只有列表和字典会入栈
+            stack = [body] if isinstance(body, (list, dict)) else []
+            push = stack.append
+            while stack:
+                elem = stack.pop()
+                if isinstance(elem, list):
+                    if len(elem) > 1 and elem[0] == 'img':
+                        attrs = elem[1] if isinstance(elem[1], dict) else {}
+                        src = attrs.get('src', '')
+                        if src:
+                            # 构建完整URL
+                            if not src.startswith('http'):
+                                src = f'{BASE_URL}{src}'
+                            image_urls.add(src)
+                        continue
+                    children = elem
+                else:
+                    children = elem.values()
+                for child in children:
+                    if isinstance(child, (list, dict)):
+                        push(child)
+    
+    return image_urls
+
+
+def parse_image(img_elem: List[Any], image_url_map: Optional[Dict[str, str]] = None) -> str:
+    """
+    解析图片元素
+    
+    Args:
+        img_elem: 图片元素列表
+        image_url_map: 图片URL到本地路径的映射
+        
+    Returns:
+        HTML格式的图片字符串
+    """
+    if not isinstance(img_elem, list) or len(img_elem) < 2 or img_elem[0] != 'img':
+        return ''
+    
+    attrs = img_elem[1] if len(img_elem) > 1 else {}
+    src = attrs.get('src', '')
+    name = attrs.get('name', '图片')
+    width = attrs.get('width', 'auto')
+    
+    if not src:
+        return f'<p style="color: #999;">[图片: {name}]</p>'
+    
+    # 构建完整URL用于查找映射
+    original_src = src
+    if not src.startswith('http'):
+        full_url = f'{BASE_URL}{src}'
+    else:
+        full_url = src
+    
+    # 如果有映射，使用本地路径
+    if image_url_map and full_url in image_url_map:
+        src = image_url_map[full_url]
+    else:
+        # 如果没有映射，说明图片下载失败或未下载
+        # 使用原始URL（可能需要Cookie，浏览器可能无法显示）
+        if not src.startswith('http'):
+            src = f'{BASE_URL}{original_src}'
+        # 如果下载失败且有映射表（说明尝试过下载），显示提示
+        if image_url_map is not None:
+            return f'<div class="image-container"><p style="color: #999; padding: 1rem; border: 1px dashed #ddd; border-radius: 4px;">[图片下载失败: {name}]<br><small>原始链接: <a href="{src}" target="_blank">{src[:50]}...</a></small></p></div>'
+    
+    return f'<div class="image-container"><img src="{src}" alt="{name}" style="max-width: {width}px; height: auto;" loading="lazy" /></div>'
+
+
+# ==================== HTML渲染器 ====================
+# 图片占位符：\0IMG<图片属性JSON>\0。JSON会转义控制字符，属性中不会出现\0
+_IMAGE_PLACEHOLDER_RE = re.compile('\x00IMG(.*?)\x00', re.S)
+_IMAGE_PLACEHOLDER_ATTRS = ('src', 'name', 'width')
+
+
+def image_placeholder(img_elem: List[Any]) -> str:
+    """
+    生成图片占位符，占位符中保存了渲染该图片所需的全部属性
+    
+    Args:
+        img_elem: 图片元素列表
+        
+    Returns:
+        占位符字符串
+    """
+    attrs = img_elem[1]
+    kept = {key: attrs[key] for key in _IMAGE_PLACEHOLDER_ATTRS if key in attrs}
+    return '\x00IMG' + json_dumps(kept).decode('utf-8') + '\x00'
+
+
+def resolve_image_placeholders(html: str, image_url_map: Optional[Dict[str, str]]) -> str:
+    """
+    将HTML中的图片占位符一次性替换为最终的图片HTML
+    
+    Args:
+        html: 以占位符渲染的HTML
+        image_url_map: 图片URL到本地路径的映射
+        
+    Returns:
+        与直接使用image_url_map渲染相同的HTML
+    """
+    rendered: Dict[str, str] = {}
+    
+    def _replace(match: "re.Match[str]") -> str:
+        token = match.group(1)
+        image_html = rendered.get(token)
+        if image_html is None:
+            image_html = rendered[token] = parse_image(['img', json_loads(token)], image_url_map)
+        return image_html
+    
+    return _IMAGE_PLACEHOLDER_RE.sub(_replace, html)
+
+
+class HtmlRenderer:
+    """
+    文档body到HTML的单遍渲染器
+
+    标签到处理方法的分派表在类定义时构建一次；span嵌套使用显式栈遍历，
+    不受Python递归深度限制。所有片段追加到同一个输出列表，最后只做一次join。
+    图片和代码块复用 parse_image / parse_code_block。
+    """
+
+    _TABLE_OPEN = '<div class="table-container">\n    <table class="doc-table">\n        '
+    _TABLE_CLOSE = '\n    </table>\n</div>'
+
+    def __init__(self, image_url_map: Optional[Dict[str, str]] = None, image_placeholders: bool = False):
+        self.image_url_map = image_url_map
+        self.image_placeholders = image_placeholders
+
+    def _image_html(self, img_elem: List[Any]) -> str:
+        if self.image_placeholders and len(img_elem) >= 2:
+            return image_placeholder(img_elem)
+        return parse_image(img_elem, self.image_url_map)
+
+    def render_body(self, body: List[Any]) -> str:
+        """
+        渲染文档body的顶层元素
+        
+        Args:
+            body: 文档body列表（前两项为标签和属性）
+            
+        Returns:
+            HTML片段，顶层元素之间以换行分隔
+        """
+        out: List[str] = []
+        self.emit_body(body, out)
+        return ''.join(out)
+
+    def emit_body(self, body: List[Any], out: List[str]) -> None:
+        """将body的顶层元素逐个渲染并追加到out"""
+        handlers = self._handlers
+        for item in body[2:]:
+            if not isinstance(item, list) or len(item) == 0:
+                continue
+            handler = handlers.get(item[0])
+            if handler is None:
+                continue
+            start = len(out)
+            if start:
+                out.append('\n')
+            if not handler(self, item, out):
+                # 元素没有产生内容：撤销前面的分隔符
+                del out[start:]
+
+    def iter_body(self, body: List[Any]) -> Iterator[str]:
+        """
+        逐块渲染文档body，每次产出一个顶层元素的HTML（含前导换行分隔符）
+        
+        Args:
+            body: 文档body列表（前两项为标签和属性）
+        """
+        handlers = self._handlers
+        out: List[str] = []
+        separator = ''
+        for item in body[2:]:
+            if not isinstance(item, list) or len(item) == 0:
+                continue
+            handler = handlers.get(item[0])
+            if handler is None:
+                continue
+            if handler(self, item, out):
+                yield separator + ''.join(out)
+                separator = '\n'
+            out.clear()
+
+    def _emit_inline_children(self, elem: List[Any], out: List[str]) -> bool:
+        """渲染段落/标题的行内子元素，返回是否产生了非空白内容"""
+        mark = len(out)
+        for i in range(2, len(elem)):
+            child = elem[i]
+            if isinstance(child, list) and len(child) > 0:
+                if child[0] == 'img':
+                    out.append(self._image_html(child))
+                else:
+                    self.emit_span(child, out)
+            elif isinstance(child, str):
+                out.append(child)
+        return bool(''.join(out[mark:]).strip())
+
+    def _emit_paragraph(self, para_elem: List[Any], out: List[str]) -> bool:
+        if len(para_elem) < 2:
+            return False
+        out.append('<p>')
+        mark = len(out)
+        if not self._emit_inline_children(para_elem, out):
+            del out[mark:]
+            out.append('&nbsp;')
+        out.append('</p>')
+        return True
+
+    def _emit_heading(self, heading_elem: List[Any], out: List[str]) -> bool:
+        if len(heading_elem) < 2:
+            return False
+        tag = heading_elem[0]
+        out.append(f'<{tag}>')
+        # 空标题不输出（调用方撤销已追加的片段）
+        if not self._emit_inline_children(heading_elem, out):
+            return False
+        out.append(f'</{tag}>')
+        return True
+
+    def _emit_image(self, img_elem: List[Any], out: List[str]) -> bool:
+        html = self._image_html(img_elem)
+        out.append(html)
+        return bool(html)
+
+    def _emit_code(self, code_elem: List[Any], out: List[str]) -> bool:
+        html = parse_code_block(code_elem)
+        out.append(html)
+        return bool(html)
+
+    def _emit_table(self, table_elem: List[Any], out: List[str]) -> bool:
+        if len(table_elem) < 2:
+            return False
+        start = len(out)
+        out.append(self._TABLE_OPEN)
+        has_rows = False
+        for i in range(2, len(table_elem)):
+            child = table_elem[i]
+            if isinstance(child, list) and len(child) > 0 and child[0] == 'tr':
+                has_rows = self._emit_table_row(child, out) or has_rows
+        if not has_rows:
+            del out[start:]
+            return False
+        out.append(self._TABLE_CLOSE)
+        return True
+
+    def _emit_table_row(self, tr_elem: List[Any], out: List[str]) -> bool:
+        if len(tr_elem) < 2:
+            return False
+        start = len(out)
+        out.append('<tr>')
+        has_cells = False
+        for i in range(2, len(tr_elem)):
+            child = tr_elem[i]
+            if isinstance(child, list) and len(child) > 0 and child[0] == 'tc' and len(child) >= 2:
+                self._emit_table_cell(child, out)
+                has_cells = True
+        if not has_cells:
+            del out[start:]
+            return False
+        out.append('</tr>')
+        return True
+
+    def _emit_table_cell(self, tc_elem: List[Any], out: List[str]) -> None:
+        attrs = tc_elem[1]
+        row_span = attrs.get('rowSpan', 1)
+        col_span = attrs.get('colSpan', 1)
+        fill = attrs.get('fill', '')
+        v_align = attrs.get('vAlign', 'top')
+        
+        styles = []
+        if fill:
+            styles.append(f'background-color: {fill}')
+        if v_align:
+            styles.append(f'vertical-align: {v_align}')
+        
+        style_str = f' style="{"; ".join(styles)}"' if styles else ''
+        rowspan_attr = f' rowspan="{row_span}"' if row_span > 1 else ''
+        colspan_attr = f' colspan="{col_span}"' if col_span > 1 else ''
+        out.append(f'<td{rowspan_attr}{colspan_attr}{style_str}>')
+        
+        has_paragraphs = False
+        for i in range(2, len(tc_elem)):
+            child = tc_elem[i]
+            if isinstance(child, list) and len(child) > 0 and child[0] == 'p':
+                if has_paragraphs:
+                    out.append('<br>')
+                has_paragraphs = True
+                for j in range(2, len(child)):
+                    p_child = child[j]
+                    if isinstance(p_child, list):
+                        self.emit_span(p_child, out)
+                    elif isinstance(p_child, str):
+                        out.append(p_child)
+        if not has_paragraphs:
+            out.append('&nbsp;')
+        out.append('</td>')
+
+    @staticmethod
+    def emit_span(span_elem: List[Any], out: List[str]) -> None:
+        """
+        渲染span及其嵌套的子span（显式栈遍历）
+        
+        Args:
+            span_elem: span元素列表
+            out: 输出片段列表
+        """
+        if not isinstance(span_elem, list) or len(span_elem) < 2 or span_elem[0] != 'span':
+            return
+        append = out.append
+        # 进入子span时把父span的 (元素, 下一个子元素下标, 样式) 压栈，子span处理完后恢复
+        stack: List[Tuple[List[Any], int, Optional[str]]] = []
+        node, i, style = span_elem, 2, None
+        while True:
+            n = len(node)
+            while i < n:
+                child = node[i]
+                i += 1
+                if isinstance(child, str):
+                    text = child.replace('\n', '<br>')
+                    if text:
+                        if style is None:
+                            style = parse_text_style(node[1])
+                        append(f'<span style="{style}">{text}</span>' if style else text)
+                elif isinstance(child, list) and len(child) >= 2 and child[0] == 'span':
+                    stack.append((node, i, style))
+                    node, i, style, n = child, 2, None, len(child)
+            if not stack:
+                return
+            node, i, style = stack.pop()
+
+    # 处理方法把HTML追加到输出列表，返回是否产生了内容
+    _handlers: Dict[str, Callable[["HtmlRenderer", List[Any], List[str]], bool]] = {
+        'table': _emit_table,
+        'code': _emit_code,
+        'p': _emit_paragraph,
+        'img': _emit_image,
+        **dict.fromkeys(HEADING_LEVELS, _emit_heading),
+    }
+
+
+# ==================== HTML生成函数 ====================
+def _html_document_head(doc_title: str) -> str:
+    """HTML页面模板中正文之前的部分（含样式与脚本）"""
+    return f"""<!DOCTYPE html>
+<html lang="zh-CN">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{doc_title}</title>
+    <style>
+        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
+        body {{
+            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'PingFang SC', sans-serif;
+            line-height: 1.6;
+            color: #333;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            min-height: 100vh;
+            padding: 2rem;
+        }}
+        .container {{ max-width: 900px; margin: 0 auto; background: white; border-radius: 12px; 
+                      box-shadow: 0 20px 60px rgba(0, 0, 0, 0.3); overflow: hidden; }}
+        .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; 
+                   padding: 2rem; text-align: center; }}
+        .header h1 {{ font-size: 2rem; font-weight: 600; margin-bottom: 0.5rem; }}
+        .content {{ padding: 2rem 3rem; }}
+        .content p {{ margin-bottom: 1rem; font-size: 1rem; line-height: 1.8; }}
+        .content h1, .content h2, .content h3, .content h4, .content h5, .content h6 {{
+            margin: 1.5rem 0 1rem; line-height: 1.4; color: #222; }}
+        .table-container {{ margin: 1.5rem 0; overflow-x: auto; }}
+        .doc-table {{ width: 100%; border-collapse: collapse; margin: 1rem 0; background: white; 
+                      box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
+        .doc-table td {{ border: 1px solid #ddd; padding: 0.75rem; font-size: 0.95rem; }}
+        .doc-table tr:hover {{ background-color: #f5f5f5; }}
+        .image-container {{ margin: 1.5rem 0; text-align: center; }}
+        .image-container img {{ max-width: 100%; height: auto; border-radius: 8px; 
+                                box-shadow: 0 4px 12px rgba(0,0,0,0.15); }}
+        .code-block {{ margin: 1.5rem 0; border-radius: 8px; overflow: hidden; background: #282c34; 
+                       box-shadow: 0 4px 12px rgba(0,0,0,0.15); }}
+        .code-header {{ background: #21252b; padding: 0.5rem 1rem; display: flex; 
+                        justify-content: space-between; align-items: center; }}
+        .code-language {{ color: #61dafb; font-size: 0.85rem; font-weight: 600; text-transform: uppercase; }}
+        .code-copy {{ background: #61dafb; color: #282c34; border: none; padding: 0.25rem 0.75rem; 
+                      border-radius: 4px; cursor: pointer; font-size: 0.85rem; }}
+        .code-copy:hover {{ background: #4fa8c5; }}
+        .code-block pre {{ margin: 0; padding: 1rem; overflow-x: auto; background: #282c34; }}
+        .code-block code {{ font-family: 'Monaco', 'Menlo', 'Consolas', monospace; font-size: 0.9rem; 
+                            line-height: 1.6; color: #abb2bf; display: block; white-space: pre; }}
+        .footer {{ text-align: center; padding: 1.5rem; background: #f8f9fa; color: #666; 
+                   font-size: 0.85rem; border-top: 1px solid #e9ecef; }}
+    </style>
+    <script>
+        function copyCode(button) {{
+            const codeBlock = button.closest('.code-block');
+            const code = codeBlock.querySelector('code').textContent;
+            navigator.clipboard.writeText(code).then(() => {{
+                const originalText = button.textContent;
+                button.textContent = '✓ 已复制';
+                button.style.background = '#52c41a';
+                setTimeout(() => {{
+                    button.textContent = originalText;
+                    button.style.background = '#61dafb';
+                }}, 2000);
+            }});
+        }}
+    </script>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>{doc_title}</h1>
+            <div class="meta">钉钉文档内容解析</div>
+        </div>
+        <div class="content">
+"""
+
+
+_HTML_DOCUMENT_FOOTER = """
+        </div>
+        <div class="footer">
+            由钉钉文档解析MCP服务生成 | Powered by Python
+        </div>
+    </div>
+</body>
+</html>"""
+
+
+def generate_html_from_content(
+    content: Dict[str, Any], 
+    doc_title: str = "钉钉文档",
+    image_url_map: Optional[Dict[str, str]] = None,
+    image_placeholders: bool = False
+) -> Optional[str]:
+    """
+    从content生成HTML
+    
+    Args:
+        content: 文档内容字典
+        doc_title: 文档标题
+        image_url_map: 图片URL到本地路径的映射
+        image_placeholders: 是否以占位符代替图片（之后由resolve_image_placeholders替换）
+        
+    Returns:
+        HTML字符串，如果无法生成则返回None
+        
+    Raises:
+        McpError: 当生成HTML失败时
+    """
+    if not content:
+        return None
+    
+    try:
+        main_key = content.get('main')
+        if not main_key:
+            return None
+        
+        parts = content.get('parts', {})
+        main_part = parts.get(main_key, {})
+        data = main_part.get('data', {})
+        body = data.get('body', [])
+        
+        content_html = HtmlRenderer(image_url_map, image_placeholders).render_body(body)
+        
+        return _html_document_head(doc_title) + content_html + _HTML_DOCUMENT_FOOTER
+        
+    except Exception as e:
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message=f"生成HTML失败: {str(e)}"
+        ))
+
+
+def iter_html_from_content(
+    content: Dict[str, Any],
+    doc_title: str = "钉钉文档",
+    image_url_map: Optional[Dict[str, str]] = None
+) -> Optional[Iterator[str]]:
+    """
+    从content流式生成HTML：依次产出模板头部、每个正文块和页脚
+    
+    拼接所有片段的结果与generate_html_from_content完全相同，
+    但任意时刻只持有一个正文块，适合直接写入文件。
+    
+    Args:
+        content: 文档内容字典
+        doc_title: 文档标题
+        image_url_map: 图片URL到本地路径的映射
+        
+    Returns:
+        HTML片段迭代器，如果无法生成则返回None
+        
+    Raises:
+        McpError: 迭代过程中生成HTML失败时
+    """
+    if not content or not content.get('main'):
+        return None
+    
+    def _chunks() -> Iterator[str]:
+        try:
+            parts = content.get('parts', {})
+            main_part = parts.get(content['main'], {})
+            data = main_part.get('data', {})
+            body = data.get('body', [])
+            
+            yield _html_document_head(doc_title)
+            yield from HtmlRenderer(image_url_map).iter_body(body)
+            yield _HTML_DOCUMENT_FOOTER
+        except McpError:
+            raise
+        except Exception as e:
+            raise McpError(ErrorData(
+                code=INTERNAL_ERROR,
+                message=f"生成HTML失败: {str(e)}"
+            ))
+    
+    return _chunks()
+
+
+# ==================== Markdown/纯文本生成函数 ====================
+class MarkdownRenderer:
+    """
+    文档body到Markdown的渲染器
+
+    与HtmlRenderer遍历同一棵body树：标签分派表在类定义时构建一次，span嵌套使用显式栈遍历。
+    只保留内容和必要的结构（标题、粗体、图片、代码块、表格），不输出任何样式。
+    正文标题保留文档中的级别（h1 → #），与get_section返回的大纲一致。
+    """
+
+    BLOCK_SEPARATOR = '\n\n'
+
+    def __init__(self, image_url_map: Optional[Dict[str, str]] = None):
+        self.image_url_map = image_url_map
+
+    def render(self, body: List[Any], doc_title: str) -> str:
+        """渲染标题和正文"""
+        body_text = self.render_body(body)
+        title = self._title(doc_title)
+        return f"{title}{self.BLOCK_SEPARATOR}{body_text}" if body_text else title
+
+    def render_body(self, body: List[Any]) -> str:
+        """渲染文档body的顶层元素，块之间以空行分隔"""
+        return self.BLOCK_SEPARATOR.join(self._body_blocks(body))
+
+    def iter_blocks(self, body: List[Any], doc_title: str) -> Iterator[str]:
+        """
+        逐块渲染：先产出标题，再产出每个正文块（含前导分隔符），拼接结果与render相同
+        
+        Args:
+            body: 文档body列表（前两项为标签和属性）
+            doc_title: 文档标题
+        """
+        yield self._title(doc_title)
+        for block in self._body_blocks(body):
+            yield self.BLOCK_SEPARATOR + block
+
+    def _body_blocks(self, body: List[Any]) -> Iterator[str]:
+        handlers = self._handlers
+        for item in body[2:]:
+            if not isinstance(item, list) or len(item) < 2:
+                continue
+            handler = handlers.get(item[0])
+            if handler is None:
+                continue
+            block = handler(self, item)
+            if block:
+                yield block
+
+    def _title(self, doc_title: str) -> str:
+        return f"# {doc_title}"
+
+    def _paragraph(self, para_elem: List[Any]) -> str:
+        parts: List[str] = []
+        for i in range(2, len(para_elem)):
+            child = para_elem[i]
+            if isinstance(child, list) and len(child) > 0:
+                if child[0] == 'img':
+                    if len(child) >= 2:
+                        parts.append(self._image(child))
+                else:
+                    self.emit_inline(child, parts)
+            elif isinstance(child, str):
+                parts.append(child)
+        return ''.join(parts).strip()
+
+    def _heading(self, heading_elem: List[Any]) -> str:
+        # 标题只能占一行
+        text = ' '.join(self._paragraph(heading_elem).split('\n'))
+        if not text:
+            return ''
+        return self._heading_line(HEADING_LEVELS[heading_elem[0]], text)
+
+    def _heading_line(self, level: int, text: str) -> str:
+        return f"{'#' * level} {text}"
+
+    def _image_src(self, attrs: Dict[str, Any]) -> str:
+        src = attrs.get('src', '')
+        full_url = src if src.startswith('http') else f'{BASE_URL}{src}'
+        if self.image_url_map and full_url in self.image_url_map:
+            return self.image_url_map[full_url]
+        return full_url
+
+    def _image(self, img_elem: List[Any]) -> str:
+        attrs = img_elem[1]
+        name = attrs.get('name', '图片')
+        if not attrs.get('src'):
+            return f"[图片: {name}]"
+        return f"![{name}]({self._image_src(attrs)})"
+
+    def _code(self, code_elem: List[Any]) -> str:
+        attrs = code_elem[1]
+        code = attrs.get('code', '')
+        if not code:
+            return ''
+        syntax = attrs.get('syntax', 'text/plain')
+        language = CODE_LANGUAGE_MAP.get(syntax, syntax.replace('text/x-', '').replace('text/', ''))
+        fence = '~~~~' if '```' in code else '```'
+        return f"{fence}{language}\n{code.rstrip(chr(10))}\n{fence}"
+
+    def _table_rows(self, table_elem: List[Any]) -> List[List[str]]:
+        rows = []
+        for tr in table_elem[2:]:
+            if not (isinstance(tr, list) and len(tr) >= 2 and tr[0] == 'tr'):
+                continue
+            cells = []
+            for tc in tr[2:]:
+                if not (isinstance(tc, list) and len(tc) >= 2 and tc[0] == 'tc'):
+                    continue
+                paragraphs = []
+                for p in tc[2:]:
+                    if isinstance(p, list) and len(p) > 0 and p[0] == 'p':
+                        parts: List[str] = []
+                        for p_child in p[2:]:
+                            if isinstance(p_child, list):
+                                self.emit_inline(p_child, parts)
+                            elif isinstance(p_child, str):
+                                parts.append(p_child)
+                        paragraphs.append(''.join(parts).strip())
+                cells.append(self._cell_text(paragraphs))
+            if cells:
+                rows.append(cells)
+        return rows
+
+    def _cell_text(self, paragraphs: List[str]) -> str:
+        text = '<br>'.join(p for p in paragraphs if p)
+        return text.replace('|', '\\|').replace('\n', '<br>')
+
+    def _table(self, table_elem: List[Any]) -> str:
+        rows = self._table_rows(table_elem)
+        if not rows:
+            return ''
+        width = max(len(row) for row in rows)
+        lines = []
+        for i, row in enumerate(rows):
+            row = row + [''] * (width - len(row))
+            lines.append('| ' + ' | '.join(row) + ' |')
+            if i == 0:
+                lines.append('|' + ' --- |' * width)
+        return '\n'.join(lines)
+
+    def _styled(self, text: str, attrs: Dict[str, Any]) -> str:
+        if not attrs.get('bold'):
+            return text
+        # 粗体标记不能跨行，也不能紧贴空白
+        lines = []
+        for line in text.split('\n'):
+            core = line.strip()
+            if core:
+                start = line.index(core)
+                line = f"{line[:start]}**{core}**{line[start + len(core):]}"
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def emit_inline(self, span_elem: List[Any], out: List[str]) -> None:
+        """
+        将span及其嵌套的子span渲染为行内文本（显式栈遍历）
+        
+        Args:
+            span_elem: span元素列表
+            out: 输出片段列表
+        """
+        if not isinstance(span_elem, list) or len(span_elem) < 2 or span_elem[0] != 'span':
+            return
+        stack: List[Tuple[List[Any], int]] = []
+        node, i = span_elem, 2
+        while True:
+            n = len(node)
+            while i < n:
+                child = node[i]
+                i += 1
+                if isinstance(child, str):
+                    if child:
+                        attrs = node[1]
+                        out.append(self._styled(child, attrs) if isinstance(attrs, dict) else child)
+                elif isinstance(child, list) and len(child) >= 2 and child[0] == 'span':
+                    stack.append((node, i))
+                    node, i, n = child, 2, len(child)
+            if not stack:
+                return
+            node, i = stack.pop()
+
+    _handlers: Dict[str, Callable[["MarkdownRenderer", List[Any]], str]] = {
+        'table': lambda self, elem: self._table(elem),
+        'code': lambda self, elem: self._code(elem),
+        'p': lambda self, elem: self._paragraph(elem),
+        'img': lambda self, elem: self._image(elem),
+        **dict.fromkeys(HEADING_LEVELS, lambda self, elem: self._heading(elem)),
+    }
+
+
+class TextRenderer(MarkdownRenderer):
+    """
+    文档body到纯文本的渲染器：去掉所有标记，表格按制表符分列，图片只保留名称
+    """
+
+    def _title(self, doc_title: str) -> str:
+        return doc_title
+
+    def _heading_line(self, level: int, text: str) -> str:
+        return text
+
+    def _image(self, img_elem: List[Any]) -> str:
+        return f"[图片: {img_elem[1].get('name', '图片')}]"
+
+    def _code(self, code_elem: List[Any]) -> str:
+        return code_elem[1].get('code', '').rstrip('\n')
+
+    def _cell_text(self, paragraphs: List[str]) -> str:
+        return ' '.join(p for p in paragraphs if p).replace('\t', ' ').replace('\n', ' ')
+
+    def _table(self, table_elem: List[Any]) -> str:
+        return '\n'.join('\t'.join(row) for row in self._table_rows(table_elem))
+
+    def _styled(self, text: str, attrs: Dict[str, Any]) -> str:
+        return text
+
+
+def _main_body(content: Dict[str, Any]) -> Optional[List[Any]]:
+    """获取文档主体的body树，没有主体时返回None"""
+    main_key = content.get('main') if content else None
+    if not main_key:
+        return None
+    parts = content.get('parts', {})
+    main_part = parts.get(main_key, {})
+    data = main_part.get('data', {})
+    return data.get('body', [])
+
+
+def generate_markdown_from_content(
+    content: Dict[str, Any],
+    doc_title: str = "钉钉文档",
+    image_url_map: Optional[Dict[str, str]] = None
+) -> Optional[str]:
+    """
+    从content生成Markdown
+    
+    Args:
+        content: 文档内容字典
+        doc_title: 文档标题
+        image_url_map: 图片URL到本地路径的映射
+        
+    Returns:
+        Markdown字符串，如果无法生成则返回None
+        
+    Raises:
+        McpError: 当生成失败时
+    """
+    return _render_text_format(MarkdownRenderer(image_url_map), content, doc_title, "Markdown")
+
+
+def generate_text_from_content(
+    content: Dict[str, Any],
+    doc_title: str = "钉钉文档",
+    image_url_map: Optional[Dict[str, str]] = None
+) -> Optional[str]:
     """
-    解析代码块元素
+    从content生成纯文本
     
     Args:
-        code_elem: 代码块元素列表
+        content: 文档内容字典
+        doc_title: 文档标题
+        image_url_map: 图片URL到本地路径的映射（纯文本中不使用，保留参数以便与其他格式统一调用）
         
     Returns:
-        HTML格式的代码块字符串
+        纯文本字符串，如果无法生成则返回None
+        
+    Raises:
+        McpError: 当生成失败时
     """
-    if not isinstance(code_elem, list) or len(code_elem) < 2 or code_elem[0] != 'code':
-        return ''
-    
-    attrs = code_elem[1] if len(code_elem) > 1 else {}
-    syntax = attrs.get('syntax', 'text/plain')
-    code = attrs.get('code', '')
-    
-    if not code:
-        return ''
-    
-    # 获取语言标识
-    language = CODE_LANGUAGE_MAP.get(syntax, syntax.replace('text/x-', '').replace('text/', ''))
-    code_escaped = html_module.escape(code)
+    return _render_text_format(TextRenderer(image_url_map), content, doc_title, "纯文本")
+
+
+def _render_text_format(renderer: MarkdownRenderer, content: Dict[str, Any], doc_title: str, label: str) -> Optional[str]:
+    body = _main_body(content)
+    if body is None:
+        return None
+    try:
+        return renderer.render(body, doc_title)
+    except Exception as e:
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message=f"生成{label}失败: {str(e)}"
+        ))
+
+
+# 输出格式 → 生成函数
+OUTPUT_RENDERERS: Dict[str, Callable[..., Optional[str]]] = {
+    "html": generate_html_from_content,
+    "markdown": generate_markdown_from_content,
+    "text": generate_text_from_content,
+}
+OUTPUT_FORMAT_LABELS = {"html": "HTML", "markdown": "Markdown", "text": "纯文本"}
+
+# 各输出格式返回给客户端的次数与字节数
+_output_size_stats: Dict[str, Dict[str, int]] = {}
+
+
+def record_output_size(output_format: str, size: int) -> None:
+    """记录一次输出的大小（字节）"""
+    stats = _output_size_stats.setdefault(output_format, {"responses": 0, "bytes": 0})
+    stats["responses"] += 1
+    stats["bytes"] += size
+
+
+def output_size_snapshot() -> Dict[str, Dict[str, Any]]:
+    """各输出格式的累计大小与平均大小"""
+    return {
+        output_format: {**stats, "avg_bytes": stats["bytes"] // stats["responses"]}
+        for output_format, stats in _output_size_stats.items()
+    }
+
+
+# ==================== 渲染结果缓存 ====================
+def document_content_key(dentry_key: str, version: str) -> str:
+    """
+    文档内容的缓存标识：dentryKey + checkpoint版本
     
-    return f'''<div class="code-block">
-    <div class="code-header">
-        <span class="code-language">{language}</span>
-        <button class="code-copy" onclick="copyCode(this)" title="复制代码">📋 复制</button>
-    </div>
-    <pre><code class="language-{language}">{code_escaped}</code></pre>
-</div>'''
+    两者都在获取文档时已经得到，用作渲染缓存键时无需再序列化整棵内容树。
+    """
+    return f"{dentry_key}@{version}"
 
 
-def parse_text_style(style_obj: Dict[str, Any]) -> str:
+def _render_cache_key(
+    content_key: str,
+    doc_title: str,
+    image_url_map: Optional[Dict[str, str]],
+    image_placeholders: bool = False,
+    output_format: str = "html",
+) -> str:
+    """根据内容标识、标题、图片映射和输出格式计算渲染缓存键"""
+    digest = hashlib.sha256(f"v{RENDERER_VERSION}\0".encode())
+    if image_placeholders:
+        digest.update(b'placeholders\0')
+    if output_format != "html":
+        digest.update(output_format.encode() + b'\0')
+    digest.update(content_key.encode())
+    digest.update(b'\0')
+    digest.update(doc_title.encode())
+    digest.update(b'\0')
+    if image_url_map is None:
+        digest.update(b'-')
+    else:
+        digest.update(json_dumps(image_url_map, sort_keys=True))
+    return digest.hexdigest()
+
+
+class RenderCache:
     """
-    解析文本样式
+    HTML渲染结果缓存：按字节数限制的内存LRU，可选磁盘持久化（同样按字节数限制）
+
+    键为内容标识（dentryKey + checkpoint版本）、标题和图片映射的hash，
+    内容相同的重复渲染只需一次查找。磁盘缓存超过上限时按最近使用时间淘汰最旧的文件。
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = RENDER_CACHE_MAX_BYTES,
+        disk_dir: Optional[Path] = None,
+        disk_max_bytes: int = RENDER_CACHE_DISK_MAX_BYTES
+    ):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._lru: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._bytes = 0
+        # 磁盘缓存占用的字节数（首次写入时扫描目录得到）；磁盘写入在写入线程中执行
+        self._disk_bytes: Optional[int] = None
+        self._disk_lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}.html"
+
+    def _remember(self, key: str, html: str, size: int) -> None:
+        if size > self.max_bytes:
+            return
+        if key in self._lru:
+            self._bytes -= self._lru.pop(key)[1]
+        self._lru[key] = (html, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._lru.popitem(last=False)
+            self._bytes -= evicted_size
+            self._stats["evictions"] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        """查询缓存（同步读取磁盘缓存，供不在事件循环中的调用方使用），未命中时返回None"""
+        if not self.enabled:
+            return None
+        html = self._get_memory(key)
+        if html is None and self.disk_dir is not None:
+            html = self._read_disk(key)
+            if html is not None:
+                self._remember_disk_hit(key, html)
+        if html is None:
+            self._stats["misses"] += 1
+        return html
+
+    async def get_async(self, key: str) -> Optional[str]:
+        """查询缓存，内存未命中时在写入线程池中读取磁盘缓存，不阻塞事件循环"""
+        if not self.enabled:
+            return None
+        html = self._get_memory(key)
+        if html is None and self.disk_dir is not None:
+            html = await get_export_writer().run(self._read_disk, key)
+            if html is not None:
+                self._remember_disk_hit(key, html)
+        if html is None:
+            self._stats["misses"] += 1
+        return html
+
+    def _get_memory(self, key: str) -> Optional[str]:
+        cached = self._lru.get(key)
+        if cached is None:
+            return None
+        self._lru.move_to_end(key)
+        self._stats["hits"] += 1
+        return cached[0]
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        path = self._disk_path(key)
+        try:
+            html = path.read_text(encoding='utf-8')
+            # 更新修改时间，磁盘淘汰时视为最近使用
+            os.utime(path)
+        except OSError:
+            return None
+        return html
+
+    def _remember_disk_hit(self, key: str, html: str) -> None:
+        self._remember(key, html, len(html.encode('utf-8')))
+        self._stats["disk_hits"] += 1
+
+    def put(self, key: str, html: str) -> None:
+        """写入渲染结果"""
+        if not self.enabled:
+            return
+        size = len(html.encode('utf-8'))
+        self._remember(key, html, size)
+        if self.disk_dir is not None and 0 < size <= self.disk_max_bytes:
+            get_export_writer().submit(self._write_disk, key, html)
+
+    def _write_disk(self, key: str, html: str) -> None:
+        data = html.encode('utf-8')
+        try:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            path = self._disk_path(key)
+            try:
+                previous_size = path.stat().st_size
+            except OSError:
+                previous_size = 0
+            tmp_path = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"渲染缓存写入失败: {str(e)}")
+            return
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = self._scan_disk_bytes()
+            else:
+                self._disk_bytes += len(data) - previous_size
+            if self._disk_bytes > self.disk_max_bytes:
+                self._prune_disk()
+
+    def _scan_disk_files(self) -> List[Tuple[float, int, Path]]:
+        files = []
+        for path in self.disk_dir.glob('*.html'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        return files
+
+    def _scan_disk_bytes(self) -> int:
+        return sum(size for _, size, _ in self._scan_disk_files())
+
+    def _prune_disk(self) -> None:
+        """按修改时间从旧到新删除磁盘缓存文件，直到总大小回到上限以内（调用方持有_disk_lock）"""
+        files = sorted(self._scan_disk_files())
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+            self._stats["disk_evictions"] += 1
+        self._disk_bytes = total
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回缓存统计，用于观测"""
+        lookups = self._stats["hits"] + self._stats["disk_hits"] + self._stats["misses"]
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._lru),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "disk": self.disk_dir is not None,
+            "disk_bytes": self._disk_bytes,
+            "disk_max_bytes": self.disk_max_bytes,
+            "hit_rate": round((self._stats["hits"] + self._stats["disk_hits"]) / lookups, 3) if lookups else None,
+            **self._stats,
+        }
+
+
+_render_cache = RenderCache(disk_dir=Path(CACHE_DIR) / "render" if RENDER_CACHE_DISK else None)
+
+
+def get_render_cache() -> RenderCache:
+    """获取进程内共享的渲染结果缓存"""
+    return _render_cache
+
+
+def _generate_output(
+    content: Dict[str, Any],
+    doc_title: str,
+    image_url_map: Optional[Dict[str, str]],
+    image_placeholders: bool = False,
+    output_format: str = "html"
+) -> Optional[str]:
+    """按输出格式生成文档（图片占位符仅用于HTML）"""
+    if output_format == "html":
+        return generate_html_from_content(content, doc_title, image_url_map, image_placeholders)
+    return OUTPUT_RENDERERS[output_format](content, doc_title, image_url_map)
+
+
+def render_html_cached(
+    content: Dict[str, Any],
+    doc_title: str = "钉钉文档",
+    image_url_map: Optional[Dict[str, str]] = None,
+    image_placeholders: bool = False,
+    output_format: str = "html",
+    content_key: Optional[str] = None
+) -> Optional[str]:
+    """
+    生成HTML（或Markdown/纯文本），内容相同时直接返回缓存的渲染结果
     
     Args:
-        style_obj: 样式对象字典
+        content: 文档内容字典
+        doc_title: 文档标题
+        image_url_map: 图片URL到本地路径的映射
+        image_placeholders: 是否以占位符代替图片
+        output_format: 输出格式（html / markdown / text）
+        content_key: 内容标识（见document_content_key），为None时不使用缓存
         
     Returns:
-        CSS样式字符串
+        渲染结果字符串，如果无法生成则返回None
     """
-    styles = []
-    if style_obj.get('bold'):
-        styles.append('font-weight: bold')
-    if style_obj.get('color'):
-        styles.append(f'color: {style_obj["color"]}')
-    if style_obj.get('sz') and style_obj.get('szUnit'):
-        styles.append(f'font-size: {style_obj["sz"]}{style_obj["szUnit"]}')
-    return '; '.join(styles) if styles else ''
+    cache = get_render_cache()
+    if not content or content_key is None or not cache.enabled:
+        return _generate_output(content, doc_title, image_url_map, image_placeholders, output_format)
+    key = _render_cache_key(content_key, doc_title, image_url_map, image_placeholders, output_format)
+    html = cache.get(key)
+    if html is None:
+        html = _generate_output(content, doc_title, image_url_map, image_placeholders, output_format)
+        if html is not None:
+            cache.put(key, html)
+    return html
 
 
-def parse_span(span_elem: List[Any]) -> str:
+# ==================== 渲染任务调度 ====================
+def _free_threaded_build() -> bool:
+    """当前解释器是否为关闭GIL的free-threaded构建"""
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def _document_content_size(document_data: Optional[Dict[str, Any]]) -> Optional[int]:
+    """返回document_data中内嵌content字符串的长度，用于判断是否需要离线程渲染"""
+    try:
+        content_str = document_data['data']['documentContent']['checkpoint']['content']
+    except (KeyError, TypeError):
+        return None
+    return len(content_str) if isinstance(content_str, str) else None
+
+
+class RenderOffloader:
     """
-    解析span元素
+    大文档渲染调度：超过阈值的文档在独立进程（free-threaded构建下为线程）中渲染
+
+    HTML生成和图片URL收集都是纯CPU计算，在事件循环中执行会阻塞所有并发的工具调用。
+    小文档仍然内联执行，避免序列化和进程间通信的开销。
+    """
+
+    def __init__(
+        self,
+        threshold: int = RENDER_OFFLOAD_THRESHOLD,
+        max_workers: int = RENDER_WORKERS,
+        executor_kind: str = RENDER_EXECUTOR
+    ):
+        self.threshold = threshold
+        self.max_workers = max(1, max_workers)
+        if executor_kind == "auto":
+            executor_kind = "thread" if _free_threaded_build() else "process"
+        self.executor_kind = executor_kind
+        self._executor: Optional[Executor] = None
+        self._stats = {"inline": 0, "offloaded": 0, "threaded": 0, "fallbacks": 0}
+
+    def should_offload(self, size_hint: Optional[int]) -> bool:
+        return (
+            self.executor_kind in ("process", "thread")
+            and self.threshold >= 0
+            and size_hint is not None
+            and size_hint >= self.threshold
+        )
+
+    def _pool(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="render")
+            else:
+                # 服务进程中有事件循环和其他线程，使用spawn避免fork带来的锁状态问题
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+        return self._executor
+
+    async def run(self, size_hint: Optional[int], func: Callable[..., T], *args: Any) -> T:
+        """
+        执行渲染相关的纯函数，按size_hint决定内联执行还是提交到执行器
+        
+        Args:
+            size_hint: 文档内容大小（字节），未知时为None（内联执行）
+            func: 模块级纯函数（进程池模式下需要可pickle）
+            *args: 函数参数
+        """
+        if not self.should_offload(size_hint):
+            self._stats["inline"] += 1
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._pool(), functools.partial(func, *args))
+        except BrokenExecutor as e:
+            # 工作进程异常退出：丢弃执行器，本次回退为内联渲染
+            logger.warning(f"渲染执行器不可用，改为内联渲染: {str(e)}")
+            self.shutdown(wait=False)
+            self._stats["fallbacks"] += 1
+            return func(*args)
+        self._stats["offloaded"] += 1
+        return result
+
+    async def run_off_loop(self, size_hint: Optional[int], func: Callable[..., T], *args: Any) -> T:
+        """
+        与run相同，但低于阈值的任务改在线程中执行而不是内联执行
+        
+        用于需要与其他协程（如图片下载）重叠执行的渲染：内联执行会一直占用事件循环，
+        线程中执行时事件循环仍能按GIL切换间隔推进网络I/O。
+        """
+        if self.should_offload(size_hint):
+            return await self.run(size_hint, func, *args)
+        self._stats["threaded"] += 1
+        return await asyncio.to_thread(func, *args)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回调度统计，用于观测"""
+        return {
+            "executor": self.executor_kind,
+            "threshold": self.threshold,
+            "max_workers": self.max_workers,
+            "started": self._executor is not None,
+            **self._stats,
+        }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """关闭执行器"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+
+
+_render_offloader = RenderOffloader()
+
+
+def get_render_offloader() -> RenderOffloader:
+    """获取进程内共享的渲染调度器"""
+    return _render_offloader
+
+
+def _should_stream_html(size_hint: Optional[int]) -> bool:
+    """内容大小达到阈值的文档保存HTML时改为流式写入"""
+    return HTML_STREAM_THRESHOLD >= 0 and size_hint is not None and size_hint >= HTML_STREAM_THRESHOLD
+
+
+async def collect_image_urls_async(content: Dict[str, Any], size_hint: Optional[int] = None) -> List[str]:
+    """collect_image_urls的异步版本，大文档在渲染执行器中执行"""
+    return await get_render_offloader().run(size_hint, collect_image_urls, content)
+
+
+async def render_html_async(
+    content: Dict[str, Any],
+    doc_title: str = "钉钉文档",
+    image_url_map: Optional[Dict[str, str]] = None,
+    size_hint: Optional[int] = None,
+    image_placeholders: bool = False,
+    output_format: str = "html",
+    content_key: Optional[str] = None,
+    off_loop: bool = False
+) -> Optional[str]:
+    """
+    render_html_cached的异步版本：内存缓存查找在事件循环中完成，磁盘缓存读取在写入线程池中执行，
+    大文档的渲染在渲染执行器中执行
     
     Args:
-        span_elem: span元素列表
+        content: 文档内容字典
+        doc_title: 文档标题
+        image_url_map: 图片URL到本地路径的映射
+        size_hint: 文档内容大小（字节），用于判断是否离线程渲染
+        image_placeholders: 是否以占位符代替图片
+        output_format: 输出格式（html / markdown / text）
+        content_key: 内容标识（见document_content_key），为None时不使用缓存
+        off_loop: 小文档也不在事件循环中渲染（在线程中执行），用于与其他协程重叠执行
         
     Returns:
-        HTML格式的span字符串
+        渲染结果字符串，如果无法生成则返回None
     """
-    if not isinstance(span_elem, list) or len(span_elem) < 2 or span_elem[0] != 'span':
-        return ''
+    offloader = get_render_offloader()
+    run = offloader.run_off_loop if off_loop else offloader.run
+    args = (content, doc_title, image_url_map, image_placeholders, output_format)
+    cache = get_render_cache()
+    if not content or content_key is None or not cache.enabled:
+        return await run(size_hint, _generate_output, *args)
+    key = _render_cache_key(content_key, doc_title, image_url_map, image_placeholders, output_format)
+    html = await cache.get_async(key)
+    if html is None:
+        html = await run(size_hint, _generate_output, *args)
+        if html is not None:
+            cache.put(key, html)
+    return html
+
+
+def stream_html_to_file(
+    path: Path,
+    content: Dict[str, Any],
+    doc_title: str,
+    image_url_map: Optional[Dict[str, str]]
+) -> Optional[Tuple[int, bool]]:
+    """
+    逐块生成HTML并原子写入文件，边写边计算hash；与已有文件内容相同时丢弃临时文件
     
-    attrs = span_elem[1] if len(span_elem) > 1 else {}
-    html_parts = []
+    模块级纯函数，在渲染执行器（进程池）中执行时HTML不会传回主进程。
     
-    for i in range(2, len(span_elem)):
-        child = span_elem[i]
-        if isinstance(child, str):
-            text = child.replace('\n', '<br>')
-            if text:
-                style = parse_text_style(attrs)
-                html_parts.append(f'<span style="{style}">{text}</span>' if style else text)
-        elif isinstance(child, list):
-            html_parts.append(parse_span(child))
+    Returns:
+        (HTML字节数, 是否实际写入)，如果无法生成HTML则返回None
+    """
+    chunks = iter_html_from_content(content, doc_title, image_url_map)
+    if chunks is None:
+        return None
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                data = chunk.encode('utf-8')
+                f.write(data)
+                digest.update(data)
+                size += len(data)
+        if _file_matches_digest(path, size, digest.hexdigest()):
+            tmp_path.unlink()
+            return size, False
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return size, True
+
+
+def _file_matches_digest(path: Path, size: int, hexdigest: str) -> bool:
+    """判断已有文件的大小和sha256是否与给定值相同"""
+    try:
+        if path.stat().st_size != size:
+            return False
+        with open(path, 'rb') as f:
+            return _file_sha256(f) == hexdigest
+    except OSError:
+        return False
+
+
+async def stream_html_to_file_async(
+    path: Path,
+    content: Dict[str, Any],
+    doc_title: str,
+    image_url_map: Optional[Dict[str, str]],
+    size_hint: Optional[int]
+) -> bool:
+    """
+    在渲染执行器中流式生成并写入HTML（低于离线程阈值时在线程中执行）
     
-    return ''.join(html_parts)
+    Returns:
+        是否生成了HTML文件
+    """
+    result = await get_render_offloader().run_off_loop(
+        size_hint, stream_html_to_file, path, content, doc_title, image_url_map
+    )
+    if result is None:
+        return False
+    size, written = result
+    if written:
+        get_export_writer().record(written=1, bytes_written=size)
+    else:
+        get_export_writer().record(skipped=1)
+    return True
 
 
-def collect_image_urls(content: Dict[str, Any]) -> set:
+# ==================== 分页输出 ====================
+def _merge_frame_chunks(chunks: List[str], has_footer: bool) -> List[str]:
+    """把文档头部（和页脚）并入相邻的正文块，使每个分页边界都落在正文块之间"""
+    if len(chunks) > 1:
+        chunks[1] = chunks[0] + chunks[1]
+        del chunks[0]
+    if has_footer and len(chunks) > 1:
+        chunks[-2] += chunks[-1]
+        del chunks[-1]
+    return chunks
+
+
+def generate_output_blocks(
+    content: Dict[str, Any],
+    doc_title: str = "钉钉文档",
+    image_url_map: Optional[Dict[str, str]] = None,
+    output_format: str = "html"
+) -> Optional[List[str]]:
     """
-    收集文档中所有图片URL
+    按正文块生成文档，用于分页返回
+    
+    第一个块包含文档头部（HTML模板头部或Markdown标题），最后一个块包含HTML页脚，
+    所有块按顺序拼接的结果与render_html_cached的输出完全相同。
     
     Args:
         content: 文档内容字典
+        doc_title: 文档标题
+        image_url_map: 图片URL到本地路径的映射
+        output_format: 输出格式（html / markdown / text）
         
     Returns:
-        图片URL集合
+        正文块列表，如果无法生成则返回None
+        
+    Raises:
+        McpError: 当生成失败时
     """
-    image_urls = set()
+    if output_format == "html":
+        chunks = iter_html_from_content(content, doc_title, image_url_map)
+        return _merge_frame_chunks(list(chunks), has_footer=True) if chunks is not None else None
     
-    def _traverse(elem):
-        if isinstance(elem, list) and len(elem) > 0:
-            if elem[0] == 'img' and len(elem) > 1:
-                attrs = elem[1] if isinstance(elem[1], dict) else {}
-                src = attrs.get('src', '')
-                if src:
-                    # 构建完整URL
-                    if not src.startswith('http'):
-                        src = f'{BASE_URL}{src}'
-                    image_urls.add(src)
-            else:
-                # 递归遍历子元素
-                for item in elem:
-                    _traverse(item)
-        elif isinstance(elem, dict):
-            for value in elem.values():
-                _traverse(value)
+    body = _main_body(content)
+    if body is None:
+        return None
+    renderer = (MarkdownRenderer if output_format == "markdown" else TextRenderer)(image_url_map)
+    try:
+        return _merge_frame_chunks(list(renderer.iter_blocks(body, doc_title)), has_footer=False)
+    except Exception as e:
+        raise McpError(ErrorData(
+            code=INTERNAL_ERROR,
+            message=f"生成{OUTPUT_FORMAT_LABELS[output_format]}失败: {str(e)}"
+        ))
+
+
+async def render_output_blocks_async(
+    content: Dict[str, Any],
+    doc_title: str = "钉钉文档",
+    image_url_map: Optional[Dict[str, str]] = None,
+    size_hint: Optional[int] = None,
+    output_format: str = "html",
+    content_key: Optional[str] = None
+) -> Optional[List[str]]:
+    """
+    generate_output_blocks的异步版本：与render_html_async一样经过渲染缓存，大文档在渲染执行器中执行
     
-    if content:
-        main_key = content.get('main')
-        if main_key:
-            parts = content.get('parts', {})
-            main_part = parts.get(main_key, {})
-            data = main_part.get('data', {})
-            body = data.get('body', [])
-            _traverse(body)
+    块列表以JSON数组的形式缓存，与整篇渲染结果使用不同的缓存键。
     
-    return image_urls
+    Args:
+        content: 文档内容字典
+        doc_title: 文档标题
+        image_url_map: 图片URL到本地路径的映射
+        size_hint: 文档内容大小（字节），用于判断是否离线程渲染
+        output_format: 输出格式（html / markdown / text）
+        content_key: 内容标识（见document_content_key），为None时不使用缓存
+    """
+    args = (content, doc_title, image_url_map, output_format)
+    cache = get_render_cache()
+    if not content or content_key is None or not cache.enabled:
+        return await get_render_offloader().run(size_hint, generate_output_blocks, *args)
+    key = _render_cache_key(content_key, doc_title, image_url_map, output_format=f"{output_format}:blocks")
+    cached = await cache.get_async(key)
+    if cached is not None:
+        return json_loads(cached)
+    blocks = await get_render_offloader().run(size_hint, generate_output_blocks, *args)
+    if blocks is not None:
+        cache.put(key, json_dumps(blocks).decode('utf-8'))
+    return blocks
+
+
+@dataclass
+class RenderedPages:
+    """一次分页请求的渲染结果，后续翻页直接从中读取"""
+    node_id: str
+    doc_name: str
+    owner: str
+    output_format: str
+    image_mode: str
+    blocks: List[str]
+    block_sizes: List[int]
+    max_bytes: Optional[int]
+    max_blocks: Optional[int]
+    # 放入PageCache的时间（PageCache的时钟），用于TTL判断
+    created_at: float = 0.0
+
+    @property
+    def size(self) -> int:
+        return sum(self.block_sizes)
+
+
+@dataclass
+class Page:
+    """一页输出"""
+    text: str
+    start: int
+    end: int
+    total: int
+    size: int
+
+
+def paginate_blocks(
+    block_sizes: List[int],
+    start: int,
+    max_bytes: Optional[int],
+    max_blocks: Optional[int]
+) -> int:
+    """
+    从start开始按预算选取正文块，返回本页结束位置（不含）
+    
+    每页至少包含一个块，保证超过预算的单个块也能返回。
+    
+    Args:
+        block_sizes: 各块的字节数
+        start: 本页第一个块的下标
+        max_bytes: 每页字节预算（None表示不限）
+        max_blocks: 每页块数预算（None表示不限）
+    """
+    total = len(block_sizes)
+    end = start
+    used = 0
+    while end < total:
+        if end > start:
+            if max_blocks is not None and end - start >= max_blocks:
+                break
+            if max_bytes is not None and used + block_sizes[end] > max_bytes:
+                break
+        used += block_sizes[end]
+        end += 1
+    return end
+
+
+class PageCache:
+    """
+    分页渲染结果缓存：按字节数限制的内存LRU，条目超过TTL后失效
+
+    键为随机令牌，只出现在返回给客户端的游标中；条目记录Cookie指纹，
+    其他身份持有游标也无法读取。
+    """
+
+    def __init__(
+        self,
+        ttl: float = PAGE_CACHE_TTL,
+        max_bytes: int = PAGE_CACHE_MAX_BYTES,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # 单调时钟，测试中可替换
+        self._clock = clock
+        self._entries: "OrderedDict[str, RenderedPages]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {"renders": 0, "pages": 0, "expired": 0, "evictions": 0}
+
+    def _drop(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def put(self, entry: RenderedPages) -> Optional[str]:
+        """
+        缓存渲染结果
+        
+        Returns:
+            缓存令牌；结果超过缓存容量时返回None
+        """
+        self._stats["renders"] += 1
+        size = entry.size
+        if size > self.max_bytes:
+            return None
+        token = secrets.token_urlsafe(12)
+        entry.created_at = self._clock()
+        self._entries[token] = entry
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            evicted, _ = next(iter(self._entries.items()))
+            self._drop(evicted)
+            self._stats["evictions"] += 1
+        return token
+
+    def get(self, token: str) -> Optional[RenderedPages]:
+        """查询缓存，不存在或已过期时返回None"""
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        if self._clock() - entry.created_at > self.ttl:
+            self._drop(token)
+            self._stats["expired"] += 1
+            return None
+        self._entries.move_to_end(token)
+        return entry
+
+    def page(self, entry: RenderedPages, start: int) -> Page:
+        """按条目记录的预算读取从start开始的一页"""
+        self._stats["pages"] += 1
+        end = paginate_blocks(entry.block_sizes, start, entry.max_bytes, entry.max_blocks)
+        return Page(
+            text=''.join(entry.blocks[start:end]),
+            start=start,
+            end=end,
+            total=len(entry.blocks),
+            size=sum(entry.block_sizes[start:end]),
+        )
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回缓存统计，用于观测"""
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            **self._stats,
+        }
+
+
+_page_cache = PageCache()
+
+
+def get_page_cache() -> PageCache:
+    """获取进程内共享的分页渲染结果缓存"""
+    return _page_cache
+
+
+def encode_page_cursor(token: str, start: int) -> str:
+    """生成分页游标（缓存令牌 + 下一页第一个块的下标）"""
+    return f"{token}.{start}"
+
+
+def decode_page_cursor(cursor: str) -> Tuple[str, int]:
+    """
+    解析分页游标
+    
+    Raises:
+        McpError: 游标格式无效时
+    """
+    token, _, start = cursor.rpartition('.')
+    if not token or not start.isdigit():
+        raise McpError(ErrorData(code=INVALID_PARAMS, message=f"无效的分页游标: {cursor}"))
+    return token, int(start)
+
+
+def new_rendered_pages(
+    node_id: str,
+    doc_name: str,
+    cookie: str,
+    output_format: str,
+    image_mode: str,
+    blocks: List[str],
+    max_bytes: Optional[int],
+    max_blocks: Optional[int]
+) -> RenderedPages:
+    """为一次分页请求构建渲染结果条目"""
+    return RenderedPages(
+        node_id=node_id,
+        doc_name=doc_name,
+        owner=_cookie_fingerprint(cookie),
+        output_format=output_format,
+        image_mode=image_mode,
+        blocks=blocks,
+        block_sizes=[len(block.encode('utf-8')) for block in blocks],
+        max_bytes=max_bytes,
+        max_blocks=max_blocks,
+    )
 
 
-def parse_image(img_elem: List[Any], image_url_map: Optional[Dict[str, str]] = None) -> str:
+def lookup_rendered_pages(cursor: str, node_id: str, cookie: str) -> Tuple[str, RenderedPages, int]:
     """
-    解析图片元素
+    根据游标查找缓存的渲染结果
     
     Args:
-        img_elem: 图片元素列表
-        image_url_map: 图片URL到本地路径的映射
+        cursor: 分页游标
+        node_id: 请求中的文档NODE_ID
+        cookie: 请求使用的Cookie
         
     Returns:
-        HTML格式的图片字符串
+        (缓存令牌, 渲染结果, 本页第一个块的下标)
+        
+    Raises:
+        McpError: 游标无效、已过期或不属于该文档/身份时
     """
-    if not isinstance(img_elem, list) or len(img_elem) < 2 or img_elem[0] != 'img':
-        return ''
-    
-    attrs = img_elem[1] if len(img_elem) > 1 else {}
-    src = attrs.get('src', '')
-    name = attrs.get('name', '图片')
-    width = attrs.get('width', 'auto')
-    
-    if not src:
-        return f'<p style="color: #999;">[图片: {name}]</p>'
-    
-    # 构建完整URL用于查找映射
-    original_src = src
-    if not src.startswith('http'):
-        full_url = f'{BASE_URL}{src}'
-    else:
-        full_url = src
-    
-    # 如果有映射，使用本地路径
-    if image_url_map and full_url in image_url_map:
-        src = image_url_map[full_url]
-    else:
-        # 如果没有映射，说明图片下载失败或未下载
-        # 使用原始URL（可能需要Cookie，浏览器可能无法显示）
-        if not src.startswith('http'):
-            src = f'{BASE_URL}{original_src}'
-        # 如果下载失败且有映射表（说明尝试过下载），显示提示
-        if image_url_map is not None:
-            return f'<div class="image-container"><p style="color: #999; padding: 1rem; border: 1px dashed #ddd; border-radius: 4px;">[图片下载失败: {name}]<br><small>原始链接: <a href="{src}" target="_blank">{src[:50]}...</a></small></p></div>'
-    
-    return f'<div class="image-container"><img src="{src}" alt="{name}" style="max-width: {width}px; height: auto;" loading="lazy" /></div>'
+    token, start = decode_page_cursor(cursor)
+    entry = get_page_cache().get(token)
+    if entry is None:
+        raise McpError(ErrorData(
+            code=INVALID_PARAMS,
+            message="分页游标已过期或不存在，请不带cursor重新请求第一页"
+        ))
+    if entry.node_id != node_id or entry.owner != _cookie_fingerprint(cookie) or start >= len(entry.blocks):
+        raise McpError(ErrorData(code=INVALID_PARAMS, message=f"分页游标与请求的文档不匹配: {cursor}"))
+    return token, entry, start
 
 
-def parse_paragraph(para_elem: List[Any], image_url_map: Optional[Dict[str, str]] = None) -> str:
+def check_page_params(entry: RenderedPages, params: Dict[str, Any]) -> None:
     """
-    解析段落元素
+    检查后续页请求中显式给出的参数是否与第一页一致
     
     Args:
-        para_elem: 段落元素列表
-        image_url_map: 图片URL到本地路径的映射
+        entry: 第一页的渲染结果
+        params: 请求中显式给出的参数（未给出的参数沿用第一页，不参与检查）
         
-    Returns:
-        HTML格式的段落字符串
+    Raises:
+        McpError: format、image_mode、max_bytes或max_blocks与第一页不同时
     """
-    if not isinstance(para_elem, list) or len(para_elem) < 2:
-        return ''
-    
-    tag = para_elem[0]
-    
-    if tag == 'p':
-        content_parts = []
-        for i in range(2, len(para_elem)):
-            child = para_elem[i]
-            if isinstance(child, list) and len(child) > 0:
-                if child[0] == 'img':
-                    content_parts.append(parse_image(child, image_url_map))
-                else:
-                    content_parts.append(parse_span(child))
-            elif isinstance(child, str):
-                content_parts.append(child)
-        
-        paragraph_html = ''.join(content_parts)
-        if not paragraph_html.strip():
-            paragraph_html = '&nbsp;'
-        
-        return f'<p>{paragraph_html}</p>'
-    
-    if tag == 'img':
-        return parse_image(para_elem, image_url_map)
-    
-    return ''
+    first_page = {
+        "format": entry.output_format,
+        "image_mode": entry.image_mode,
+        "max_bytes": entry.max_bytes,
+        "max_blocks": entry.max_blocks,
+    }
+    mismatched = [
+        f"{name}={value!r}（第一页为 {first_page[name]!r}）"
+        for name, value in params.items()
+        if name in first_page and value != first_page[name]
+    ]
+    if mismatched:
+        raise McpError(ErrorData(
+            code=INVALID_PARAMS,
+            message=f"后续页参数与第一页不一致: {'，'.join(mismatched)}；请去掉这些参数，或不带cursor重新请求第一页"
+        ))
 
 
-def parse_table(table_elem: List[Any]) -> str:
+def format_page_response(entry: RenderedPages, start: int, token: Optional[str] = None) -> str:
     """
-    解析表格元素
+    读取一页并生成返回文本，还有后续页时附带下一页游标
     
     Args:
-        table_elem: 表格元素列表
-        
-    Returns:
-        HTML格式的表格字符串
+        entry: 渲染结果
+        start: 本页第一个块的下标
+        token: 缓存令牌；第一页传入None，有后续页时才写入缓存
     """
-    if not isinstance(table_elem, list) or len(table_elem) < 2 or table_elem[0] != 'table':
-        return ''
+    cache = get_page_cache()
+    page = cache.page(entry, start)
+    label = OUTPUT_FORMAT_LABELS[entry.output_format]
+    record_output_size(entry.output_format, page.size)
     
-    rows_html = []
-    for i in range(2, len(table_elem)):
-        child = table_elem[i]
-        if isinstance(child, list) and len(child) > 0 and child[0] == 'tr':
-            row_html = parse_table_row(child)
-            if row_html:
-                rows_html.append(row_html)
-    
-    if not rows_html:
-        return ''
+    if page.end >= page.total:
+        next_line = "下一页游标: 无（已是最后一页）"
+    else:
+        if token is None:
+            token = cache.put(entry)
+        if token is None:
+            next_line = "⚠️ 文档超过分页缓存容量，无法获取后续页，请增大max_bytes或DINGTALK_PAGE_CACHE_MAX_BYTES"
+        else:
+            next_line = f"下一页游标: {encode_page_cursor(token, page.end)}"
     
-    return f'''<div class="table-container">
-    <table class="doc-table">
-        {''.join(rows_html)}
-    </table>
-</div>'''
+    output = [f"✅ {label}生成成功\n"]
+    output.append(f"文档: {entry.doc_name}")
+    output.append(f"大小: {entry.size} 字节")
+    output.append(f"分页: 第 {page.start + 1}-{page.end} 块 / 共 {page.total} 块，本页 {page.size} 字节")
+    output.append(f"{next_line}\n")
+    output.append(f"--- {label} 内容 ---\n")
+    output.append(page.text)
+    return "\n".join(output)
 
 
-def parse_table_row(tr_elem: List[Any]) -> str:
+# ==================== 章节提取 ====================
+def find_outline_heading(outline: Dict[str, Any], heading: str) -> Optional[Dict[str, Any]]:
     """
-    解析表格行
+    在大纲中查找标题：先完全匹配，再包含匹配（均忽略大小写和首尾空白），多个匹配时取第一个
     
     Args:
-        tr_elem: 表格行元素列表
-        
-    Returns:
-        HTML格式的表格行字符串
+        outline: build_document_outline的结果
+        heading: 标题文本
     """
-    if not isinstance(tr_elem, list) or len(tr_elem) < 2 or tr_elem[0] != 'tr':
-        return ''
-    
-    cells_html = []
-    for i in range(2, len(tr_elem)):
-        child = tr_elem[i]
-        if isinstance(child, list) and len(child) > 0 and child[0] == 'tc':
-            cell_html = parse_table_cell(child)
-            if cell_html:
-                cells_html.append(cell_html)
-    
-    if not cells_html:
-        return ''
-    
-    return f'<tr>{"".join(cells_html)}</tr>'
+    wanted = heading.strip().casefold()
+    headings = outline["headings"]
+    for item in headings:
+        if item["text"].casefold() == wanted:
+            return item
+    for item in headings:
+        if wanted in item["text"].casefold():
+            return item
+    return None
 
 
-def parse_table_cell(tc_elem: List[Any]) -> str:
+def resolve_section_range(
+    outline: Dict[str, Any],
+    heading: Optional[str],
+    start: Optional[int],
+    end: Optional[int]
+) -> Tuple[int, int, Optional[Dict[str, Any]]]:
     """
-    解析表格单元格
+    把标题或块范围解析为顶层块区间
     
-    Args:
-        tc_elem: 表格单元格元素列表
-        
     Returns:
-        HTML格式的表格单元格字符串
+        (起始下标, 结束下标（不含）, 匹配到的标题条目)
+        
+    Raises:
+        McpError: 标题不存在或块范围无效时
     """
-    if not isinstance(tc_elem, list) or len(tc_elem) < 2 or tc_elem[0] != 'tc':
-        return ''
-    
-    attrs = tc_elem[1] if len(tc_elem) > 1 else {}
-    row_span = attrs.get('rowSpan', 1)
-    col_span = attrs.get('colSpan', 1)
-    fill = attrs.get('fill', '')
-    v_align = attrs.get('vAlign', 'top')
-    
-    styles = []
-    if fill:
-        styles.append(f'background-color: {fill}')
-    if v_align:
-        styles.append(f'vertical-align: {v_align}')
-    
-    style_str = f' style="{"; ".join(styles)}"' if styles else ''
-    
-    content_parts = []
-    for i in range(2, len(tc_elem)):
-        child = tc_elem[i]
-        if isinstance(child, list) and len(child) > 0 and child[0] == 'p':
-            p_content = []
-            for j in range(2, len(child)):
-                p_child = child[j]
-                if isinstance(p_child, list):
-                    p_content.append(parse_span(p_child))
-                elif isinstance(p_child, str):
-                    p_content.append(p_child)
-            content_parts.append(''.join(p_content))
-    
-    cell_content = '<br>'.join(content_parts) if content_parts else '&nbsp;'
-    
-    rowspan_attr = f' rowspan="{row_span}"' if row_span > 1 else ''
-    colspan_attr = f' colspan="{col_span}"' if col_span > 1 else ''
-    
-    return f'<td{rowspan_attr}{colspan_attr}{style_str}>{cell_content}</td>'
+    total = outline["blocks"]
+    if heading:
+        item = find_outline_heading(outline, heading)
+        if item is None:
+            available = "、".join(h["text"] for h in outline["headings"][:20]) or "（文档中没有标题）"
+            raise McpError(ErrorData(
+                code=INVALID_PARAMS,
+                message=f"未找到标题: {heading}\n可用标题: {available}"
+            ))
+        return item["index"], item["end"], item
+    start = start or 0
+    end = total if end is None else min(end, total)
+    if start >= end:
+        raise McpError(ErrorData(
+            code=INVALID_PARAMS,
+            message=f"无效的块范围: [{start}, {end})，文档共 {total} 块"
+        ))
+    return start, end, None
 
 
-# ==================== HTML生成函数 ====================
-def generate_html_from_content(
-    content: Dict[str, Any], 
-    doc_title: str = "钉钉文档",
-    image_url_map: Optional[Dict[str, str]] = None
-) -> Optional[str]:
+def slice_document_content(content: Dict[str, Any], start: int, end: int) -> Dict[str, Any]:
     """
-    从content生成HTML
+    构造只包含顶层块[start, end)的内容字典，只复制区间内元素的引用，开销与章节大小成正比
     
     Args:
         content: 文档内容字典
-        doc_title: 文档标题
-        image_url_map: 图片URL到本地路径的映射
+        start: 起始顶层块下标（含）
+        end: 结束顶层块下标（不含）
+    """
+    main_key = content['main']
+    body = _main_body(content)
+    return {
+        'main': main_key,
+        'parts': {main_key: {'data': {'body': body[:2] + body[start + 2:end + 2]}}},
+    }
+
+
+def format_outline(outline: Dict[str, Any], doc_name: str) -> str:
+    """把大纲格式化为按级别缩进的列表"""
+    output = [f"📑 文档大纲: {doc_name}（共 {outline['blocks']} 块）\n"]
+    if not outline["headings"]:
+        output.append("（文档中没有标题，可使用start_block/end_block按块范围提取）")
+    for item in outline["headings"]:
+        indent = "  " * (item["level"] - 1)
+        output.append(f"{indent}- {item['text'] or '（空标题）'}  [块 {item['index']}-{item['end']})")
+    return "\n".join(output)
+
+
+# ==================== 文档元数据缓存 ====================
+class DentryCache:
+    """
+    node_id → dentryKey/标题等元数据的缓存
+
+    内存中保留最近使用的条目（LRU），磁盘上每个节点一个小JSON文件持久化，
+    命中时可以跳过文档页面GET和mainsite_server_content解析。
+    完整的mainsite内容只写在磁盘旁路文件中（按Cookie指纹区分），
+    保存文件时按需读取，保证冷热导出写出的文件集合一致。
+    """
+
+    def __init__(self, cache_dir: Path, max_entries: int = DENTRY_CACHE_SIZE, ttl: float = DENTRY_CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._lru: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    def _entry_path(self, node_id: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha256(node_id.encode()).hexdigest()[:32]}.json"
+
+    def _mainsite_path(self, node_id: str) -> Path:
+        return self.cache_dir / f"{hashlib.sha256(node_id.encode()).hexdigest()[:32]}.mainsite.json"
+
+    def _remember(self, node_id: str, entry: Dict[str, Any]) -> None:
+        self._lru[node_id] = entry
+        self._lru.move_to_end(node_id)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def get(self, node_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查询缓存条目，不存在或已过期时返回None
         
-    Returns:
-        HTML字符串，如果无法生成则返回None
+        Returns:
+            包含dentry_key、title、metadata、cached_at的字典
+        """
+        if not self.enabled:
+            return None
+        entry = self._lru.get(node_id)
+        if entry is None:
+            path = self._entry_path(node_id)
+            try:
+                entry = json_loads(path.read_bytes())
+            except (OSError, ValueError):
+                entry = None
+            if entry is not None and entry.get('node_id') != node_id:
+                entry = None
+        if entry is None or time.time() - entry.get('cached_at', 0) > self.ttl:
+            self._misses += 1
+            return None
+        self._remember(node_id, entry)
+        self._hits += 1
+        return entry
+
+    def put(
+        self,
+        node_id: str,
+        dentry_key: str,
+        title: str,
+        mainsite_content: Optional[Dict[str, Any]] = None,
+        owner: Optional[str] = None
+    ) -> None:
+        """
+        写入缓存条目（内存 + 磁盘，磁盘在写入线程中后台写入）
         
-    Raises:
-        McpError: 当生成HTML失败时
+        Args:
+            node_id: 文档节点ID
+            dentry_key: 文档dentryKey
+            title: 文档标题
+            mainsite_content: 完整的mainsite内容，仅写入磁盘旁路文件
+            owner: 获取mainsite所用Cookie的指纹
+        """
+        if not self.enabled:
+            return
+        entry = {
+            'node_id': node_id,
+            'dentry_key': dentry_key,
+            'title': title,
+            'cached_at': time.time(),
+        }
+        self._remember(node_id, entry)
+        writer = get_export_writer()
+        writer.write_later(self._entry_path(node_id), lambda: json_dumps(entry))
+        if mainsite_content is not None:
+            writer.write_later(self._mainsite_path(node_id), lambda: json_dumps({
+                'node_id': node_id,
+                'owner': owner,
+                'mainsite': mainsite_content,
+            }))
+
+    def load_mainsite(self, node_id: str, owner: str) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存的mainsite内容（同步磁盘读取，应在写入线程中调用）
+        
+        Returns:
+            mainsite内容，不存在、已过期或属于其他Cookie时返回None
+        """
+        if not self.enabled:
+            return None
+        try:
+            stat = self._mainsite_path(node_id).stat()
+            payload = json_loads(self._mainsite_path(node_id).read_bytes())
+        except (OSError, ValueError):
+            return None
+        if time.time() - stat.st_mtime > self.ttl:
+            return None
+        if not isinstance(payload, dict) or payload.get('node_id') != node_id or payload.get('owner') != owner:
+            return None
+        return payload.get('mainsite')
+
+    def invalidate(self, node_id: str) -> None:
+        """删除缓存条目"""
+        self._lru.pop(node_id, None)
+        writer = get_export_writer()
+        writer.write_later(self._entry_path(node_id), lambda: None)
+        writer.write_later(self._mainsite_path(node_id), lambda: None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回缓存统计，用于观测"""
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self._lru),
+            "hits": self._hits,
+            "misses": self._misses,
+        }
+
+
+_dentry_cache = DentryCache(Path(CACHE_DIR) / "dentry")
+
+
+def get_dentry_cache() -> DentryCache:
+    """获取进程内共享的dentryKey缓存"""
+    return _dentry_cache
+
+
+# ==================== 文档内容缓存 ====================
+@dataclass
+class CachedDocument:
+    """缓存的文档数据及解析后的内容"""
+    version: str
+    fetched_at: float
+    document_data: Dict[str, Any]
+    content: Optional[Dict[str, Any]]
+    # 预先计算的大纲（标题 → 顶层块范围），章节提取时无需遍历整个文档
+    outline: Optional[Dict[str, Any]] = None
+
+
+def _checkpoint_version(document_data: Dict[str, Any]) -> str:
     """
-    if not content:
-        return None
+    获取文档checkpoint的版本标识：checkpoint content字符串的hash
     
+    不依赖接口返回的版本类字段（其含义无法确认，编辑后可能不变），
+    内容相同才视为同一版本；没有内嵌content时使用整个文档数据的hash。
+    """
     try:
-        main_key = content.get('main')
-        if not main_key:
+        content_str = document_data['data']['documentContent']['checkpoint']['content']
+    except (KeyError, TypeError):
+        content_str = None
+    if isinstance(content_str, str):
+        return "md5:" + hashlib.md5(content_str.encode()).hexdigest()
+    return "md5:" + hashlib.md5(json_dumps(document_data, sort_keys=True)).hexdigest()
+
+
+class DocumentCache:
+    """
+    文档内容两级缓存：内存LRU + 磁盘，按dentryKey（及Cookie指纹）索引并记录checkpoint版本
+
+    在TTL内直接返回；超过TTL但仍在stale窗口内时先返回旧内容，同时在后台刷新；
+    刷新后版本未变化则沿用已解析的content，不再重复json.loads。
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        max_entries: int = DOCUMENT_CACHE_SIZE,
+        ttl: float = DOCUMENT_CACHE_TTL,
+        stale_ttl: float = DOCUMENT_CACHE_STALE_TTL,
+    ):
+        self.cache_dir = cache_dir
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lru: "OrderedDict[Tuple[str, str], CachedDocument]" = OrderedDict()
+        self._stats = {
+            "hits": 0, "stale_hits": 0, "disk_hits": 0, "misses": 0, "refreshes": 0, "unchanged": 0, "seeded": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 or self.stale_ttl > 0
+
+    def _entry_path(self, key: Tuple[str, str]) -> Path:
+        return self.cache_dir / f"{hashlib.sha256('|'.join(key).encode()).hexdigest()[:32]}.json"
+
+    def _remember(self, key: Tuple[str, str], entry: CachedDocument) -> None:
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _load_from_disk(self, key: Tuple[str, str]) -> Optional[CachedDocument]:
+        """同步读取并解析磁盘条目（在写入线程池中调用）"""
+        try:
+            raw = json_loads(self._entry_path(key).read_bytes())
+        except (OSError, ValueError):
             return None
+        if raw.get('key') != list(key):
+            return None
+        document_data = raw.get('document_data') or {}
+        content = extract_document_content(document_data)
+        entry = CachedDocument(
+            version=raw.get('version', ''),
+            fetched_at=raw.get('fetched_at', 0),
+            document_data=document_data,
+            content=content,
+            outline=raw['outline'] if 'outline' in raw else build_document_outline(content),
+        )
+        return entry
+
+    async def get(self, key: Tuple[str, str]) -> Tuple[Optional[CachedDocument], bool]:
+        """
+        查询缓存（内存未命中时在写入线程池中读取并解析磁盘条目，不阻塞事件循环）
         
-        parts = content.get('parts', {})
-        main_part = parts.get(main_key, {})
-        data = main_part.get('data', {})
-        body = data.get('body', [])
-        
-        html_parts = []
-        for item in body[2:]:
-            if not isinstance(item, list) or len(item) == 0:
-                continue
-            
-            tag = item[0]
-            # 根据标签类型选择解析函数
-            parser_map = {
-                'table': parse_table,
-                'code': parse_code_block,
-                'p': lambda x: parse_paragraph(x, image_url_map),
-                'img': lambda x: parse_image(x, image_url_map),
-            }
-            
-            parser = parser_map.get(tag, lambda x: parse_paragraph(x, image_url_map))
-            parsed_html = parser(item)
-            if parsed_html:
-                html_parts.append(parsed_html)
-        
-        content_html = '\n'.join(html_parts)
-        
-        html_template = f"""<!DOCTYPE html>
-<html lang="zh-CN">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>{doc_title}</title>
-    <style>
-        * {{ margin: 0; padding: 0; box-sizing: border-box; }}
-        body {{
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', 'PingFang SC', sans-serif;
-            line-height: 1.6;
-            color: #333;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            padding: 2rem;
-        }}
-        .container {{ max-width: 900px; margin: 0 auto; background: white; border-radius: 12px; 
-                      box-shadow: 0 20px 60px rgba(0, 0, 0, 0.3); overflow: hidden; }}
-        .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; 
-                   padding: 2rem; text-align: center; }}
-        .header h1 {{ font-size: 2rem; font-weight: 600; margin-bottom: 0.5rem; }}
-        .content {{ padding: 2rem 3rem; }}
-        .content p {{ margin-bottom: 1rem; font-size: 1rem; line-height: 1.8; }}
-        .table-container {{ margin: 1.5rem 0; overflow-x: auto; }}
-        .doc-table {{ width: 100%; border-collapse: collapse; margin: 1rem 0; background: white; 
-                      box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
-        .doc-table td {{ border: 1px solid #ddd; padding: 0.75rem; font-size: 0.95rem; }}
-        .doc-table tr:hover {{ background-color: #f5f5f5; }}
-        .image-container {{ margin: 1.5rem 0; text-align: center; }}
-        .image-container img {{ max-width: 100%; height: auto; border-radius: 8px; 
-                                box-shadow: 0 4px 12px rgba(0,0,0,0.15); }}
-        .code-block {{ margin: 1.5rem 0; border-radius: 8px; overflow: hidden; background: #282c34; 
-                       box-shadow: 0 4px 12px rgba(0,0,0,0.15); }}
-        .code-header {{ background: #21252b; padding: 0.5rem 1rem; display: flex; 
-                        justify-content: space-between; align-items: center; }}
-        .code-language {{ color: #61dafb; font-size: 0.85rem; font-weight: 600; text-transform: uppercase; }}
-        .code-copy {{ background: #61dafb; color: #282c34; border: none; padding: 0.25rem 0.75rem; 
-                      border-radius: 4px; cursor: pointer; font-size: 0.85rem; }}
-        .code-copy:hover {{ background: #4fa8c5; }}
-        .code-block pre {{ margin: 0; padding: 1rem; overflow-x: auto; background: #282c34; }}
-        .code-block code {{ font-family: 'Monaco', 'Menlo', 'Consolas', monospace; font-size: 0.9rem; 
-                            line-height: 1.6; color: #abb2bf; display: block; white-space: pre; }}
-        .footer {{ text-align: center; padding: 1.5rem; background: #f8f9fa; color: #666; 
-                   font-size: 0.85rem; border-top: 1px solid #e9ecef; }}
-    </style>
-    <script>
-        function copyCode(button) {{
-            const codeBlock = button.closest('.code-block');
-            const code = codeBlock.querySelector('code').textContent;
-            navigator.clipboard.writeText(code).then(() => {{
-                const originalText = button.textContent;
-                button.textContent = '✓ 已复制';
-                button.style.background = '#52c41a';
-                setTimeout(() => {{
-                    button.textContent = originalText;
-                    button.style.background = '#61dafb';
-                }}, 2000);
-            }});
-        }}
-    </script>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>{doc_title}</h1>
-            <div class="meta">钉钉文档内容解析</div>
-        </div>
-        <div class="content">
-{content_html}
-        </div>
-        <div class="footer">
-            由钉钉文档解析MCP服务生成 | Powered by Python
-        </div>
-    </div>
-</body>
-</html>"""
+        Returns:
+            (缓存条目, 是否需要后台刷新)；条目不存在或已完全过期时返回(None, False)
+        """
+        if not self.enabled:
+            return None, False
+        entry = self._lru.get(key)
+        if entry is None:
+            entry = await get_export_writer().run(self._load_from_disk, key)
+            if entry is not None:
+                self._stats["disk_hits"] += 1
+                # 读取期间可能已有更新的条目写入内存
+                entry = self._lru.get(key) or entry
+        if entry is None:
+            self._stats["misses"] += 1
+            return None, False
+        age = time.time() - entry.fetched_at
+        if age > self.ttl + self.stale_ttl:
+            self._stats["misses"] += 1
+            return None, False
+        self._remember(key, entry)
+        if age <= self.ttl:
+            self._stats["hits"] += 1
+            return entry, False
+        self._stats["stale_hits"] += 1
+        return entry, True
+
+    def store(self, key: Tuple[str, str], document_data: Dict[str, Any]) -> CachedDocument:
+        """
+        写入新获取的文档数据
         
-        return html_template
+        版本与已有条目相同时复用已解析的content和大纲，只更新获取时间。
         
+        Returns:
+            写入后的缓存条目
+        """
+        version = _checkpoint_version(document_data)
+        previous = self._lru.get(key)
+        if previous is not None and previous.version == version:
+            self._stats["unchanged"] += 1
+            content = previous.content
+            outline = previous.outline
+        else:
+            content = extract_document_content(document_data)
+            outline = build_document_outline(content)
+        entry = CachedDocument(
+            version=version, fetched_at=time.time(), document_data=document_data, content=content, outline=outline
+        )
+        self._persist(key, entry)
+        return entry
+
+    def seed(
+        self,
+        key: Tuple[str, str],
+        document_data: Dict[str, Any],
+        content: Optional[Dict[str, Any]],
+        fetched_at: float
+    ) -> CachedDocument:
+        """
+        用之前获取过的文档数据（如导出目录中的文件）预热缓存
+        
+        Args:
+            key: 缓存键
+            document_data: 文档数据
+            content: 已解析的content，为None时从document_data中解析
+            fetched_at: 数据的获取时间，按该时间参与TTL判断
+        
+        Returns:
+            写入后的缓存条目
+        """
+        if content is None:
+            content = extract_document_content(document_data)
+        entry = CachedDocument(
+            version=_checkpoint_version(document_data),
+            fetched_at=fetched_at,
+            document_data=document_data,
+            content=content,
+            outline=build_document_outline(content),
+        )
+        self._stats["seeded"] += 1
+        self._persist(key, entry)
+        return entry
+
+    def _persist(self, key: Tuple[str, str], entry: CachedDocument) -> None:
+        if not self.enabled:
+            return
+        self._remember(key, entry)
+        # 多MB的document_data在写入线程中序列化和写盘，不阻塞事件循环
+        get_export_writer().write_later(self._entry_path(key), lambda: json_dumps({
+            'key': list(key),
+            'version': entry.version,
+            'fetched_at': entry.fetched_at,
+            'document_data': entry.document_data,
+            'outline': entry.outline,
+        }))
+
+    def record_refresh(self) -> None:
+        self._stats["refreshes"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回缓存统计，用于观测"""
+        return {
+            "enabled": self.enabled,
+            "memory_entries": len(self._lru),
+            **self._stats,
+        }
+
+
+_document_cache = DocumentCache(Path(CACHE_DIR) / "documents")
+_document_refresh_flight = SingleFlight("document_refresh")
+_background_tasks: set = set()
+
+
+def get_document_cache() -> DocumentCache:
+    """获取进程内共享的文档内容缓存"""
+    return _document_cache
+
+
+def _spawn_background(coro: Awaitable[Any]) -> None:
+    """启动后台任务并保持引用，避免任务被提前回收"""
+    task = asyncio.ensure_future(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+
+async def fetch_document_data_cached(
+    cookie: str,
+    dentry_key: str,
+    export_dir: Optional[Path] = None,
+    node_id: Optional[str] = None
+) -> CachedDocument:
+    """
+    带缓存地获取文档数据（stale-while-revalidate）
+    
+    缓存未命中且提供了导出目录时，先尝试用该目录中上次导出的文件预热缓存。
+    
+    Args:
+        cookie: 钉钉登录Cookie
+        dentry_key: 文档entry key
+        export_dir: 该文档的导出目录（可选），调用方需已用该Cookie验证过文档访问权限
+        node_id: 导出文件对应的节点ID，与export_dir同时提供
+        
+    Returns:
+        CachedDocument对象，包含document_data和解析后的content
+        
+    Raises:
+        McpError: 缓存未命中且HTTP请求失败时
+    """
+    cache = get_document_cache()
+    key = (dentry_key, _cookie_fingerprint(cookie))
+    
+    async def _refresh() -> CachedDocument:
+        document_data = await fetch_document_data(cookie, dentry_key)
+        return cache.store(key, document_data)
+    
+    entry, needs_refresh = await cache.get(key)
+    if entry is None and export_dir is not None and node_id is not None and cache.enabled:
+        entry = await _warm_start_from_export(cache, key, export_dir, node_id)
+        needs_refresh = entry is not None and time.time() - entry.fetched_at > cache.ttl
+    if entry is not None:
+        if needs_refresh:
+            cache.record_refresh()
+            _spawn_background(_refresh_quietly(key, _refresh))
+        return entry
+    return await _document_refresh_flight.do(key, _refresh)
+
+
+async def _warm_start_from_export(
+    cache: DocumentCache,
+    key: Tuple[str, str],
+    export_dir: Path,
+    node_id: str
+) -> Optional[CachedDocument]:
+    """
+    从导出目录预热文档缓存
+    
+    以导出文件的修改时间作为获取时间，超出stale窗口的导出不再读取；
+    导出中的mainsite与dentryKey不一致（或缺失）时不使用。
+    """
+    path = find_exported_document(export_dir, node_id)
+    if path is None:
+        return None
+    try:
+        fetched_at = path.stat().st_mtime
+    except OSError:
+        return None
+    if time.time() - fetched_at > cache.ttl + cache.stale_ttl:
+        return None
+    try:
+        exported = await get_export_writer().run(load_exported_document, export_dir, node_id)
+        if exported["mainsite"] is None or extract_dentry_key(exported["mainsite"]) != key[0]:
+            return None
+    except (McpError, OSError, ValueError) as e:
+        logger.info(f"导出目录预热缓存失败 {export_dir}: {str(e)}")
+        return None
+    if exported["document"] is None:
+        return None
+    logger.info(f"从导出目录预热文档缓存: {path}")
+    return cache.seed(key, exported["document"], exported["content"], fetched_at)
+
+
+async def _refresh_quietly(key: Tuple[str, str], refresh: Callable[[], Awaitable[CachedDocument]]) -> None:
+    """后台刷新文档缓存，失败时只记录日志（继续使用旧内容）"""
+    try:
+        await _document_refresh_flight.do(key, refresh)
     except Exception as e:
-        raise McpError(ErrorData(
-            code=INTERNAL_ERROR,
-            message=f"生成HTML失败: {str(e)}"
-        ))
+        logger.warning(f"后台刷新文档缓存失败 {key[0]}: {str(e)}")
+
+
+# ==================== 运行状态 ====================
+def collect_server_stats() -> Dict[str, Any]:
+    """
+    汇总服务内部各组件的运行状态
+
+    Returns:
+        运行状态字典
+    """
+    return {
+        "image_downloads": get_image_scheduler().snapshot(),
+        "rate_limiters": {kind: bucket.snapshot() for kind, bucket in _rate_limiters.items()},
+        "circuit_breakers": {host: breaker.snapshot() for host, breaker in _circuit_breakers.items()},
+        "dentry_cache": get_dentry_cache().snapshot(),
+        "document_cache": get_document_cache().snapshot(),
+        "render_cache": get_render_cache().snapshot(),
+        "page_cache": get_page_cache().snapshot(),
+        "json_backend": _json_codec.name,
+        "render_offload": get_render_offloader().snapshot(),
+        "export_writer": get_export_writer().snapshot(),
+        "image_store": get_image_store().snapshot() if IMAGE_STORE_ENABLED else None,
+        "image_proxy": _image_proxy.snapshot() if _image_proxy is not None else None,
+        "output_formats": output_size_snapshot(),
+        "single_flight": {
+            "documents": _document_flight.snapshot(),
+            "images": _image_flight.snapshot(),
+            "image_store": _image_store_flight.snapshot(),
+        },
+    }
 
 
 # ==================== 主流程函数 ====================
@@ -989,6 +5304,24 @@ def _sanitize_filename(filename: str) -> str:
     return filename
 
 
+def _resolve_output_path(output_dir: Optional[str], doc_title: str) -> Path:
+    """
+    确定文档的导出目录（基础目录下以文档标题命名的文件夹，不创建目录）
+    
+    Args:
+        output_dir: 基础输出目录，为空时使用环境变量配置的默认输出目录
+        doc_title: 文档标题
+        
+    Returns:
+        导出目录路径
+    """
+    # 清理标题作为文件夹名
+    folder_name = _sanitize_filename(doc_title)
+    # 确定基础输出目录（展开用户提供的路径中的~符号）
+    base_dir = os.path.expanduser(output_dir) if output_dir else DEFAULT_OUTPUT_DIR
+    return Path(base_dir) / folder_name
+
+
 def _get_document_title_from_mainsite(mainsite_content: Dict[str, Any]) -> str:
     """
     从mainsite_content中提取文档标题
@@ -1009,25 +5342,98 @@ def _get_document_title_from_mainsite(mainsite_content: Dict[str, Any]) -> str:
     return '钉钉文档'
 
 
-def _save_json_file(output_dir: Path, filename: str, data: Dict[str, Any]) -> None:
-    """保存JSON文件"""
-    file_path = output_dir / filename
-    with open(file_path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+async def _save_json_file(output_dir: Path, filename: str, data: Dict[str, Any]) -> None:
+    """保存JSON文件（在写入线程池中序列化并原子写入）"""
+    await get_export_writer().write_json(output_dir / filename, data)
+
+
+async def _save_html_file(output_dir: Path, filename: str, content: str) -> None:
+    """保存HTML文件（在写入线程池中原子写入）"""
+    await get_export_writer().write_text(output_dir / filename, content)
+
+
+async def _download_images(image_urls: Iterable[str], cookie: str, output_path: Path) -> Dict[str, str]:
+    """
+    批量下载图片（并发数由共享调度器控制）
+    
+    Returns:
+        下载成功的图片URL到本地相对路径的映射
+    """
+    # 规范化URL → 原始URL列表：同一图片的不同签名URL只下载一次
+    url_groups: Dict[str, List[str]] = {}
+    for url in image_urls:
+        url_groups.setdefault(normalize_image_url(url), []).append(url)
+    
+    download_tasks = [
+        download_image(urls[0], cookie, output_path) 
+        for urls in url_groups.values()
+    ]
+    index_key = retain_image_index(output_path / "images")
+    try:
+        results = await asyncio.gather(*download_tasks, return_exceptions=True)
+        if IMAGE_STORE_ENABLED:
+            # 存储模式下图片记录在全局存储的索引中，导出目录没有自己的索引
+            get_image_store().flush()
+            partials_dir = get_image_store().incoming_dir
+        else:
+            get_image_index(output_path / "images").flush()
+            partials_dir = output_path / "images"
+        # 清理早先中断且长期未续传的临时文件
+        get_export_writer().submit(_remove_stale_partials, partials_dir)
+    finally:
+        # 长期运行的服务不保留已完成导出目录的索引，下次导出时从磁盘重新加载
+        release_image_index(index_key)
+    
+    # 构建URL到本地路径的映射（键为文档中的原始URL，供HTML渲染查找）
+    image_url_map = {}
+    for urls, result in zip(url_groups.values(), results):
+        if result and not isinstance(result, Exception):
+            for url in urls:
+                image_url_map[url] = result
+    return image_url_map
 
 
-def _save_html_file(output_dir: Path, filename: str, content: str) -> None:
-    """保存HTML文件"""
-    file_path = output_dir / filename
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(content)
+async def _render_while_downloading(
+    content: Dict[str, Any],
+    doc_title: str,
+    image_urls: Iterable[str],
+    cookie: str,
+    output_path: Path,
+    size_hint: Optional[int],
+    content_key: Optional[str] = None
+) -> Tuple[Optional[str], Dict[str, str]]:
+    """
+    图片下载与HTML生成并行执行
+    
+    HTML先以图片占位符渲染，下载全部结束后一次性替换为本地路径（或下载失败提示），
+    总耗时约为 max(渲染, 下载) 而不是两者之和。低于离线程阈值的文档也在线程中渲染，
+    否则内联渲染会占住事件循环，下载任务要等渲染结束才开始。
+    
+    Returns:
+        (最终HTML字符串或None, 图片URL到本地路径的映射)
+    """
+    downloads = asyncio.ensure_future(_download_images(image_urls, cookie, output_path))
+    try:
+        placeholder_html = await render_html_async(
+            content, doc_title, size_hint=size_hint, image_placeholders=True, content_key=content_key, off_loop=True
+        )
+    except BaseException:
+        downloads.cancel()
+        raise
+    image_url_map = await downloads
+    if placeholder_html is None:
+        return None, image_url_map
+    return resolve_image_placeholders(placeholder_html, image_url_map), image_url_map
 
 
 async def get_complete_document_data(
     url_or_node_id: str,
     cookie: str,
     save_files: bool = True,
-    output_dir: Optional[str] = None
+    output_dir: Optional[str] = None,
+    image_mode: str = "download",
+    output_format: str = "html",
+    paginate: bool = False
 ) -> DocumentResult:
     """
     完整获取钉钉文档数据的流程
@@ -1037,6 +5443,11 @@ async def get_complete_document_data(
         cookie: 钉钉登录Cookie
         save_files: 是否保存中间文件
         output_dir: 输出目录路径
+        image_mode: 图片处理方式（download: 保存文件时下载图片；proxy: 改写为本机代理地址；
+            remote: 保留原始地址）
+        output_format: 返回的渲染格式（html / markdown / text）；非HTML格式的结果放在rendered中，
+            不保存文件时不再生成HTML
+        paginate: 是否按正文块返回渲染结果（放在blocks中，代替html/rendered），用于分页
         
     Returns:
         DocumentResult对象，包含解析结果
@@ -1046,77 +5457,163 @@ async def get_complete_document_data(
     """
     node_id = extract_node_id_from_url(url_or_node_id)
     
-    # 步骤1: GET请求获取HTML
-    html = await fetch_node_by_get(node_id, cookie)
+    # 同一身份对同一文档的并发请求只执行一次流水线
+    flight_key = (
+        node_id, _cookie_fingerprint(cookie), save_files, output_dir if save_files else None,
+        image_mode, output_format, paginate
+    )
+    return await _document_flight.do(
+        flight_key,
+        lambda: _run_document_pipeline(node_id, cookie, save_files, output_dir, image_mode, output_format, paginate),
+    )
+
+
+async def _fetch_document_data_for_node(
+    node_id: str,
+    cookie: str,
+    save_files: bool = False,
+    output_dir: Optional[str] = None
+) -> Tuple[Optional[Dict[str, Any]], str, str, CachedDocument]:
+    """
+    获取文档的dentryKey、标题和文档数据
+    
+    dentryKey缓存命中时直接获取文档数据，不再请求文档页面；
+    缓存的dentryKey对应的文档不存在时删除条目并回退到完整流程。
+    其他错误（熔断、限流、服务端错误、当前用户无权限等）直接抛出，不影响共享的缓存条目。
+    文档数据经过文档内容缓存，未过期时不发起POST请求。
     
-    # 步骤2: 提取JSON
-    mainsite_content = extract_mainsite_content(html)
+    Args:
+        node_id: 文档节点ID
+        cookie: 钉钉登录Cookie
+        save_files: 是否保存文件；保存时需要mainsite内容，缓存中没有时回退到页面请求，
+            且页面请求后文档缓存未命中时尝试从上次的导出目录预热
+        output_dir: 导出的基础目录，None表示使用默认目录
+    
+    Returns:
+        (mainsite_content, dentry_key, doc_title, document)，
+        不保存文件且dentryKey缓存命中时mainsite_content为None
+    """
+    dentry_cache = get_dentry_cache()
+    owner = _cookie_fingerprint(cookie)
+    cached = dentry_cache.get(node_id)
+    if cached:
+        try:
+            document = await fetch_document_data_cached(cookie, cached['dentry_key'])
+        except DocumentNotFoundError as e:
+            logger.info(f"dentryKey缓存已失效，回退到页面请求 {node_id}: {e.error.message[:200]}")
+            dentry_cache.invalidate(node_id)
+        else:
+            mainsite_content = None
+            if save_files:
+                mainsite_content = await get_export_writer().run(dentry_cache.load_mainsite, node_id, owner)
+            if not save_files or mainsite_content is not None:
+                return mainsite_content, cached['dentry_key'], cached['title'], document
+    
+    # 步骤1-2: GET请求获取页面，流式提取mainsite_server_content的JSON
+    mainsite_content = await fetch_mainsite_content(node_id, cookie)
     
     # 步骤2.5: 从mainsite_content中提取文档标题
     doc_title = _get_document_title_from_mainsite(mainsite_content)
     
-    # 步骤2.6: 如果保存文件，创建以标题命名的文件夹
+    # 步骤3: 提取dentryKey
+    dentry_key = extract_dentry_key(mainsite_content)
+    
+    # 步骤4: POST请求获取文档数据（页面请求已验证访问权限，可从上次的导出目录预热）
+    export_dir = _resolve_output_path(output_dir, doc_title) if save_files else None
+    document = await fetch_document_data_cached(cookie, dentry_key, export_dir, node_id)
+    
+    dentry_cache.put(node_id, dentry_key, doc_title, mainsite_content, owner)
+    return mainsite_content, dentry_key, doc_title, document
+
+
+async def _run_document_pipeline(
+    node_id: str,
+    cookie: str,
+    save_files: bool,
+    output_dir: Optional[str],
+    image_mode: str = "download",
+    output_format: str = "html",
+    paginate: bool = False
+) -> DocumentResult:
+    """get_complete_document_data的实际流水线（未合并）"""
+    # 步骤1-4: 获取dentryKey、标题和文档数据（dentryKey缓存命中时跳过页面GET）
+    mainsite_content, dentry_key, doc_title, document = await _fetch_document_data_for_node(
+        node_id, cookie, save_files, output_dir
+    )
+    document_data = document.document_data
+    
+    # 步骤4.5: 如果保存文件，创建以标题命名的文件夹
     if save_files:
-        # 清理标题作为文件夹名
-        folder_name = _sanitize_filename(doc_title)
-        
-        # 确定基础输出目录（展开~符号）
-        if not output_dir:
-            # 使用环境变量配置的默认输出目录
-            base_dir = DEFAULT_OUTPUT_DIR
-        else:
-            # 展开用户提供的路径中的~符号
-            base_dir = os.path.expanduser(output_dir)
-        
-        # 创建以文档标题命名的文件夹
-        output_path = Path(base_dir) / folder_name
+        output_path = _resolve_output_path(output_dir, doc_title)
         output_path.mkdir(parents=True, exist_ok=True)
     else:
         output_path = None
     
-    if save_files and output_path:
-        _save_json_file(output_path, f'{node_id}_mainsite.json', mainsite_content)
-    
-    # 步骤3: 提取dentryKey
-    dentry_key = extract_dentry_key(mainsite_content)
-    
-    # 步骤4: POST请求获取文档数据
-    document_data = await fetch_document_data(cookie, dentry_key)
+    # 步骤5: 提取内容（已由文档缓存解析）
+    content = document.content
+    size_hint = _document_content_size(document_data)
+    content_key = document_content_key(dentry_key, document.version)
     
+    saved_files: List[str] = []
     if save_files and output_path:
-        _save_json_file(output_path, f'{node_id}_document.json', document_data)
-    
-    # 步骤5: 提取内容
-    content = extract_document_content(document_data)
+        if EXPORT_STORAGE_MODE == "compact":
+            # 紧凑模式：mainsite、document与content合并去重后压缩为单个文件
+            saved_files.append(await save_compact_export(output_path, node_id, mainsite_content, document_data))
+        else:
+            await _save_json_file(output_path, f'{node_id}_mainsite.json', mainsite_content)
+            saved_files.append(f'{node_id}_mainsite.json')
+            await _save_json_file(output_path, f'{node_id}_document.json', document_data)
+            saved_files.append(f'{node_id}_document.json')
+            if content:
+                await _save_json_file(output_path, f'{node_id}_content.json', content)
+                saved_files.append(f'{node_id}_content.json')
     
     html_content = None
-    image_url_map = None
+    rendered = None
+    blocks = None
     if content:
-        if save_files and output_path:
-            _save_json_file(output_path, f'{node_id}_content.json', content)
-        
-        # 步骤5.5: 收集并下载所有图片
-        if save_files and output_path:
-            image_urls = collect_image_urls(content)
-            if image_urls:
-                image_url_map = {}
-                # 批量下载图片
-                download_tasks = [
-                    download_image(url, cookie, output_path) 
-                    for url in image_urls
-                ]
-                results = await asyncio.gather(*download_tasks, return_exceptions=True)
-                
-                # 构建URL到本地路径的映射
-                for url, result in zip(image_urls, results):
-                    if result and not isinstance(result, Exception):
-                        image_url_map[url] = result
+        image_urls = None
+        if (save_files and output_path and image_mode == "download") or image_mode == "proxy":
+            image_urls = await collect_image_urls_async(content, size_hint)
+        stream_html = bool(save_files and output_path and _should_stream_html(size_hint))
         
-        # 步骤6: 生成HTML（使用从mainsite中获取的标题）
-        html_content = generate_html_from_content(content, doc_title, image_url_map)
+        if image_urls and image_mode == "download" and not stream_html:
+            # 步骤5.5 + 6: 下载图片的同时用占位符生成HTML，全部完成后一次替换为最终图片路径
+            html_content, image_url_map = await _render_while_downloading(
+                content, doc_title, image_urls, cookie, output_path, size_hint, content_key
+            )
+        else:
+            # 步骤5.5: 下载所有图片（代理模式只登记到本机代理，浏览器查看时才获取）
+            image_url_map = None
+            if image_urls and image_mode == "proxy":
+                image_url_map = await _proxy_image_urls(image_urls, cookie)
+            elif image_urls:
+                image_url_map = await _download_images(image_urls, cookie, output_path)
+            
+            # 步骤6: 生成HTML（使用从mainsite中获取的标题）
+            if stream_html:
+                # 超大文档：在渲染执行器中逐块生成并直接写入文件，不在内存中拼接完整HTML
+                if await stream_html_to_file_async(
+                    output_path / f'{node_id}.html', content, doc_title, image_url_map, size_hint
+                ):
+                    saved_files.append(f'{node_id}.html')
+            elif save_files or (output_format == "html" and not paginate):
+                html_content = await render_html_async(
+                    content, doc_title, image_url_map, size_hint, content_key=content_key
+                )
         
         if save_files and html_content and output_path:
-            _save_html_file(output_path, f'{node_id}.html', html_content)
+            await _save_html_file(output_path, f'{node_id}.html', html_content)
+            saved_files.append(f'{node_id}.html')
+        
+        if paginate:
+            blocks = await render_output_blocks_async(
+                content, doc_title, image_url_map, size_hint, output_format, content_key
+            )
+        elif output_format != "html":
+            rendered = await render_html_async(
+                content, doc_title, image_url_map, size_hint, output_format=output_format, content_key=content_key
+            )
     
     return DocumentResult(
         node_id=node_id,
@@ -1125,7 +5622,173 @@ async def get_complete_document_data(
         document_data=document_data,
         content=content,
         html=html_content,
-        output_dir=str(output_path) if output_path else None
+        output_dir=str(output_path) if output_path else None,
+        saved_files=saved_files if output_path else None,
+        rendered=rendered,
+        blocks=blocks
+    )
+
+
+async def parse_documents(
+    url_or_node_ids: List[str],
+    cookie: str,
+    save_files: bool = True,
+    output_dir: Optional[str] = None,
+    image_mode: str = "download",
+    concurrency: Optional[int] = None
+) -> List[BatchDocumentStatus]:
+    """
+    批量解析多个文档，最多同时执行concurrency个流水线
+    
+    所有文档共享进程内的HTTP连接池、图片下载调度、限流和各级缓存；
+    单个文档失败只记录在其结果中，不影响其他文档。
+    
+    Args:
+        url_or_node_ids: 钉钉文档URL或NODE_ID列表
+        cookie: 钉钉登录Cookie
+        save_files: 是否保存中间文件
+        output_dir: 输出目录路径
+        image_mode: 图片处理方式（download / proxy）
+        concurrency: 同时解析的文档数，默认使用BATCH_CONCURRENCY
+        
+    Returns:
+        与输入顺序一致的结果列表
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency or BATCH_CONCURRENCY))
+    
+    async def _parse_one(index: int, url_or_node_id: str) -> BatchDocumentStatus:
+        status = BatchDocumentStatus(index=index, url_or_node_id=url_or_node_id, ok=False)
+        queued_at = time.monotonic()
+        async with semaphore:
+            started_at = time.monotonic()
+            status.wait = started_at - queued_at
+            try:
+                result = await get_complete_document_data(url_or_node_id, cookie, save_files, output_dir, image_mode)
+                status.ok = True
+                status.node_id = result.node_id
+                if result.document_data:
+                    status.doc_name = result.document_data.get('data', {}).get('fileMetaInfo', {}).get('name')
+                status.output_dir = result.output_dir
+                status.saved_files = result.saved_files
+            except McpError as e:
+                status.error = e.error.message
+            except Exception as e:
+                status.error = format_exception(e, "解析钉钉文档")
+            status.elapsed = time.monotonic() - started_at
+        if not status.ok:
+            logger.warning(f"批量解析中文档失败 {url_or_node_id}: {status.error[:200]}")
+        return status
+    
+    return list(await asyncio.gather(*(
+        _parse_one(index, url_or_node_id) for index, url_or_node_id in enumerate(url_or_node_ids)
+    )))
+
+
+def format_batch_result(statuses: List[BatchDocumentStatus], elapsed: float) -> str:
+    """把批量解析结果格式化为逐文档的状态列表"""
+    succeeded = sum(1 for status in statuses if status.ok)
+    icon = "✅" if succeeded == len(statuses) else "⚠️"
+    output = [f"{icon} 批量解析完成：成功 {succeeded} / 共 {len(statuses)}，总耗时 {elapsed:.2f}s\n"]
+    for status in statuses:
+        timing = f"{status.elapsed:.2f}s（排队 {status.wait:.2f}s）"
+        if status.ok:
+            output.append(f"✅ [{status.index + 1}] {status.node_id} {status.doc_name or ''} - {timing}")
+            if status.output_dir:
+                output.append(f"   📁 {status.output_dir}（{len(status.saved_files or [])} 个文件）")
+        else:
+            # 错误信息压缩为一行，完整信息见服务日志
+            error = " ".join(line.strip() for line in (status.error or "未知错误").splitlines() if line.strip())
+            output.append(f"❌ [{status.index + 1}] {status.url_or_node_id} - {timing}")
+            output.append(f"   {error[:300]}")
+    return "\n".join(output)
+
+
+async def _load_outlined_document(node_id: str, cookie: str) -> Tuple[str, str, str, CachedDocument]:
+    """
+    获取文档数据及其预先计算的大纲（经过dentryKey缓存和文档内容缓存）
+    
+    Returns:
+        (dentryKey, 文档标题, 文档名称, 缓存条目)
+        
+    Raises:
+        McpError: 无法提取文档内容时
+    """
+    _, dentry_key, doc_title, document = await _fetch_document_data_for_node(node_id, cookie)
+    document_data = document.document_data
+    doc_name = document_data.get('data', {}).get('fileMetaInfo', {}).get('name', '未知') if document_data else '未知'
+    if not document.content or document.outline is None:
+        raise McpError(ErrorData(code=INTERNAL_ERROR, message="无法提取文档内容（可能是OSS加密）"))
+    return dentry_key, doc_title, doc_name, document
+
+
+async def get_document_outline(url_or_node_id: str, cookie: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    获取文档大纲
+    
+    Args:
+        url_or_node_id: 钉钉文档URL或NODE_ID
+        cookie: 钉钉登录Cookie
+        
+    Returns:
+        (文档名称, 大纲)
+        
+    Raises:
+        McpError: 无法提取文档内容时
+    """
+    _, _, doc_name, document = await _load_outlined_document(extract_node_id_from_url(url_or_node_id), cookie)
+    return doc_name, document.outline
+
+
+async def get_document_section(
+    url_or_node_id: str,
+    cookie: str,
+    heading: Optional[str] = None,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+    image_mode: str = "remote",
+    output_format: str = "html"
+) -> DocumentSection:
+    """
+    提取文档的一个章节：按缓存中预先计算的大纲定位块范围，只渲染该范围内的块
+    
+    Args:
+        url_or_node_id: 钉钉文档URL或NODE_ID
+        cookie: 钉钉登录Cookie
+        heading: 章节标题文本（优先于块范围）
+        start: 起始顶层块下标（含）
+        end: 结束顶层块下标（不含）
+        image_mode: 图片处理方式（remote: 保留原始地址；proxy: 改写为本机代理地址）
+        output_format: 输出格式（html / markdown / text）
+        
+    Returns:
+        DocumentSection对象
+        
+    Raises:
+        McpError: 无法提取文档内容、标题不存在或块范围无效时
+    """
+    node_id = extract_node_id_from_url(url_or_node_id)
+    dentry_key, doc_title, doc_name, document = await _load_outlined_document(node_id, cookie)
+    outline = document.outline
+    
+    start, end, item = resolve_section_range(outline, heading, start, end)
+    # 章节从标题块开始，标题及其下级标题由渲染器输出在正文中
+    section_content = slice_document_content(document.content, start, end)
+    
+    image_url_map = None
+    if image_mode == "proxy":
+        image_url_map = await _proxy_image_urls(collect_image_urls(section_content), cookie)
+    rendered = await render_html_async(
+        section_content, doc_title, image_url_map, output_format=output_format,
+        content_key=f"{document_content_key(dentry_key, document.version)}#{start}:{end}"
+    )
+    return DocumentSection(
+        node_id=node_id,
+        doc_name=doc_name,
+        start=start,
+        end=end,
+        total_blocks=outline["blocks"],
+        heading=item,
+        rendered=rendered
     )
 
 
@@ -1135,18 +5798,41 @@ async def serve() -> None:
     
     @server.list_tools()
     async def list_tools() -> list[Tool]:
-        return [
+        tools = [
             Tool(
                 name="parse_document",
                 description="解析钉钉文档，提取内容并生成HTML文件",
                 inputSchema=DingTalkDocRequest.model_json_schema(),
             ),
+            Tool(
+                name="parse_documents",
+                description="批量解析多个钉钉文档（并发执行，共享连接池与图片存储），返回每个文档的状态和耗时",
+                inputSchema=DingTalkDocBatchRequest.model_json_schema(),
+            ),
             Tool(
                 name="get_html",
-                description="快速获取钉钉文档的HTML内容（不保存文件）",
+                description="快速获取钉钉文档的HTML内容（不保存文件）；大文档可用max_bytes/max_blocks分页，并用返回的cursor获取后续页",
                 inputSchema=DingTalkDocParseRequest.model_json_schema(),
-            )
+            ),
+            Tool(
+                name="get_section",
+                description="提取钉钉文档的单个章节（按标题或顶层块范围），只渲染该章节；不指定标题和范围时返回文档大纲",
+                inputSchema=DingTalkDocSectionRequest.model_json_schema(),
+            ),
+            Tool(
+                name="get_server_stats",
+                description="查看服务运行状态（图片下载并发窗口、排队数量等）",
+                inputSchema=ServerStatsRequest.model_json_schema(),
+            ),
         ]
+        if IMAGE_STORE_ENABLED:
+            # 未启用全局图片存储时没有可清理的内容，不提供该工具
+            tools.append(Tool(
+                name="gc_image_store",
+                description="清理全局图片存储中不再被任何导出目录引用的图片",
+                inputSchema=ImageStoreGcRequest.model_json_schema(),
+            ))
+        return tools
     
     @server.list_prompts()
     async def list_prompts() -> list[Prompt]:
@@ -1184,7 +5870,8 @@ async def serve() -> None:
                     args.url_or_node_id,
                     cookie,
                     args.save_files,
-                    args.output_dir
+                    args.output_dir,
+                    args.image_mode
                 )
                 
                 output = [f"✅ 钉钉文档解析成功！"]
@@ -1201,17 +5888,13 @@ async def serve() -> None:
                     parts_count = len(result.content.get('parts', {}))
                     output.append(f"   - Parts数量: {parts_count}")
                 
-                if result.html:
+                if result.html or f"{result.node_id}.html" in (result.saved_files or []):
                     output.append(f"\n✅ HTML生成成功")
                 
                 if result.output_dir:
                     output.append(f"\n📁 输出目录: {result.output_dir}")
-                    output.append(f"   - {result.node_id}_mainsite.json")
-                    output.append(f"   - {result.node_id}_document.json")
-                    if result.content:
-                        output.append(f"   - {result.node_id}_content.json")
-                    if result.html:
-                        output.append(f"   - {result.node_id}.html")
+                    for filename in result.saved_files or []:
+                        output.append(f"   - {filename}")
                 
                 return [TextContent(type="text", text="\n".join(output))]
                 
@@ -1233,6 +5916,30 @@ async def serve() -> None:
                     message=f"文档解析失败:\n{error_msg}"
                 ))
         
+        elif name == "parse_documents":
+            try:
+                args = DingTalkDocBatchRequest(**arguments)
+            except ValueError as e:
+                raise McpError(ErrorData(code=INVALID_PARAMS, message=str(e)))
+            if len(args.url_or_node_ids) > BATCH_MAX_DOCUMENTS:
+                raise McpError(ErrorData(
+                    code=INVALID_PARAMS,
+                    message=f"单次最多解析 {BATCH_MAX_DOCUMENTS} 个文档，实际 {len(args.url_or_node_ids)} 个"
+                ))
+            
+            cookie = check_cookie(args.cookie)
+            
+            started_at = time.monotonic()
+            statuses = await parse_documents(
+                args.url_or_node_ids,
+                cookie,
+                args.save_files,
+                args.output_dir,
+                args.image_mode,
+                args.concurrency
+            )
+            return [TextContent(type="text", text=format_batch_result(statuses, time.monotonic() - started_at))]
+        
         elif name == "get_html":
             try:
                 args = DingTalkDocParseRequest(**arguments)
@@ -1241,19 +5948,47 @@ async def serve() -> None:
             
             cookie = check_cookie(args.cookie)
             
+            if args.cursor:
+                # 后续页：直接从缓存的渲染结果中读取，不重新获取文档
+                token, entry, start = lookup_rendered_pages(
+                    args.cursor, extract_node_id_from_url(args.url_or_node_id), cookie
+                )
+                check_page_params(entry, {name: getattr(args, name) for name in args.model_fields_set})
+                return [TextContent(type="text", text=format_page_response(entry, start, token))]
+            
+            max_bytes = args.max_bytes
+            if max_bytes is None and args.max_blocks is None and PAGE_MAX_BYTES > 0:
+                max_bytes = PAGE_MAX_BYTES
+            paginate = max_bytes is not None or args.max_blocks is not None
+            
             try:
                 result = await get_complete_document_data(
                     args.url_or_node_id,
                     cookie,
-                    save_files=False
+                    save_files=False,
+                    image_mode=args.image_mode,
+                    output_format=args.format,
+                    paginate=paginate
                 )
                 
-                if result.html:
-                    doc_name = result.document_data.get('data', {}).get('fileMetaInfo', {}).get('name', '未知') if result.document_data else '未知'
-                    output = [f"✅ HTML生成成功\n"]
-                    output.append(f"文档: {doc_name}\n")
-                    output.append("--- HTML 内容 ---\n")
-                    output.append(result.html)
+                doc_name = result.document_data.get('data', {}).get('fileMetaInfo', {}).get('name', '未知') if result.document_data else '未知'
+                if result.blocks:
+                    entry = new_rendered_pages(
+                        result.node_id, doc_name, cookie, args.format, args.image_mode,
+                        result.blocks, max_bytes, args.max_blocks
+                    )
+                    return [TextContent(type="text", text=format_page_response(entry, 0))]
+                
+                body = result.html if args.format == "html" else result.rendered
+                if body:
+                    label = OUTPUT_FORMAT_LABELS[args.format]
+                    size = len(body.encode('utf-8'))
+                    record_output_size(args.format, size)
+                    output = [f"✅ {label}生成成功\n"]
+                    output.append(f"文档: {doc_name}")
+                    output.append(f"大小: {size} 字节\n")
+                    output.append(f"--- {label} 内容 ---\n")
+                    output.append(body)
                     return [TextContent(type="text", text="\n".join(output))]
                 else:
                     return [TextContent(type="text", text="⚠️ 无法提取文档内容（可能是OSS加密）")]
@@ -1274,6 +6009,76 @@ async def serve() -> None:
                     message=f"文档解析失败:\n{error_msg}"
                 ))
         
+        elif name == "get_section":
+            try:
+                args = DingTalkDocSectionRequest(**arguments)
+            except ValueError as e:
+                raise McpError(ErrorData(code=INVALID_PARAMS, message=str(e)))
+            
+            cookie = check_cookie(args.cookie)
+            
+            try:
+                if not args.heading and args.start_block is None:
+                    doc_name, outline = await get_document_outline(args.url_or_node_id, cookie)
+                    return [TextContent(type="text", text=format_outline(outline, doc_name))]
+                
+                section = await get_document_section(
+                    args.url_or_node_id,
+                    cookie,
+                    heading=args.heading,
+                    start=args.start_block,
+                    end=args.end_block,
+                    image_mode=args.image_mode,
+                    output_format=args.format
+                )
+                
+                label = OUTPUT_FORMAT_LABELS[args.format]
+                body = section.rendered or ""
+                size = len(body.encode('utf-8'))
+                record_output_size(args.format, size)
+                output = [f"✅ 章节提取成功\n"]
+                output.append(f"文档: {section.doc_name}")
+                if section.heading:
+                    output.append(f"章节: {section.heading['text']} (h{section.heading['level']})")
+                output.append(f"范围: 块 {section.start}-{section.end} / 共 {section.total_blocks} 块")
+                output.append(f"大小: {size} 字节\n")
+                output.append(f"--- {label} 内容 ---\n")
+                output.append(body)
+                return [TextContent(type="text", text="\n".join(output))]
+                
+            except McpError:
+                raise
+            except Exception as e:
+                error_msg = format_exception(e, "提取章节")
+                try:
+                    error_msg += f"\n【请求参数】\n"
+                    error_msg += f"  - URL或Node ID: {args.url_or_node_id}\n"
+                    error_msg += f"  - 标题: {args.heading or '(未指定)'}\n"
+                    error_msg += f"  - 块范围: {args.start_block}-{args.end_block}\n"
+                except:
+                    pass
+                logger.error(f"提取章节失败: {error_msg}")
+                raise McpError(ErrorData(
+                    code=INTERNAL_ERROR,
+                    message=f"章节提取失败:\n{error_msg}"
+                ))
+        
+        elif name == "get_server_stats":
+            stats = collect_server_stats()
+            return [TextContent(type="text", text=json.dumps(stats, ensure_ascii=False, indent=2))]
+        
+        elif name == "gc_image_store":
+            try:
+                args = ImageStoreGcRequest(**(arguments or {}))
+            except ValueError as e:
+                raise McpError(ErrorData(code=INVALID_PARAMS, message=str(e)))
+            
+            if not IMAGE_STORE_ENABLED:
+                return [TextContent(type="text", text="全局图片存储未启用（DINGTALK_IMAGE_STORE），无需清理")]
+            grace_seconds = IMAGE_STORE_GC_GRACE if args.grace_seconds is None else args.grace_seconds
+            summary = await get_image_store().gc(grace_seconds)
+            return [TextContent(type="text", text=json.dumps(summary, ensure_ascii=False, indent=2))]
+        
         else:
             raise McpError(ErrorData(
                 code=INVALID_PARAMS,
@@ -1326,8 +6131,17 @@ async def serve() -> None:
             )
     
     options = server.create_initialization_options()
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(read_stream, write_stream, options, raise_exceptions=True)
+    # 整个服务生命周期共享一个HTTP连接池
+    get_http_client()
+    try:
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(read_stream, write_stream, options, raise_exceptions=True)
+    finally:
+        await close_http_client()
+        if _image_proxy is not None:
+            await _image_proxy.close()
+        get_export_writer().shutdown()
+        get_render_offloader().shutdown()
 
 
 def main():
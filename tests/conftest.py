@@ -0,0 +1,15 @@
+"""
+测试公共配置
+
+在导入server之前把缓存与导出目录指向临时目录，避免读写用户目录。
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+os.environ.setdefault("DINGTALK_DOC_CACHE_DIR", tempfile.mkdtemp(prefix="dingtalk-test-cache-"))
+os.environ.setdefault("DINGTALK_DOC_OUTPUT_DIR", tempfile.mkdtemp(prefix="dingtalk-test-output-"))
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
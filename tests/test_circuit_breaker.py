@@ -0,0 +1,144 @@
+"""熔断器状态转换与重试策略"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import server
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def status_error(status, headers=None):
+    request = httpx.Request("GET", "https://alidocs.dingtalk.com/x")
+    response = httpx.Response(status, headers=headers, request=request)
+    return httpx.HTTPStatusError("error", request=request, response=response)
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = server.CircuitBreaker("host", failure_threshold=3, recovery_timeout=30, clock=clock)
+    for _ in range(2):
+        breaker.before_request()
+        breaker.record_failure()
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.snapshot()["consecutive_failures"] == 0
+
+    for _ in range(3):
+        breaker.before_request()
+        breaker.record_failure()
+
+    assert breaker.state == "open"
+    with pytest.raises(server.CircuitOpenError):
+        breaker.before_request()
+    assert breaker.snapshot()["rejected"] == 1
+
+
+def test_breaker_half_open_allows_single_probe(clock):
+    breaker = server.CircuitBreaker("host", failure_threshold=1, recovery_timeout=30, clock=clock)
+    breaker.record_failure()
+
+    clock.now += 30
+    breaker.before_request()
+    assert breaker.state == "half_open"
+    with pytest.raises(server.CircuitOpenError):
+        breaker.before_request()
+
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_request()
+
+
+def test_breaker_reopens_when_probe_fails(clock):
+    breaker = server.CircuitBreaker("host", failure_threshold=5, recovery_timeout=30, clock=clock)
+    for _ in range(5):
+        breaker.record_failure()
+
+    clock.now += 31
+    breaker.before_request()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
+    with pytest.raises(server.CircuitOpenError):
+        breaker.before_request()
+
+
+def test_breaker_releases_probe_on_cancel(clock):
+    breaker = server.CircuitBreaker("host", failure_threshold=1, recovery_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now += 31
+    breaker.before_request()
+
+    breaker.record_cancelled()
+
+    breaker.before_request()
+    assert breaker.state == "half_open"
+
+
+def test_retry_policy_classifies_errors():
+    policy = server.RetryPolicy()
+    assert policy.is_retryable(status_error(503))
+    assert policy.is_retryable(status_error(429))
+    assert policy.is_retryable(httpx.ConnectError("boom"))
+    assert not policy.is_retryable(status_error(404))
+    assert not policy.is_retryable(ValueError("boom"))
+
+
+def test_retry_policy_prefers_retry_after():
+    policy = server.RetryPolicy(base_delay=0.5, max_delay=10)
+    assert policy.compute_delay(0, status_error(503, {"retry-after": "3"})) == 3
+    assert policy.compute_delay(0, status_error(503, {"retry-after": "120"})) == 10
+    for attempt in range(6):
+        assert 0 <= policy.compute_delay(attempt, status_error(503)) <= min(10, 0.5 * 2 ** attempt)
+
+
+def test_call_with_retry_retries_then_opens_breaker(monkeypatch):
+    monkeypatch.setattr(server, "_circuit_breakers", {})
+    policy = server.RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+    url = "https://retry.example.com/x"
+    server.get_circuit_breaker("retry.example.com").failure_threshold = 3
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise status_error(502)
+        return "ok"
+
+    assert asyncio.run(server.call_with_retry(flaky, url, policy)) == "ok"
+    assert len(attempts) == 3
+    assert server.get_circuit_breaker("retry.example.com").state == "closed"
+
+    async def down():
+        raise status_error(503)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(server.call_with_retry(down, url, policy))
+    with pytest.raises(server.CircuitOpenError):
+        asyncio.run(server.call_with_retry(down, url, policy))
+
+
+def test_call_with_retry_does_not_retry_client_errors(monkeypatch):
+    monkeypatch.setattr(server, "_circuit_breakers", {})
+    attempts = []
+
+    async def missing():
+        attempts.append(1)
+        raise status_error(404)
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(server.call_with_retry(missing, "https://retry.example.com/x"))
+    assert len(attempts) == 1
+    assert server.get_circuit_breaker("retry.example.com").state == "closed"
@@ -0,0 +1,70 @@
+"""dentryKey缓存：失效条目的回退与保留"""
+
+import asyncio
+import json
+
+import httpx
+import pytest
+from mcp.shared.exceptions import McpError
+
+import server
+
+CONTENT = {"main": "m", "parts": {"m": {"data": {"body": ["root", {}, ["p", {}, ["span", {}, "正文"]]]}}}}
+PAGE = (
+    '<html><body><script id="mainsite_server_content" type="application/json">'
+    + json.dumps({"dentryInfo": {"data": {"dentryKey": "DK1", "name": "My Doc.adoc"}}})
+    + "</script></body></html>"
+)
+DOCUMENT_DATA = {
+    "data": {
+        "fileMetaInfo": {"name": "My Doc", "type": "adoc"},
+        "documentContent": {"checkpoint": {"content": json.dumps(CONTENT)}},
+    }
+}
+
+
+@pytest.fixture
+def dentry_cache(tmp_path, monkeypatch):
+    cache = server.DentryCache(tmp_path / "dentry")
+    monkeypatch.setattr(server, "_dentry_cache", cache)
+    monkeypatch.setattr(server, "_document_cache", server.DocumentCache(tmp_path / "documents"))
+    return cache
+
+
+def install(monkeypatch, stale_status):
+    calls = []
+
+    def handler(request):
+        calls.append((request.method, request.headers.get("a-dentry-key")))
+        if request.url.path.startswith("/i/nodes/"):
+            return httpx.Response(200, text=PAGE)
+        if request.headers.get("a-dentry-key") == "STALE":
+            return httpx.Response(stale_status)
+        return httpx.Response(200, json=DOCUMENT_DATA)
+
+    monkeypatch.setattr(server, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return calls
+
+
+def test_missing_document_invalidates_entry_and_falls_back(dentry_cache, monkeypatch):
+    dentry_cache.put("ABC", "STALE", "Old")
+    calls = install(monkeypatch, 404)
+
+    _, dentry_key, title, document = asyncio.run(server._fetch_document_data_for_node("ABC", "cookie"))
+
+    assert (dentry_key, title) == ("DK1", "My Doc.adoc")
+    assert document.content == CONTENT
+    assert [key for method, key in calls if method == "POST"] == ["STALE", "DK1"]
+    assert dentry_cache.get("ABC")["dentry_key"] == "DK1"
+
+
+def test_access_error_keeps_shared_entry(dentry_cache, monkeypatch):
+    dentry_cache.put("ABC", "STALE", "Old")
+    calls = install(monkeypatch, 403)
+
+    with pytest.raises(McpError) as excinfo:
+        asyncio.run(server._fetch_document_data_for_node("ABC", "cookie"))
+
+    assert not isinstance(excinfo.value, server.DocumentNotFoundError)
+    assert [method for method, _ in calls] == ["POST"]
+    assert dentry_cache.get("ABC")["dentry_key"] == "STALE"
@@ -0,0 +1,71 @@
+"""文档内容缓存：从导出目录预热"""
+
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+import server
+
+CONTENT = {
+    "main": "m",
+    "parts": {"m": {"data": {"body": ["root", {}, ["p", {}, ["span", {}, "正文"]], ["h1", {}, "标题"]]}}},
+}
+MAINSITE = {"dentryInfo": {"data": {"dentryKey": "DK1", "name": "My Doc.adoc"}}}
+
+
+def make_document_data():
+    return {
+        "data": {
+            "fileMetaInfo": {"name": "My Doc", "type": "adoc"},
+            "documentContent": {"checkpoint": {"content": json.dumps(CONTENT, ensure_ascii=False)}},
+        }
+    }
+
+
+async def save_pretty(output_dir, node_id, document_data):
+    await server._save_json_file(output_dir, f"{node_id}_mainsite.json", MAINSITE)
+    await server._save_json_file(output_dir, f"{node_id}_document.json", document_data)
+    await server._save_json_file(output_dir, f"{node_id}_content.json", CONTENT)
+
+
+def test_warm_start_seeds_document_cache(tmp_path):
+    asyncio.run(save_pretty(tmp_path, "ABC", make_document_data()))
+    cache = server.DocumentCache(tmp_path / "cache")
+
+    entry = asyncio.run(server._warm_start_from_export(cache, ("DK1", "owner"), tmp_path, "ABC"))
+
+    assert entry is not None
+    assert entry.content == CONTENT
+    assert entry.fetched_at == pytest.approx((tmp_path / "ABC_document.json").stat().st_mtime)
+    assert asyncio.run(cache.get(("DK1", "owner")))[0] is entry
+    assert cache.snapshot()["seeded"] == 1
+
+
+def test_warm_start_rejects_other_document_or_expired_export(tmp_path):
+    asyncio.run(save_pretty(tmp_path, "ABC", make_document_data()))
+    cache = server.DocumentCache(tmp_path / "cache", ttl=10, stale_ttl=10)
+
+    assert asyncio.run(server._warm_start_from_export(cache, ("DK2", "owner"), tmp_path, "ABC")) is None
+
+    old = time.time() - 3600
+    os.utime(tmp_path / "ABC_document.json", (old, old))
+    assert asyncio.run(server._warm_start_from_export(cache, ("DK1", "owner"), tmp_path, "ABC")) is None
+
+
+def test_store_reparses_when_content_changes_under_same_version_field(tmp_path):
+    cache = server.DocumentCache(tmp_path / "cache")
+    first = make_document_data()
+    first["data"]["documentContent"]["checkpoint"]["baseVersion"] = 7
+    cache.store(("DK1", "owner"), first)
+
+    changed = dict(CONTENT, parts={"m": {"data": {"body": ["root", {}, ["p", {}, "新正文"]]}}})
+    second = make_document_data()
+    second["data"]["documentContent"]["checkpoint"] = {"baseVersion": 7, "content": json.dumps(changed)}
+    entry = cache.store(("DK1", "owner"), second)
+
+    assert entry.content == changed
+    assert cache.snapshot()["unchanged"] == 0
+
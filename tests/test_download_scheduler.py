@@ -0,0 +1,124 @@
+"""图片下载调度器：并发上限、单host上限与AIMD窗口调整"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import server
+
+
+def make_scheduler(**kwargs):
+    options = dict(initial=2, min_limit=1, max_limit=8, per_host_limit=2, latency_target=10.0)
+    options.update(kwargs)
+    return server.AdaptiveDownloadScheduler(**options)
+
+
+def status_error(status):
+    request = httpx.Request("GET", "https://img.example.com/a.png")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+def test_global_window_limits_in_flight():
+    async def scenario():
+        scheduler = make_scheduler(per_host_limit=10)
+        first = await scheduler.acquire("a")
+        await scheduler.acquire("b")
+        waiter = asyncio.ensure_future(scheduler.acquire("c"))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        assert scheduler.snapshot()["queued"] == 1
+
+        scheduler.release(first)
+        permit = await asyncio.wait_for(waiter, 1)
+        assert permit.host == "c"
+        assert scheduler.snapshot()["in_flight"] == 2
+
+    asyncio.run(scenario())
+
+
+def test_full_host_does_not_block_other_hosts():
+    async def scenario():
+        scheduler = make_scheduler(initial=4, per_host_limit=1)
+        first = await scheduler.acquire("a")
+        blocked = asyncio.ensure_future(scheduler.acquire("a"))
+        await asyncio.sleep(0)
+        other = await asyncio.wait_for(scheduler.acquire("b"), 1)
+
+        assert not blocked.done()
+        assert scheduler.snapshot()["in_flight_by_host"] == {"a": 1, "b": 1}
+        scheduler.release(first)
+        await asyncio.wait_for(blocked, 1)
+        scheduler.release(other)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_queue():
+    async def scenario():
+        scheduler = make_scheduler(initial=1, max_limit=1)
+        permit = await scheduler.acquire("a")
+        waiter = asyncio.ensure_future(scheduler.acquire("a"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        scheduler.release(permit)
+        assert scheduler.snapshot()["in_flight"] == 0
+        assert scheduler.snapshot()["queued"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_window_grows_additively_on_fast_successes():
+    async def scenario():
+        scheduler = make_scheduler(initial=2, max_limit=3)
+        for _ in range(20):
+            async with scheduler.slot("a") as permit:
+                permit.status_code = 200
+        snapshot = scheduler.snapshot()
+        assert snapshot["window"] == 3
+        assert snapshot["successes"] == 20
+
+    asyncio.run(scenario())
+
+
+def test_window_halves_once_per_round_trip_on_throttling():
+    async def scenario():
+        scheduler = make_scheduler(initial=8, per_host_limit=8)
+        permits = [await scheduler.acquire("a") for _ in range(4)]
+        for permit in permits:
+            permit.status_code = 429
+            scheduler.release(permit)
+        assert scheduler.limit == 4
+
+        permit = await scheduler.acquire("a")
+        scheduler.release(permit, status_error(503))
+        assert scheduler.limit == 2
+        assert scheduler.snapshot()["throttled"] == 5
+
+    asyncio.run(scenario())
+
+
+def test_client_errors_do_not_change_window():
+    async def scenario():
+        scheduler = make_scheduler(initial=4)
+        permit = await scheduler.acquire("a")
+        permit.status_code = 404
+        scheduler.release(permit)
+        assert scheduler.limit == 4
+        assert scheduler.snapshot()["errors"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_window_never_drops_below_min_limit():
+    async def scenario():
+        scheduler = make_scheduler(initial=2, min_limit=2)
+        for _ in range(3):
+            permit = await scheduler.acquire("a")
+            scheduler.release(permit, httpx.ReadTimeout("slow"))
+        assert scheduler.limit == 2
+
+    asyncio.run(scenario())
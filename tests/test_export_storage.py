@@ -0,0 +1,72 @@
+"""导出存储格式：逐文件JSON与紧凑格式的读写往返"""
+
+import asyncio
+import json
+import os
+
+import pytest
+
+import server
+
+CONTENT = {
+    "main": "m",
+    "parts": {"m": {"data": {"body": ["root", {}, ["p", {}, ["span", {}, "正文"]], ["h1", {}, "标题"]]}}},
+}
+MAINSITE = {"dentryInfo": {"data": {"dentryKey": "DK1", "name": "My Doc.adoc"}}}
+
+
+def make_document_data():
+    return {
+        "data": {
+            "fileMetaInfo": {"name": "My Doc", "type": "adoc"},
+            "documentContent": {"checkpoint": {"content": json.dumps(CONTENT, ensure_ascii=False)}},
+        }
+    }
+
+
+async def save_pretty(output_dir, node_id, document_data):
+    await server._save_json_file(output_dir, f"{node_id}_mainsite.json", MAINSITE)
+    await server._save_json_file(output_dir, f"{node_id}_document.json", document_data)
+    await server._save_json_file(output_dir, f"{node_id}_content.json", CONTENT)
+
+
+def test_pretty_export_round_trip(tmp_path):
+    document_data = make_document_data()
+    asyncio.run(save_pretty(tmp_path, "ABC", document_data))
+
+    exported = server.load_exported_document(tmp_path, "ABC")
+
+    assert exported == {"mainsite": MAINSITE, "document": document_data, "content": CONTENT}
+    assert server.find_exported_document(tmp_path, "ABC") == tmp_path / "ABC_document.json"
+
+
+@pytest.mark.parametrize("codec", ["gzip", "zstd"])
+def test_compact_export_round_trip(tmp_path, monkeypatch, codec):
+    if codec == "zstd" and not server.ZSTD_AVAILABLE:
+        pytest.skip("zstandard未安装")
+    monkeypatch.setattr(server, "EXPORT_COMPRESSION", codec)
+    document_data = make_document_data()
+
+    filename = asyncio.run(server.save_compact_export(tmp_path, "ABC", MAINSITE, document_data))
+    exported = server.load_exported_document(tmp_path, "ABC")
+
+    assert os.listdir(tmp_path) == [filename]
+    assert exported == {"mainsite": MAINSITE, "document": document_data, "content": CONTENT}
+    # 拆分checkpoint时不修改调用方的对象
+    assert isinstance(document_data["data"]["documentContent"]["checkpoint"]["content"], str)
+
+
+def test_compact_export_preferred_over_pretty(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, "EXPORT_COMPRESSION", "gzip")
+    document_data = make_document_data()
+    asyncio.run(save_pretty(tmp_path, "ABC", {"data": {}}))
+    filename = asyncio.run(server.save_compact_export(tmp_path, "ABC", MAINSITE, document_data))
+
+    assert server.find_exported_document(tmp_path, "ABC") == tmp_path / filename
+    assert server.load_exported_document(tmp_path, "ABC")["document"] == document_data
+
+
+def test_missing_export_raises(tmp_path):
+    assert server.find_exported_document(tmp_path, "ABC") is None
+    with pytest.raises(server.McpError):
+        server.load_exported_document(tmp_path, "ABC")
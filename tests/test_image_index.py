@@ -0,0 +1,58 @@
+"""图片URL规范化与图片索引的内容hash反查"""
+
+import pytest
+
+import server
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("/core/api/resources/img/a.png", "https://alidocs.dingtalk.com/core/api/resources/img/a.png"),
+    ("HTTPS://AliDocs.DingTalk.com/img/a.png", "https://alidocs.dingtalk.com/img/a.png"),
+    ("https://alidocs.dingtalk.com/img/A.png#frag", "https://alidocs.dingtalk.com/img/A.png"),
+    ("https://alidocs.dingtalk.com/img/a.png?w=2&h=1", "https://alidocs.dingtalk.com/img/a.png?h=1&w=2"),
+    ("https://alidocs.dingtalk.com/img/a.png?empty=&w=1", "https://alidocs.dingtalk.com/img/a.png?empty=&w=1"),
+])
+def test_normalize_image_url(url, expected):
+    assert server.normalize_image_url(url) == expected
+
+
+def test_normalize_image_url_drops_signature_params():
+    signed = [
+        "https://alidocs.dingtalk.com/img/a.png?Expires=1&Signature=x&OSSAccessKeyId=k&w=100",
+        "https://alidocs.dingtalk.com/img/a.png?w=100&expires=2&signature=y&OSSAccessKeyId=j",
+        "https://alidocs.dingtalk.com/img/a.png?X-Amz-Date=1&x-amz-signature=s&w=100",
+        "https://alidocs.dingtalk.com/img/a.png?x-oss-signature-version=4&security-token=t&_=9&w=100",
+    ]
+    normalized = {server.normalize_image_url(url) for url in signed}
+    assert normalized == {"https://alidocs.dingtalk.com/img/a.png?w=100"}
+    assert len({server.image_url_hash(url) for url in signed}) == 1
+
+
+def test_normalize_image_url_keeps_distinct_images_apart():
+    first = server.image_url_hash("/img/a.png?w=100")
+    assert first != server.image_url_hash("/img/b.png?w=100")
+    assert first != server.image_url_hash("/img/a.png?w=200")
+
+
+def test_image_index_finds_entries_by_sha256(tmp_path):
+    index = server.ImageIndex(tmp_path)
+    index.put("u1", ext=".png", sha256="d1")
+    index.put("u2", ext=".png", sha256="d1")
+    index.put("u3", ext=".jpg", sha256="d2")
+
+    assert index.find_by_sha256("d1")[0] == "u1"
+    assert index.find_by_sha256("d2") == ("u3", index.get("u3"))
+    assert index.find_by_sha256("missing") is None
+
+    index.remove("u1")
+    assert index.find_by_sha256("d1")[0] == "u2"
+    index.put("u2", sha256="d3")
+    assert index.find_by_sha256("d1") is None
+    assert index.find_by_sha256("d3")[0] == "u2"
+
+
+def test_image_index_rebuilds_sha256_map_from_disk(tmp_path):
+    path = tmp_path / server.IMAGE_INDEX_FILENAME
+    path.write_bytes(server.json_dumps({"version": 1, "images": {"u1": {"ext": ".png", "sha256": "d1"}}}))
+
+    assert server.ImageIndex(tmp_path).find_by_sha256("d1")[0] == "u1"
@@ -0,0 +1,120 @@
+"""本地图片代理：私有存储、登记地址的淘汰与请求头超时"""
+
+import asyncio
+
+import httpx
+import pytest
+
+import server
+
+PNG = b"\x89PNG" + b"0" * 100
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, content=PNG, headers={"content-type": "image/png"})
+
+    monkeypatch.setattr(server, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(server, "_circuit_breakers", {})
+    return requests
+
+
+async def fetch(url, headers=None):
+    async with httpx.AsyncClient() as client:
+        return await client.get(url, headers=headers)
+
+
+def test_proxy_uses_private_store_when_image_store_disabled(upstream, monkeypatch):
+    monkeypatch.setattr(server, "IMAGE_STORE_ENABLED", False)
+
+    async def scenario():
+        proxy = server.ImageProxy(port=0)
+        url = await proxy.url_for("/core/api/resources/img/a.png", "c=1")
+        response = await fetch(url)
+        root = proxy.store.root
+        cached = await fetch(url, {"if-none-match": response.headers["etag"]})
+        await proxy.close()
+        return response, cached, root
+
+    response, cached, root = asyncio.run(scenario())
+
+    assert response.status_code == 200 and response.content == PNG
+    assert cached.status_code == 304
+    assert len(upstream) == 1
+    assert not server.get_image_store().objects_dir.exists()
+    assert not root.exists()
+
+
+
+def test_proxy_tokens_are_scoped_to_cookie(upstream, monkeypatch):
+    monkeypatch.setattr(server, "IMAGE_STORE_ENABLED", False)
+
+    async def scenario():
+        proxy = server.ImageProxy(port=0)
+        first = await proxy.url_for("/core/api/resources/img/a.png", "c=1")
+        second = await proxy.url_for("/core/api/resources/img/a.png", "c=2")
+        response = await fetch(first)
+        await proxy.close()
+        return first, second, response
+
+    first, second, response = asyncio.run(scenario())
+
+    assert first != second
+    assert response.status_code == 200
+    assert [request.headers["cookie"] for request in upstream] == ["c=1"]
+
+def test_proxy_targets_are_bounded(upstream):
+    async def scenario():
+        proxy = server.ImageProxy(port=0, max_targets=2)
+        first = await proxy.url_for("/img/1.png", "c=1")
+        await proxy.url_for("/img/2.png", "c=1")
+        await proxy.url_for("/img/1.png", "c=1")
+        await proxy.url_for("/img/3.png", "c=1")
+        snapshot = proxy.snapshot()
+        statuses = [(await fetch(first)).status_code]
+        await proxy.close()
+        return snapshot, statuses
+
+    snapshot, statuses = asyncio.run(scenario())
+
+    assert snapshot["registered"] == 2
+    assert snapshot["evicted"] == 1
+    assert statuses == [200]
+
+
+def test_proxy_targets_expire(upstream):
+    async def scenario():
+        proxy = server.ImageProxy(port=0, target_ttl=60)
+        url = await proxy.url_for("/img/1.png", "c=1")
+        token = url.rsplit("/", 1)[1].split(".")[0]
+        target_url, cookie, registered_at = proxy._targets[token]
+        proxy._targets[token] = (target_url, cookie, registered_at - 61)
+        response = await fetch(url)
+        await proxy.close()
+        return response, proxy.snapshot()
+
+    response, snapshot = asyncio.run(scenario())
+
+    assert response.status_code == 404
+    assert snapshot["registered"] == 0 and snapshot["evicted"] == 1
+
+
+def test_proxy_closes_connection_when_headers_stall(monkeypatch):
+    monkeypatch.setattr(server, "IMAGE_PROXY_IDLE_TIMEOUT", 0.2)
+
+    async def scenario():
+        proxy = server.ImageProxy(port=0)
+        await proxy.start()
+        reader, writer = await asyncio.open_connection(proxy.host, proxy.port)
+        writer.write(b"GET /img/x/y.png HTTP/1.1\r\nHost: localhost\r\n")
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(), 2)
+        writer.close()
+        await proxy.close()
+        return data
+
+    assert asyncio.run(scenario()) == b""
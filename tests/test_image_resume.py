@@ -0,0 +1,90 @@
+"""图片断点续传：If-Range校验与临时文件清理"""
+
+import asyncio
+import os
+import time
+
+import httpx
+
+import server
+
+OLD = bytes(range(256)) * 400
+NEW = bytes(reversed(range(256))) * 400
+
+
+class BrokenStream(httpx.AsyncByteStream):
+    """发送一半数据后中断"""
+
+    def __init__(self, data):
+        self.data = data
+
+    async def __aiter__(self):
+        yield self.data[: len(self.data) // 2]
+        raise httpx.ReadError("connection reset")
+
+
+class FakeServer:
+    """第一次请求中断；之后按If-Range决定返回片段还是完整的当前版本"""
+
+    def __init__(self, changed_after_break=False, etag='"v1"'):
+        self.changed_after_break = changed_after_break
+        self.etag = etag
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(dict(request.headers))
+        headers = {"content-type": "image/png"}
+        if self.etag:
+            headers["etag"] = self.etag
+        if len(self.requests) == 1:
+            return httpx.Response(200, stream=BrokenStream(OLD), headers=headers)
+        data = OLD
+        if self.changed_after_break:
+            data = NEW
+            headers["etag"] = '"v2"'
+        range_header = request.headers.get("range")
+        if range_header and request.headers.get("if-range") == headers.get("etag"):
+            start = int(range_header.split("=")[1].rstrip("-"))
+            headers["content-range"] = f"bytes {start}-{len(data) - 1}/{len(data)}"
+            return httpx.Response(206, content=data[start:], headers=headers)
+        return httpx.Response(200, content=data, headers=headers)
+
+
+def download(monkeypatch, tmp_path, fake):
+    monkeypatch.setattr(server, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(fake)))
+    monkeypatch.setattr(server, "IMAGE_STORE_ENABLED", False)
+    result = asyncio.run(server.download_image("/core/api/resources/img/a.png", "cookie", tmp_path))
+    return (tmp_path / result).read_bytes()
+
+
+def test_resume_sends_stored_validator(monkeypatch, tmp_path):
+    fake = FakeServer()
+
+    assert download(monkeypatch, tmp_path, fake) == OLD
+    assert fake.requests[1]["range"] == f"bytes={len(OLD) // 2}-"
+    assert fake.requests[1]["if-range"] == '"v1"'
+    assert not [p for p in (tmp_path / "images").iterdir() if p.suffix in (".part", ".validator")]
+
+
+def test_changed_image_is_downloaded_again_instead_of_spliced(monkeypatch, tmp_path):
+    assert download(monkeypatch, tmp_path, FakeServer(changed_after_break=True)) == NEW
+
+
+def test_partial_without_validator_is_not_resumed(monkeypatch, tmp_path):
+    fake = FakeServer(etag=None)
+
+    assert download(monkeypatch, tmp_path, fake) == OLD
+    assert "range" not in fake.requests[1]
+
+
+def test_remove_stale_partials(tmp_path):
+    old = time.time() - 7200
+    for name in ("a.part", "a.validator", "b.part"):
+        (tmp_path / name).write_bytes(b"x")
+    for name in ("a.part", "a.validator"):
+        os.utime(tmp_path / name, (old, old))
+    (tmp_path / "c.png").write_bytes(b"x")
+    os.utime(tmp_path / "c.png", (old, old))
+
+    assert server._remove_stale_partials(tmp_path, max_age=3600) == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["b.part", "c.png"]
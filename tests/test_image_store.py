@@ -0,0 +1,38 @@
+"""全局图片存储：未引用blob的清理"""
+
+import asyncio
+import shutil
+
+import server
+
+
+def make_store(tmp_path, *blobs):
+    store = server.ImageStore(tmp_path / "store")
+    store.objects_dir.mkdir(parents=True)
+    for blob in blobs:
+        (store.objects_dir / blob).write_bytes(blob.encode())
+    return store
+
+
+def test_gc_removes_blobs_without_live_links(tmp_path):
+    store = make_store(tmp_path, "a.png", "b.png", "orphan.png")
+
+    async def scenario():
+        await store.link_into("a.png", tmp_path / "doc1" / "images")
+        await store.link_into("b.png", tmp_path / "doc2" / "images")
+        shutil.rmtree(tmp_path / "doc2")
+        return await store.gc(grace_seconds=0)
+
+    summary = asyncio.run(scenario())
+
+    assert summary == {"removed_blobs": 2, "removed_bytes": 15, "dropped_refs": 1, "referenced_blobs": 1}
+    assert sorted(p.name for p in store.objects_dir.iterdir()) == ["a.png"]
+
+
+def test_gc_keeps_recent_blobs(tmp_path):
+    store = make_store(tmp_path, "new.png")
+
+    summary = asyncio.run(store.gc(grace_seconds=3600))
+
+    assert summary["removed_blobs"] == 0
+    assert (store.objects_dir / "new.png").exists()
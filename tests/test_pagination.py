@@ -0,0 +1,164 @@
+"""分页输出：块预算切分、分页游标与PageCache的TTL/容量淘汰"""
+
+import asyncio
+
+import pytest
+
+import server
+
+
+def make_entry(blocks, node_id="ABC", cookie="c=1", max_bytes=None, max_blocks=None):
+    return server.new_rendered_pages(node_id, "My Doc", cookie, "markdown", "remote", blocks, max_bytes, max_blocks)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def page_cache(monkeypatch):
+    cache = server.PageCache(ttl=60, max_bytes=1000)
+    monkeypatch.setattr(server, "_page_cache", cache)
+    return cache
+
+
+@pytest.mark.parametrize("start, max_bytes, max_blocks, expected", [
+    (0, None, None, 4),
+    (0, 30, None, 3),
+    (0, 29, None, 2),
+    (0, None, 2, 2),
+    (1, 25, 3, 3),
+    (3, 10, None, 4),
+    (4, 10, None, 4),
+])
+def test_paginate_blocks(start, max_bytes, max_blocks, expected):
+    assert server.paginate_blocks([10, 10, 10, 10], start, max_bytes, max_blocks) == expected
+
+
+def test_paginate_blocks_returns_oversized_block_alone():
+    assert server.paginate_blocks([5, 100, 5], 0, 50, None) == 1
+    assert server.paginate_blocks([5, 100, 5], 1, 50, None) == 2
+
+
+def test_page_cursor_round_trip():
+    token = "a.b_c-d"
+    assert server.decode_page_cursor(server.encode_page_cursor(token, 17)) == (token, 17)
+
+
+@pytest.mark.parametrize("cursor", ["", "abc", "abc.", ".3", "abc.-1", "abc.x"])
+def test_decode_page_cursor_rejects_invalid(cursor):
+    with pytest.raises(server.McpError) as exc_info:
+        server.decode_page_cursor(cursor)
+    assert exc_info.value.error.code == server.INVALID_PARAMS
+
+
+def test_page_reads_blocks_with_entry_budget(page_cache):
+    entry = make_entry(["aa", "bb", "cc", "dd"], max_blocks=3)
+    page = page_cache.page(entry, 0)
+    assert (page.text, page.start, page.end, page.total, page.size) == ("aabbcc", 0, 3, 4, 6)
+    assert page_cache.page(entry, 3).text == "dd"
+
+
+def test_lookup_checks_document_owner_and_range(page_cache):
+    token = page_cache.put(make_entry(["a", "b", "c"]))
+
+    _, entry, start = server.lookup_rendered_pages(server.encode_page_cursor(token, 1), "ABC", "c=1")
+    assert (entry.blocks, start) == (["a", "b", "c"], 1)
+
+    for cursor, node_id, cookie in [
+        (server.encode_page_cursor(token, 1), "OTHER", "c=1"),
+        (server.encode_page_cursor(token, 1), "ABC", "c=2"),
+        (server.encode_page_cursor(token, 3), "ABC", "c=1"),
+        (server.encode_page_cursor("missing", 1), "ABC", "c=1"),
+    ]:
+        with pytest.raises(server.McpError) as exc_info:
+            server.lookup_rendered_pages(cursor, node_id, cookie)
+        assert exc_info.value.error.code == server.INVALID_PARAMS
+
+
+def test_page_cache_expires_after_ttl(clock):
+    cache = server.PageCache(ttl=60, max_bytes=1000, clock=clock)
+    token = cache.put(make_entry(["abc"]))
+
+    clock.now += 60
+    assert cache.get(token) is not None
+    clock.now += 1
+    assert cache.get(token) is None
+    assert cache.snapshot()["expired"] == 1
+    assert cache.snapshot()["bytes"] == 0
+
+
+def test_page_cache_evicts_least_recently_used(clock):
+    cache = server.PageCache(ttl=60, max_bytes=10, clock=clock)
+    first = cache.put(make_entry(["aaaa"]))
+    second = cache.put(make_entry(["bbbb"]))
+    assert cache.get(first) is not None
+
+    third = cache.put(make_entry(["cccc"]))
+
+    assert cache.get(second) is None
+    assert cache.get(first) is not None and cache.get(third) is not None
+    assert cache.snapshot()["evictions"] == 1
+    assert cache.snapshot()["bytes"] == 8
+
+
+def test_page_cache_rejects_entry_larger_than_capacity():
+    cache = server.PageCache(ttl=60, max_bytes=10)
+    assert cache.put(make_entry(["x" * 11])) is None
+    assert cache.snapshot()["entries"] == 0
+
+
+def test_format_page_response_caches_only_when_more_pages(page_cache):
+    single = server.format_page_response(make_entry(["a", "b"]), 0)
+    assert "下一页游标: 无" in single
+    assert page_cache.snapshot()["entries"] == 0
+
+    response = server.format_page_response(make_entry(["a", "b"], max_blocks=1), 0)
+    cursor = response.split("下一页游标: ", 1)[1].split("\n", 1)[0]
+    _, entry, start = server.lookup_rendered_pages(cursor, "ABC", "c=1")
+    assert start == 1
+    assert "下一页游标: 无" in server.format_page_response(entry, start)
+
+
+def test_follow_up_page_rejects_changed_params():
+    entry = make_entry(["a", "b"], max_bytes=100)
+
+    server.check_page_params(entry, {})
+    server.check_page_params(entry, {"cursor": "t.1", "format": "markdown", "max_bytes": 100, "max_blocks": None})
+    for params in ({"format": "html"}, {"max_bytes": 50}, {"max_blocks": 3}, {"image_mode": "proxy"}):
+        with pytest.raises(server.McpError) as exc_info:
+            server.check_page_params(entry, params)
+        assert exc_info.value.error.code == server.INVALID_PARAMS
+
+
+def test_output_blocks_use_render_cache(monkeypatch):
+    cache = server.RenderCache()
+    monkeypatch.setattr(server, "_render_cache", cache)
+    content = {"main": "m", "parts": {"m": {"data": {"body": ["root", {}, ["p", {}, "一"], ["p", {}, "二"]]}}}}
+    calls = []
+    original = server.generate_output_blocks
+
+    def counting(*args):
+        calls.append(args)
+        return original(*args)
+
+    monkeypatch.setattr(server, "generate_output_blocks", counting)
+
+    async def render():
+        return await server.render_output_blocks_async(content, "Doc", None, 0, "markdown", "DK@v1")
+
+    first = asyncio.run(render())
+    second = asyncio.run(render())
+
+    assert first == second == ["# Doc\n\n一", "\n\n二"]
+    assert len(calls) == 1
+    assert cache.snapshot()["hits"] == 1
@@ -0,0 +1,29 @@
+"""渲染结果缓存：磁盘层"""
+
+import asyncio
+
+import server
+
+
+def test_disk_tier_is_read_through_writer_pool(tmp_path, monkeypatch):
+    writer_cache = server.RenderCache(disk_dir=tmp_path)
+    writer_cache._write_disk("k1", "<p>缓存</p>")
+    cache = server.RenderCache(disk_dir=tmp_path)
+    threads = []
+    original = cache._read_disk
+
+    def recording(key):
+        threads.append(server.threading.get_ident())
+        return original(key)
+
+    monkeypatch.setattr(cache, "_read_disk", recording)
+
+    async def lookup():
+        return await cache.get_async("k1"), await cache.get_async("k1"), await cache.get_async("missing")
+
+    first, second, missing = asyncio.run(lookup())
+
+    assert first == second == "<p>缓存</p>"
+    assert missing is None
+    assert server.threading.get_ident() not in threads
+    assert {k: cache.snapshot()[k] for k in ("hits", "disk_hits", "misses")} == {"hits": 1, "disk_hits": 1, "misses": 1}
@@ -0,0 +1,79 @@
+"""文档大纲、章节切分与各输出格式中的标题"""
+
+import pytest
+
+import server
+
+
+def span(text, **attrs):
+    return ["span", attrs, text]
+
+
+CONTENT = {
+    "main": "m",
+    "parts": {"m": {"data": {"body": [
+        "root", {},
+        ["h1", {}, span("概述")],
+        ["p", {}, span("开头")],
+        ["h2", {}, span("背景")],
+        ["p", {}, span("背景正文")],
+        ["h3", {}, span("细节", bold=True)],
+        ["p", {}, span("细节正文")],
+        ["h2", {}, span("目标")],
+        ["h1", {}, span("附录")],
+        ["h2", {}, span("  ")],
+    ]}}},
+}
+
+
+def test_outline_section_ranges():
+    outline = server.build_document_outline(CONTENT)
+
+    assert outline["blocks"] == 9
+    assert [(h["level"], h["text"], h["index"], h["end"]) for h in outline["headings"]] == [
+        (1, "概述", 0, 7),
+        (2, "背景", 2, 6),
+        (3, "细节", 4, 6),
+        (2, "目标", 6, 7),
+        (1, "附录", 7, 9),
+        (2, "", 8, 9),
+    ]
+
+
+def test_resolve_section_by_heading_and_range():
+    outline = server.build_document_outline(CONTENT)
+
+    assert server.resolve_section_range(outline, "背景", None, None)[:2] == (2, 6)
+    assert server.resolve_section_range(outline, None, 3, 5)[:2] == (3, 5)
+    with pytest.raises(server.McpError):
+        server.resolve_section_range(outline, "不存在", None, None)
+    with pytest.raises(server.McpError):
+        server.resolve_section_range(outline, None, 5, 3)
+
+
+def test_section_keeps_sub_headings_in_every_format():
+    section = server.slice_document_content(CONTENT, 2, 6)
+
+    html = server.generate_html_from_content(section, "Doc")
+    body = html.split('<div class="content">', 1)[1]
+    assert "<h2>背景</h2>" in body
+    assert '<h3><span style="font-weight: bold">细节</span></h3>' in body
+    assert "概述" not in body and "目标" not in body
+
+    assert server.generate_markdown_from_content(section, "Doc") == (
+        "# Doc\n\n## 背景\n\n背景正文\n\n### **细节**\n\n细节正文"
+    )
+    assert server.generate_text_from_content(section, "Doc") == "Doc\n\n背景\n\n背景正文\n\n细节\n\n细节正文"
+
+
+def test_empty_headings_are_skipped():
+    section = server.slice_document_content(CONTENT, 7, 9)
+
+    assert server.generate_markdown_from_content(section, "Doc") == "# Doc\n\n# 附录"
+    html = server.generate_html_from_content(section, "Doc")
+    assert "<h2>" not in html.split('<div class="content">', 1)[1]
+
+
+def test_streamed_html_matches_full_render():
+    full = server.generate_html_from_content(CONTENT, "Doc")
+    assert "".join(server.iter_html_from_content(CONTENT, "Doc")) == full
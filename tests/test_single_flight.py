@@ -0,0 +1,87 @@
+"""并发请求合并（single-flight）"""
+
+import asyncio
+
+import pytest
+
+import server
+
+
+def test_concurrent_callers_share_one_execution():
+    flight = server.SingleFlight("test")
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("k", operation) for _ in range(5)))
+
+    assert asyncio.run(scenario()) == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.snapshot() == {"in_flight": 0, "executed": 1, "shared": 4}
+
+
+def test_different_keys_and_later_calls_run_separately():
+    flight = server.SingleFlight("test")
+    calls = []
+
+    async def operation():
+        calls.append(1)
+        return len(calls)
+
+    async def scenario():
+        together = await asyncio.gather(flight.do("a", operation), flight.do("b", operation))
+        later = await flight.do("a", operation)
+        return together, later
+
+    together, later = asyncio.run(scenario())
+
+    assert sorted(together) == [1, 2] and later == 3
+    assert flight.snapshot()["executed"] == 3
+
+
+def test_errors_are_shared_and_not_cached():
+    flight = server.SingleFlight("test")
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def scenario():
+        results = await asyncio.gather(flight.do("k", failing), flight.do("k", failing), return_exceptions=True)
+        with pytest.raises(ValueError):
+            await flight.do("k", failing)
+        return results
+
+    results = asyncio.run(scenario())
+
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(attempts) == 2
+
+
+def test_cancelled_caller_does_not_cancel_shared_task():
+    flight = server.SingleFlight("test")
+    release = None
+
+    async def operation():
+        await release.wait()
+        return "done"
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        first = asyncio.ensure_future(flight.do("k", operation))
+        second = asyncio.ensure_future(flight.do("k", operation))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await second, first.cancelled()
+
+    assert asyncio.run(scenario()) == ("done", True)
+    assert flight.snapshot()["in_flight"] == 0